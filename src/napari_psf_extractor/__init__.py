@@ -1,7 +1,14 @@
 __version__ = "1.0.0"
 
-from .widget import MainWidget
-
 __all__ = (
-    MainWidget,
+    "MainWidget",
 )
+
+
+def __getattr__(name):
+    # Import the widget (and with it napari and Qt) only when it is requested
+    if name == "MainWidget":
+        from .widget import MainWidget
+        return MainWidget
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
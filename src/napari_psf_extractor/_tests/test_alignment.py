@@ -0,0 +1,134 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from ..alignment import (
+    align_psf, align_psf_stack, align_psfs_fourier, align_psfs_progressive, align_spectrum_stack, normalize_psf,
+    upsample_spectrum
+)
+
+
+def make_psfs(n, noise=0, seed=0):
+    rng = np.random.default_rng(seed)
+    z, y, x = np.mgrid[:15, :11, :11]
+    centroids = np.array([7, 5, 5]) + rng.uniform(-1, 1, size=(n, 3))
+    psfs = np.array([
+        np.exp(-((z - cz) ** 2 / 8 + (y - cy) ** 2 / 2 + (x - cx) ** 2 / 2))
+        for cz, cy, cx in centroids
+    ])
+    psfs += noise * rng.random(psfs.shape)
+
+    return psfs, pd.DataFrame(centroids, columns=['z0', 'y0', 'x0'])
+
+
+class TestAlignment(unittest.TestCase):
+    def test_align_psf_centers_peak(self):
+        # Given
+        psf = np.zeros((5, 5, 5))
+        psf[1, 3, 2] = 1
+
+        # When
+        aligned = align_psf(psf, centroid=(1.25, 3.25, 2.25), usf=2)
+
+        # Then
+        self.assertEqual((10, 10, 10), aligned.shape)
+        self.assertEqual(1, aligned[5, 5, 5])
+
+    def test_align_psf_stack_matches_single(self):
+        # Given
+        rng = np.random.default_rng(0)
+        psfs = rng.random((3, 4, 5, 6))
+        locations = pd.DataFrame({
+            'x0': [2.5, 3.0, 2.0],
+            'y0': [2.0, 2.5, 1.5],
+            'z0': [1.5, 2.0, 1.0],
+        })
+
+        # When
+        volumes = align_psf_stack(psfs, locations, usf=3, dtype=np.float64)
+
+        # Then
+        self.assertEqual((3, 12, 15, 18), volumes.shape)
+        for i in range(3):
+            expected = align_psf(psfs[i], locations.loc[i, ['z0', 'y0', 'x0']], usf=3)
+            self.assertTrue(np.array_equal(expected, volumes[i]))
+
+    def test_normalize_psf(self):
+        # Given
+        psf_sum = np.array([2., 4., 6.])
+
+        # When
+        psf = normalize_psf(psf_sum)
+
+        # Then
+        self.assertTrue(np.array_equal(np.array([0, 0.5, 1]), psf))
+
+    def test_align_psfs_fourier_matches_upsampling(self):
+        # Given
+        psfs, locations = make_psfs(20)
+
+        # When
+        expected = normalize_psf(align_psf_stack(psfs, locations, usf=3, dtype=np.float64).sum(axis=0))
+        psf = align_psfs_fourier(psfs, locations, usf=3)
+
+        # Then
+        self.assertEqual(expected.shape, psf.shape)
+        self.assertEqual(np.argmax(expected), np.argmax(psf))
+        self.assertGreater(np.corrcoef(expected.ravel(), psf.ravel())[0, 1], 0.99)
+
+    def test_align_spectrum_stack_matches_fourier(self):
+        # Given
+        psfs, locations = make_psfs(5)
+
+        # When
+        spectra = align_spectrum_stack(psfs, locations, usf=2, dtype=np.complex128)
+        psf = upsample_spectrum(spectra.sum(axis=0), psfs.shape[1:], usf=2)
+
+        # Then
+        self.assertEqual((5, 15, 11, 6), spectra.shape)
+        self.assertTrue(np.allclose(align_psfs_fourier(psfs, locations, usf=2), psf))
+
+    def test_align_psfs_progressive_without_tol_matches_full(self):
+        # Given
+        psfs, locations = make_psfs(20)
+
+        for engine, expected in [
+            ('fourier', align_psfs_fourier(psfs, locations, usf=2)),
+            ('upsample', normalize_psf(align_psf_stack(psfs, locations, usf=2, dtype=np.float64).sum(axis=0))),
+        ]:
+            # When
+            states = list(align_psfs_progressive(psfs, locations, usf=2, tol=None, step=8, engine=engine))
+
+            # Then
+            self.assertEqual([n for _, n, _ in states], [8, 16, 20])
+            self.assertTrue(np.allclose(states[-1][0], expected))
+
+    def test_align_psfs_progressive_stops_when_converged(self):
+        # Given
+        psfs, locations = make_psfs(400, noise=0.05)
+
+        # When
+        states = list(align_psfs_progressive(psfs, locations, usf=2, tol=5e-3, step=20, min_beads=40))
+
+        # Then
+        psf, n_beads, change = states[-1]
+        self.assertLess(n_beads, 400)
+        self.assertLess(change, 5e-3)
+        self.assertTrue(all(c >= 5e-3 for _, n, c in states[:-1]))
+
+        expected = align_psfs_fourier(psfs, locations, usf=2)
+        self.assertLess(np.linalg.norm(psf - expected) / np.linalg.norm(expected), 0.05)
+
+    def test_align_psfs_progressive_order(self):
+        # Given
+        psfs, locations = make_psfs(10)
+        order = np.arange(10)[::-1]
+
+        # When
+        psf, n_beads, _ = next(align_psfs_progressive(psfs, locations, usf=2, order=order, step=3))
+
+        # Then, the first step aligns the first beads in the given order
+        expected = align_psfs_fourier(psfs[7:], locations.iloc[7:], usf=2)
+        self.assertEqual(n_beads, 3)
+        self.assertTrue(np.allclose(psf, expected))
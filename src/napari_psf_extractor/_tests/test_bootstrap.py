@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from .test_alignment import make_psfs
+from ..alignment import align_psfs_fourier
+from ..bootstrap import bootstrap_fwhm
+from ..fitting import measure_fwhm
+
+
+class TestBootstrap(unittest.TestCase):
+    def test_bootstrap_fwhm(self):
+        # Given
+        psfs, locations = make_psfs(6, noise=0.05)
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch('tempfile.tempdir', tmp):
+            # When
+            result, samples = bootstrap_fwhm(psfs, locations, usf=2, psx=50, psy=50, psz=100,
+                                             n_resamples=8, max_workers=2, seed=0, return_samples=True)
+
+            # Then, the aligned volumes were only kept while bootstrapping
+            self.assertEqual([], os.listdir(tmp))
+
+        self.assertEqual((8, 3), samples.shape)
+        self.assertEqual(['x', 'y', 'z'], list(result.index))
+        self.assertTrue(np.all(result['ci_low'] <= result['ci_high']))
+        self.assertTrue(np.all((result['ci_low'] < result['fwhm'] * 1.1) & (result['fwhm'] * 0.9 < result['ci_high'])))
+
+    def test_bootstrap_fwhm_fourier(self):
+        # Given
+        psfs, locations = make_psfs(6, noise=0.05)
+
+        # When
+        result = bootstrap_fwhm(psfs, locations, usf=2, psx=50, psy=50, psz=100,
+                                n_resamples=8, max_workers=2, seed=0, engine='fourier')
+
+        # Then, the point estimate is that of the Fourier alignment
+        expected = measure_fwhm(align_psfs_fourier(psfs, locations, usf=2), 25, 25, 50)
+        self.assertTrue(np.allclose(expected, result['fwhm'], rtol=1e-3))
+        self.assertTrue(np.all(result['ci_low'] <= result['ci_high']))
+
+    def test_bootstrap_refuses_oversized_request(self):
+        # Given
+        psfs, locations = make_psfs(6)
+
+        # When / Then
+        with self.assertRaisesRegex(MemoryError, "bootstrap"):
+            bootstrap_fwhm(psfs, locations, usf=4, psx=50, psy=50, psz=100, max_workers=2, available=2**22)
+
+    def test_bootstrap_checks_disk_space(self):
+        # Given
+        psfs, locations = make_psfs(6)
+
+        with mock.patch('shutil.disk_usage', return_value=mock.Mock(free=1024)), \
+                mock.patch('tempfile.mkdtemp') as mkdtemp:
+            # When / Then
+            with self.assertRaisesRegex(OSError, "disk space"):
+                bootstrap_fwhm(psfs, locations, usf=2, psx=50, psy=50, psz=100, available=2**30)
+
+        mkdtemp.assert_not_called()
+
+    def test_bootstrap_needs_two_psfs(self):
+        # Given
+        psfs, locations = make_psfs(1)
+
+        # When / Then
+        with self.assertRaises(ValueError):
+            bootstrap_fwhm(psfs, locations, usf=2, psx=50, psy=50, psz=100)
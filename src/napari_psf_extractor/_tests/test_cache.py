@@ -0,0 +1,135 @@
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+from ..cache import StackCache, fingerprint, preprocess_stack
+
+
+class TestStackCache(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.layer = SimpleNamespace(name="beads", data=rng.integers(0, 255, (4, 8, 8), dtype=np.uint8))
+
+    def test_load_normalizes(self):
+        # When
+        stack, mip = StackCache(max_bytes=2**20).load(self.layer)
+
+        # Then
+        self.assertEqual(0, stack.min())
+        self.assertEqual(1, stack.max())
+        self.assertTrue(np.array_equal(np.max(stack, axis=0), mip))
+
+    def test_load_hit_survives_rename(self):
+        # Given
+        cache = StackCache(max_bytes=2**20)
+        stack, _ = cache.load(self.layer)
+
+        # When
+        self.layer.name = "renamed"
+        stack_again, _ = cache.load(self.layer)
+
+        # Then
+        self.assertIs(stack, stack_again)
+
+    def test_load_misses_on_new_data(self):
+        # Given
+        cache = StackCache(max_bytes=2**20)
+        stack, _ = cache.load(self.layer)
+
+        # When
+        self.layer.data = self.layer.data.copy()
+        self.layer.data[0, 0, 0] += 1
+        stack_new, _ = cache.load(self.layer)
+
+        # Then
+        self.assertIsNot(stack, stack_new)
+
+    def test_invalidate_after_in_place_change(self):
+        # Given
+        cache = StackCache(max_bytes=2**20)
+        stack, _ = cache.load(self.layer)
+
+        # When
+        self.layer.data[0, 0, 0] += 1
+        cache.invalidate(self.layer)
+        stack_new, _ = cache.load(self.layer)
+
+        # Then
+        self.assertIsNot(stack, stack_new)
+        self.assertEqual(1, len(cache))
+
+    def test_invalidate_does_not_wait_for_load(self):
+        # Given a load stuck preprocessing
+        cache = StackCache(max_bytes=2**20)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_preprocess(data):
+            started.set()
+            release.wait(5)
+            return preprocess_stack(data)
+
+        with mock.patch('napari_psf_extractor.cache.preprocess_stack', side_effect=slow_preprocess):
+            thread = threading.Thread(target=cache.load, args=(self.layer,))
+            thread.start()
+            started.wait(5)
+
+            # When
+            invalidated = threading.Thread(target=cache.invalidate, args=(self.layer,))
+            invalidated.start()
+            invalidated.join(1)
+            stuck = invalidated.is_alive()
+
+            release.set()
+            thread.join()
+
+        # Then, the stack of the invalidated data is not cached
+        self.assertFalse(stuck)
+        self.assertEqual(0, len(cache))
+
+    def test_evicts_least_recently_used(self):
+        # Given
+        layers = [SimpleNamespace(data=np.full((4, 8, 8), i, dtype=np.uint8)) for i in range(3)]
+        entry_bytes = 4 * 8 * 8 * 8 + 8 * 8 * 8
+        cache = StackCache(max_bytes=2 * entry_bytes)
+
+        # When
+        cache.load(layers[0])
+        cache.load(layers[1])
+        cache.load(layers[0])
+        cache.load(layers[2])
+
+        # Then
+        self.assertEqual(2, len(cache))
+        self.assertIn(cache.key(layers[0]), cache.entries)
+        self.assertNotIn(cache.key(layers[1]), cache.entries)
+
+    def test_fingerprint(self):
+        # Given
+        data = np.arange(10, dtype=np.uint16)
+
+        # Then
+        self.assertEqual(fingerprint(data), fingerprint(data.copy()))
+        self.assertNotEqual(fingerprint(data), fingerprint(data[::-1]))
+
+    def test_fingerprint_reads_slabs(self):
+        # Given a lazy array that records the planes it is asked for
+        data = np.arange(6 * 4 * 4, dtype=np.uint16).reshape(6, 4, 4)
+        requested = []
+
+        class LazyArray:
+            shape, dtype = data.shape, data.dtype
+
+            def __getitem__(self, key):
+                requested.append(len(data[key]))
+                return data[key]
+
+        # When
+        with mock.patch('napari_psf_extractor.cache.FINGERPRINT_CHUNK_BYTES', 2 * 4 * 4 * 2):
+            result = fingerprint(LazyArray())
+
+        # Then, it is hashed two planes at a time, as if it was loaded
+        self.assertEqual([2, 2, 2], requested)
+        self.assertEqual(fingerprint(data), result)
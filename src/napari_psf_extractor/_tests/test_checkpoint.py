@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from ..checkpoint import CheckpointStore, params_hash
+
+
+class TestCheckpointStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = CheckpointStore(root=self.tmp.name, chunk_size=4)
+        self.params = {'dx': 5, 'mass': [1.0, 2.0], 'pcc_min': None}
+
+        rng = np.random.default_rng(0)
+        self.psfs = rng.random((10, 3, 4, 5)).astype(np.float32)
+        self.features = pd.DataFrame({'x': rng.random(10), 'y': rng.random(10)}, index=np.arange(10) + 100)
+        self.features['frame'] = np.arange(10)
+        self.features['name'] = [f"bead {i}" for i in range(10)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        # When
+        self.store.save('stack', 'psfs', self.params, {'psfs': self.psfs, 'features': self.features, 'none': None})
+        outputs = self.store.load('stack', 'psfs', dict(reversed(list(self.params.items()))))
+
+        # Then
+        self.assertTrue(np.array_equal(outputs['psfs'], self.psfs))
+        self.assertTrue(outputs['features'].equals(self.features))
+        self.assertIsNone(outputs['none'])
+
+        # PSFs are written in chunks, and reassembled in a file
+        files = os.listdir(self.store.path('stack', 'psfs', self.params))
+        self.assertEqual(len([f for f in files if f.startswith('psfs_')]), 3)
+        self.assertIsInstance(outputs['psfs'], np.memmap)
+
+        # Nothing is pickled
+        self.assertFalse([f for f in files if f.endswith('.pkl')])
+
+    def test_load_missing(self):
+        # Given
+        self.store.save('stack', 'psfs', self.params, {'psfs': self.psfs})
+
+        # Then
+        self.assertIsNone(self.store.load('stack', 'psfs', dict(self.params, dx=7)))
+        self.assertIsNone(self.store.load('other', 'psfs', self.params))
+        self.assertIsNone(self.store.load('stack', 'psf_sum', self.params))
+
+    def test_load_incomplete(self):
+        # Given
+        self.store.save('stack', 'psfs', self.params, {'psfs': self.psfs})
+        path = self.store.path('stack', 'psfs', self.params)
+
+        # When
+        os.remove(os.path.join(path, 'psfs_00002.npy'))
+
+        # Then
+        self.assertIsNone(self.store.load('stack', 'psfs', self.params))
+
+    def test_failed_save_leaves_no_checkpoint(self):
+        # When
+        with self.assertRaises(TypeError):
+            self.store.save('stack', 'psfs', self.params, {'psfs': self.psfs, 'bad': object()})
+
+        # Then
+        self.assertEqual(os.listdir(os.path.join(self.tmp.name, 'stack')), [])
+
+    def test_refuses_objects(self):
+        # Given
+        features = self.features.assign(bad=[object()] * 10)
+
+        # When / Then
+        with self.assertRaises(TypeError):
+            self.store.save('stack', 'features', self.params, {'features': features})
+
+    def test_params_hash(self):
+        self.assertEqual(params_hash({'a': np.int64(1), 'b': 2.0}), params_hash({'b': 2.0, 'a': 1}))
+        self.assertNotEqual(params_hash({'a': 1}), params_hash({'a': 2}))
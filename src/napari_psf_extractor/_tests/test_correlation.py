@@ -0,0 +1,70 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from ..correlation import batch_pcc, mean_psf
+from ..extractor import filter_pcc
+
+
+class TestCorrelation(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.psfs = rng.random((50, 5, 6, 7))
+        self.reference = rng.random((5, 6, 7))
+
+    def test_batch_pcc_matches_corrcoef(self):
+        # When
+        pccs = batch_pcc(self.psfs, reference=self.reference, dtype=np.float64, chunk_size=8)
+
+        # Then
+        expected = [np.corrcoef(psf.ravel(), self.reference.ravel())[0, 1] for psf in self.psfs]
+        self.assertTrue(np.allclose(expected, pccs))
+
+    def test_batch_pcc_float32(self):
+        # When
+        pccs_64 = batch_pcc(self.psfs, reference=self.reference, dtype=np.float64)
+        pccs_32 = batch_pcc(self.psfs, reference=self.reference, dtype=np.float32)
+
+        # Then
+        self.assertTrue(np.allclose(pccs_64, pccs_32, atol=1e-5))
+
+    def test_batch_pcc_default_reference(self):
+        # When
+        pccs = batch_pcc(self.psfs, dtype=np.float64)
+
+        # Then
+        expected = batch_pcc(self.psfs, reference=self.psfs.mean(axis=0), dtype=np.float64)
+        self.assertTrue(np.allclose(expected, pccs))
+        self.assertTrue(np.allclose(self.psfs.mean(axis=0), mean_psf(self.psfs, chunk_size=7)))
+
+    def test_batch_pcc_constant_psf(self):
+        # Given
+        psfs = np.ones((2, 3, 3, 3))
+
+        # When
+        pccs = batch_pcc(psfs, reference=self.reference[:3, :3, :3])
+
+        # Then
+        self.assertTrue(np.array_equal([0, 0], pccs))
+
+
+class TestFilterPCC(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.psfs = rng.random((4, 3, 3, 3))
+        self.features = pd.DataFrame({'x': np.arange(4.0)}, index=[10, 11, 12, 13])
+
+    def test_outliers_are_dropped_by_position(self):
+        # Given
+        psfe = mock.Mock()
+        psfe.detect_outlier_psfs.return_value = ([1, 3], np.zeros(4))
+
+        # When
+        with mock.patch('napari_psf_extractor.extractor.psfe', psfe):
+            features_pearson = filter_pcc(0.7, self.features, self.psfs)
+
+        # Then, outliers are dropped by position
+        psfe.detect_outlier_psfs.assert_called_once_with(self.psfs, pcc_min=0.7, return_pccs=True)
+        self.assertEqual([10, 12], list(features_pearson.index))
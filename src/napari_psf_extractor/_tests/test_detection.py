@@ -0,0 +1,73 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from ..detection import z_chunks, locate_3d, axial_window, extract_windows
+
+
+def make_beads(shape, centers, sigma=(2.0, 1.0, 1.0)):
+    zz, yy, xx = np.indices(shape, dtype=float)
+    stack = np.zeros(shape, dtype=np.float32)
+
+    for z, y, x in centers:
+        stack += np.exp(-((zz - z) ** 2 / (2 * sigma[0] ** 2)
+                          + (yy - y) ** 2 / (2 * sigma[1] ** 2)
+                          + (xx - x) ** 2 / (2 * sigma[2] ** 2)))
+
+    return stack
+
+
+class TestDetection(unittest.TestCase):
+    def test_z_chunks_cover_every_slice_once(self):
+        # When
+        chunks = z_chunks(50, 12, 5)
+
+        # Then
+        owned = np.concatenate([np.arange(own_start, own_stop) for _, _, own_start, own_stop in chunks])
+        self.assertTrue(np.array_equal(owned, np.arange(50)))
+
+        for start, stop, own_start, own_stop in chunks:
+            self.assertEqual(start, max(own_start - 5, 0))
+            self.assertEqual(stop, min(own_stop + 5, 50))
+
+    def test_locate_3d_finds_beads_across_chunk_boundaries(self):
+        # Given
+        centers = [(z, y, x) for z in (10, 20, 27, 40) for y, x in ((10, 10), (10, 30), (30, 20))]
+        stack = make_beads((50, 40, 40), centers)
+
+        # When
+        features = locate_3d(stack, diameter=(9, 5, 5), chunk_size=10, overlap=9, max_workers=2)
+
+        # Then
+        self.assertEqual(len(features), len(centers))
+
+        found = np.sort(np.round(features[['z', 'y', 'x']].to_numpy()).astype(int), axis=0)
+        self.assertTrue(np.array_equal(found, np.sort(np.array(centers), axis=0)))
+
+    def test_extract_windows(self):
+        # Given
+        stack = np.arange(20 * 30 * 30, dtype=np.float32).reshape(20, 30, 30)
+        features = pd.DataFrame({'z': [10.2, 1.0], 'y': [15.0, 15.0], 'x': [14.6, 15.0]}, index=[7, 8])
+
+        # When
+        psfs, extracted = extract_windows(stack, features, (5, 7, 7))
+
+        # Then, the window that does not fit in z is skipped
+        self.assertEqual(psfs.shape, (1, 5, 7, 7))
+        self.assertEqual(list(extracted.index), [7])
+        self.assertEqual(psfs[0, 2, 3, 3], stack[10, 15, 15])
+
+    def test_axial_window_follows_bead_extent(self):
+        # Given beads with an axial FWHM of about 2.355 * 3 = 7 px
+        centers = [(20, 10, 10), (25, 10, 30), (30, 30, 20)]
+        stack = make_beads((60, 40, 40), centers, sigma=(3.0, 1.0, 1.0))
+        features = pd.DataFrame(centers, columns=['z', 'y', 'x'])
+
+        # When
+        wz = axial_window(stack, features, min_wz=5, max_wz=61)
+
+        # Then, three FWHMs, odd
+        self.assertEqual(21, wz)
+        self.assertEqual(15, axial_window(stack, features, min_wz=5, max_wz=15))
+        self.assertEqual(61, axial_window(stack, features.iloc[:0], min_wz=5, max_wz=61))
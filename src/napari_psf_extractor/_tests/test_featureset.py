@@ -0,0 +1,96 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from ..featureset import FeatureSet, overlap_mask, edge_mask
+
+
+class TestFeatureSet(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.features = pd.DataFrame({
+            'x': rng.uniform(0, 100, 200),
+            'y': rng.uniform(0, 80, 200),
+            'raw_mass': rng.uniform(0, 50, 200),
+        }, index=np.arange(200) + 1000)
+
+    def test_mass_mask(self):
+        # Given
+        feature_set = FeatureSet.from_dataframe(self.features)
+
+        # When
+        mask = feature_set.mass_mask(10, 30)
+
+        # Then
+        expected = (self.features['raw_mass'] > 10) & (self.features['raw_mass'] < 30)
+        self.assertTrue(np.array_equal(expected.to_numpy(), mask))
+
+    def test_threshold_mask_combines_columns(self):
+        # Given
+        feature_set = FeatureSet.from_dataframe(self.features)
+        measured = self.features.index[::2]
+        snr = np.linspace(0, 20, len(measured))
+        ellipticity = np.linspace(0.5, 0, len(measured))
+        feature_set.set_columns({'snr': snr, 'ellipticity': ellipticity}, ids=measured[::-1])
+
+        # When
+        mask = feature_set.threshold_mask(snr=(5, None), ellipticity=(None, 0.3))
+
+        # Then
+        expected = np.zeros(len(self.features), dtype=bool)
+        expected[::2] = (snr[::-1] >= 5) & (ellipticity[::-1] <= 0.3)
+        self.assertTrue(np.array_equal(expected, mask))
+
+    def test_positions_of_unknown_ids(self):
+        # Given
+        feature_set = FeatureSet.from_dataframe(self.features)
+
+        # When
+        positions = feature_set.positions([1005, 7, 1199])
+
+        # Then
+        self.assertTrue(np.array_equal([5, -1, 199], positions))
+        with self.assertRaises(ValueError):
+            feature_set.set_columns({'snr': [1.0]}, ids=[7])
+
+    def test_to_dataframe_composes_masks(self):
+        # Given
+        feature_set = FeatureSet.from_dataframe(self.features)
+        feature_set.set_mask('mass', feature_set.mass_mask(10, 30))
+        feature_set.set_mask('left', feature_set.x < 50)
+
+        # When
+        selected = feature_set.to_dataframe(feature_set.mask('mass', 'left'))
+
+        # Then
+        expected = self.features[(self.features['raw_mass'] > 10)
+                                 & (self.features['raw_mass'] < 30)
+                                 & (self.features['x'] < 50)]
+        pd.testing.assert_frame_equal(expected, selected)
+
+    def test_overlap_mask_matches_pairwise(self):
+        # Given
+        x, y = self.features['x'].to_numpy(), self.features['y'].to_numpy()
+        candidates = self.features['raw_mass'].to_numpy() > 20
+        wx, wy = 7, 5
+
+        # When
+        mask = overlap_mask(x, y, wx, wy, candidates=candidates)
+
+        # Then
+        close = (np.abs(x[:, None] - x[None, :]) <= wx) & (np.abs(y[:, None] - y[None, :]) <= wy)
+        close &= candidates[:, None] & candidates[None, :]
+        np.fill_diagonal(close, False)
+        self.assertTrue(np.array_equal(close.any(axis=1), mask))
+
+    def test_edge_mask(self):
+        # Given
+        x = np.array([1., 50., 98., 50.])
+        y = np.array([40., 40., 40., 79.])
+
+        # When
+        mask = edge_mask(x, y, dx=100, dy=80, wx=6, wy=6)
+
+        # Then
+        self.assertTrue(np.array_equal([True, False, True, True], mask))
@@ -0,0 +1,44 @@
+import re
+import subprocess
+import sys
+import unittest
+
+# Modules that must only be imported on first use
+HEAVY_MODULES = ('cv2', 'trackpy', 'psf_extractor', 'pandas', 'matplotlib.pyplot', 'scipy.fft')
+
+# Cumulative import time budget of the package itself [s]
+IMPORT_TIME_BUDGET = 0.1
+
+
+def run_python(code, *args):
+    return subprocess.run(
+        [sys.executable, *args, '-c', code],
+        capture_output=True, text=True, check=True
+    )
+
+
+class TestImport(unittest.TestCase):
+    def test_no_heavy_imports(self):
+        # Given
+        code = (
+            "import sys\n"
+            "import napari_psf_extractor\n"
+            "import napari_psf_extractor.extractor, napari_psf_extractor.plotting\n"
+            "import napari_psf_extractor.bootstrap, napari_psf_extractor.memory\n"
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        )
+
+        # When
+        loaded = run_python(code).stdout.strip()
+
+        # Then
+        self.assertEqual("", loaded)
+
+    def test_import_time(self):
+        # When
+        stderr = run_python("import napari_psf_extractor", "-X", "importtime").stderr
+
+        # Then
+        match = re.search(r"\|\s*(\d+)\s*\|\s*napari_psf_extractor\s*$", stderr, re.MULTILINE)
+        self.assertIsNotNone(match)
+        self.assertLess(int(match.group(1)) * 1e-6, IMPORT_TIME_BUDGET)
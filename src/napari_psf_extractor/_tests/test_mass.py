@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from ..mass import MassIndex
+
+
+class TestMassIndex(unittest.TestCase):
+    def setUp(self):
+        self.features = pd.DataFrame({
+            'x': [1., 2., 3., 4., 5.],
+            'y': [5., 4., 3., 2., 1.],
+            'raw_mass': [30., 10., 50., 20., 40.],
+        }, index=[10, 11, 12, 13, 14])
+        self.index = MassIndex.from_features(self.features, bins=4)
+
+    def test_count_matches_mask(self):
+        for min_mass, max_mass in [(0, 100), (10, 40), (15, 45), (50, 60), (40, 10)]:
+            # Given
+            mask = (self.features['raw_mass'] > min_mass) & (self.features['raw_mass'] < max_mass)
+
+            # When
+            count = self.index.count(min_mass, max_mass)
+
+            # Then
+            self.assertEqual(mask.sum(), count)
+
+    def test_select_keeps_feature_order(self):
+        # When
+        selected = self.index.select(self.features, 15, 45)
+
+        # Then
+        expected = self.features[(self.features['raw_mass'] > 15) & (self.features['raw_mass'] < 45)]
+        pd.testing.assert_frame_equal(expected, selected)
+
+    def test_histogram(self):
+        # Then
+        self.assertEqual(5, self.index.histogram.sum())
+        self.assertEqual(10, self.index.bin_edges[0])
+        self.assertEqual(50, self.index.bin_edges[-1])
+
+    def test_empty(self):
+        # When
+        index = MassIndex(np.array([]))
+
+        # Then
+        self.assertEqual(0, index.count(0, 100))
+        self.assertEqual(0, len(index.positions()))
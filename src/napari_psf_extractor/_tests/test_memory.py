@@ -0,0 +1,78 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from ..extractor import extract_psf, localise_psf
+from ..memory import plan_memory, plan_workers, estimate_memory
+
+
+class TestMemory(unittest.TestCase):
+    def test_estimate_memory_scales_with_usf(self):
+        # When
+        estimates_1 = estimate_memory((10, 100, 100), np.uint16, 50, 9, 9, 21, usf=1)
+        estimates_2 = estimate_memory((10, 100, 100), np.uint16, 50, 9, 9, 21, usf=2)
+
+        # Then
+        self.assertEqual(8 * estimates_1['align'], estimates_2['align'])
+        self.assertEqual(estimates_1['extract'], estimates_2['extract'])
+
+    def test_plan_memory_fits(self):
+        # When
+        plan = plan_memory((10, 100, 100), np.uint16, 50, 9, 9, 21, usf=2, available=2**30)
+
+        # Then
+        self.assertIsNone(plan['batch_size'])
+        self.assertFalse(plan['memmap'])
+
+    def test_plan_memory_batches_extraction(self):
+        # Given
+        shape, n_features = (10, 100, 100), 1000
+        estimates = estimate_memory(shape, np.uint16, n_features, 9, 9, 21, usf=1)
+        retained = 8 * np.prod(shape)
+        available = (retained + 0.75 * estimates['extract']) / 0.8
+
+        # When
+        plan = plan_memory(shape, np.uint16, n_features, 9, 9, 21, usf=1, available=available)
+
+        # Then
+        self.assertTrue(plan['memmap'])
+        self.assertLess(plan['batch_size'], n_features)
+
+    def test_plan_memory_refuses_upsampling(self):
+        # When / Then
+        with self.assertRaisesRegex(MemoryError, "upsampling factor"):
+            plan_memory((10, 100, 100), np.uint16, 50, 31, 31, 81, usf=10, available=2**30)
+
+    def test_plan_workers_fit_in_memory(self):
+        # Given room for three alignments next to the stack and windows
+        shape, n_features = (10, 100, 100), 50
+        estimates = estimate_memory(shape, np.uint16, n_features, 9, 9, 21, usf=5)
+        psfs_bytes = estimates['extract'] // 2
+        retained = 8 * np.prod(shape) + psfs_bytes
+        available = (retained + 3.5 * (psfs_bytes + estimates['align'])) / 0.8
+        plan = plan_memory(shape, np.uint16, n_features, 9, 9, 21, usf=5, available=available)
+
+        # When / Then
+        self.assertEqual(3, plan_workers(plan, shape, n_features, max_workers=8))
+        self.assertEqual(2, plan_workers(plan, shape, n_features, max_workers=2))
+
+        with self.assertRaisesRegex(MemoryError, "alignment"):
+            plan_workers(dict(plan, budget=retained), shape, n_features)
+
+    def test_extract_psf_refuses_oversized_request(self):
+        # Given four features whose windows (4 x 72 KB) do not fit in 300 KB
+        stack = np.zeros((30, 100, 100))
+        features = pd.DataFrame({'x': [25.0, 75.0, 25.0, 75.0], 'y': [25.0, 25.0, 75.0, 75.0], 'raw_mass': 1.0})
+
+        # When / Then
+        with self.assertRaisesRegex(MemoryError, "localise"):
+            extract_psf(0, 10, stack, features, wx=21, wy=21, wz=21, available=300 * 1024)
+
+    def test_localise_psf_refuses_oversized_request(self):
+        # Given
+        psfs = np.zeros((4, 9, 9, 21))
+
+        # When / Then
+        with self.assertRaisesRegex(MemoryError, "upsampling factor"):
+            localise_psf(psfs, pd.DataFrame(index=range(4)), usf=10, available=2**20)
@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from .test_detection import make_beads
+from ..otf import OTFCache, bin_psf, compute_otf, export_otf, pad_psf, parse_shapes, MANIFEST_NAME
+
+
+class TestOTF(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.psf = rng.random((5, 7, 8)).astype(np.float32)
+
+    def test_pad_psf_moves_center_to_origin(self):
+        # When
+        padded = pad_psf(self.psf, (9, 16, 16))
+
+        # Then
+        self.assertEqual(padded[0, 0, 0], self.psf[2, 3, 4])
+        self.assertAlmostEqual(padded.sum(), self.psf.sum(), places=3)
+
+    def test_pad_psf_rejects_smaller_shapes(self):
+        with self.assertRaises(ValueError):
+            pad_psf(self.psf, (4, 16, 16))
+
+    def test_compute_otf(self):
+        # When
+        otf = compute_otf(self.psf, (9, 16, 16))
+
+        # Then
+        self.assertEqual(otf.dtype, np.complex64)
+        self.assertEqual(otf.shape, (9, 16, 9))
+        self.assertAlmostEqual(otf[0, 0, 0], 1, places=6)
+
+        # Convolving with the OTF is convolving with the centered PSF
+        image = np.zeros((9, 16, 16), dtype=np.float32)
+        image[4, 8, 8] = 1
+        blurred = np.fft.irfftn(np.fft.rfftn(image) * otf, s=image.shape, axes=(0, 1, 2))
+        self.assertTrue(np.allclose(blurred[2:7, 5:12, 4:12], self.psf / self.psf.sum(), atol=1e-6))
+
+    def test_cache_by_psf_hash(self):
+        # Given
+        cache = OTFCache()
+
+        # When
+        otf = cache.get(self.psf, (9, 16, 16))
+        otf_again = cache.get(self.psf.copy(), (9, 16, 16))
+
+        # Then
+        self.assertIs(otf, otf_again)
+        self.assertEqual(len(cache), 1)
+
+    def test_export_otf(self):
+        with tempfile.TemporaryDirectory() as folder:
+            # When
+            paths = export_otf(self.psf, folder, psx=10, psy=10, psz=20, shapes=[(9, 16, 16), (5, 8, 8)])
+            export_otf(self.psf, folder, psx=10, psy=10, psz=20, shapes=[(9, 16, 16)])
+
+            # Then
+            with open(os.path.join(folder, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+
+            self.assertEqual(len(manifest['otfs']), 2)
+            self.assertEqual(manifest['otfs'][0]['pixel_size'], {'z': 20, 'y': 10, 'x': 10})
+
+            otf = np.load(paths[0], mmap_mode='r')
+            self.assertIsInstance(otf, np.memmap)
+            self.assertTrue(np.array_equal(otf, compute_otf(self.psf, (9, 16, 16))))
+
+    def test_bin_psf_to_image_sampling(self):
+        # Given, a PSF upsampled 5 times from 13x9x9 px
+        usf = 5
+        sigma = np.array([2.0, 1.2, 1.2])
+        psf = make_beads((13 * usf, 9 * usf, 9 * usf), [(6 * usf + 2, 4 * usf + 2, 4 * usf + 2)], sigma=usf * sigma)
+
+        # When
+        binned = bin_psf(psf, usf)
+
+        # Then
+        expected = make_beads((13, 9, 9), [(6, 4, 4)], sigma=sigma)
+        self.assertEqual(binned.shape, (13, 9, 9))
+        self.assertTrue(np.allclose(binned / binned.sum(), expected / expected.sum(), atol=2e-3))
+
+    def test_export_upsampled_otf(self):
+        # Given, the window of the widget at usf = 5, larger than the images once upsampled
+        usf = 5
+        psf = make_beads((61 * usf, 39 * usf, 39 * usf), [(30 * usf + 2, 19 * usf + 2, 19 * usf + 2)],
+                         sigma=(usf * 4.0, usf * 1.5, usf * 1.5))
+
+        with tempfile.TemporaryDirectory() as folder:
+            # When
+            paths = export_otf(psf, folder, psx=63.5, psy=63.5, psz=100, shapes=[(64, 512, 512)], usf=usf)
+
+            # Then
+            with open(os.path.join(folder, MANIFEST_NAME)) as f:
+                entry = json.load(f)['otfs'][0]
+
+            self.assertEqual(entry['psf_shape'], [61, 39, 39])
+            self.assertEqual(entry['pixel_size'], {'z': 100, 'y': 63.5, 'x': 63.5})
+            self.assertEqual(np.load(paths[0], mmap_mode='r').shape, (64, 512, 257))
+
+    def test_parse_shapes(self):
+        self.assertEqual(parse_shapes("64x512x512, 32X256x256"), [(64, 512, 512), (32, 256, 256)])
+        self.assertEqual(parse_shapes(""), [])
+
+        with self.assertRaises(ValueError):
+            parse_shapes("512x512")
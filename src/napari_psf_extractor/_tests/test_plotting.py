@@ -4,7 +4,8 @@ from unittest.mock import patch, Mock
 import numpy as np
 import pandas as pd
 
-from ..plotting import plot_mass_range
+from ..fitting import measure_fwhm
+from ..plotting import PSFFigure, plot_mass_range, plot_psf
 
 
 class TestPlotting(unittest.TestCase):
@@ -32,3 +33,57 @@ class TestPlotting(unittest.TestCase):
             mip.shape[1] / mock_fig.dpi,
             mip.shape[0] / mock_fig.dpi
         )
+
+
+class TestPSFFigure(unittest.TestCase):
+    def setUp(self):
+        from matplotlib.figure import Figure
+
+        self.fig = Figure()
+        self.psf_figure = PSFFigure(self.fig)
+
+        zz, yy, xx = np.indices((21, 15, 15))
+        self.psf = np.exp(-((zz - 10) ** 2 / 8 + (yy - 7) ** 2 / 2 + (xx - 7) ** 2 / 2))
+
+    def test_update_reuses_artists(self):
+        # Given
+        n_artists = len(self.fig.axes), [len(ax.get_children()) for ax in self.fig.axes]
+
+        # When
+        changed = self.psf_figure.update(self.psf, 100, 100, 200)
+
+        # Then
+        self.assertTrue(changed)
+        self.assertEqual(n_artists, (len(self.fig.axes), [len(ax.get_children()) for ax in self.fig.axes]))
+        self.assertTrue(np.array_equal(self.psf_figure.images['xy'].get_array(), self.psf[10]))
+        fwhm_x = measure_fwhm(self.psf, 100, 100, 200)[0]
+        self.assertEqual(self.psf_figure.fwhm_texts['x'].get_text(), f"{fwhm_x:.0f}nm")
+
+    def test_update_skips_unchanged_psf(self):
+        # Given
+        self.psf_figure.update(self.psf, 100, 100, 200)
+
+        # When
+        changed_same = self.psf_figure.update(self.psf.copy(), 100, 100, 200)
+        changed_pixel_size = self.psf_figure.update(self.psf, 50, 50, 100)
+
+        # Then
+        self.assertFalse(changed_same)
+        self.assertTrue(changed_pixel_size)
+
+    def test_plot_psf_reuses_figure(self):
+        import matplotlib.pyplot as plt
+
+        # Given
+        self.addCleanup(plt.close, 'PSF')
+
+        with patch('matplotlib.pyplot.show'):
+            plot_psf(self.psf, 100, 100, 200)
+            axes = plt.figure(num='PSF').axes
+
+            # When
+            plot_psf(self.psf[::-1], 100, 100, 200)
+
+        # Then, the axes are updated rather than created again
+        self.assertEqual(axes, plt.figure(num='PSF').axes)
+        self.assertEqual(6, len(axes))
@@ -0,0 +1,79 @@
+import threading
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from ..cache import StackCache
+from ..prefetch import Prefetcher
+
+
+class TestPrefetcher(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.layer = SimpleNamespace(name="beads", data=rng.integers(0, 255, (4, 8, 8), dtype=np.uint8))
+        self.prefetcher = Prefetcher(StackCache(max_bytes=2**20))
+
+    def tearDown(self):
+        self.prefetcher.shutdown()
+
+    def test_load_in_background(self):
+        # When
+        future = self.prefetcher.load(self.layer)
+        stack, mip, key = future.result()
+
+        # Then
+        self.assertEqual(stack.max(), 1)
+        self.assertTrue(np.array_equal(np.max(stack, axis=0), mip))
+        self.assertIs(self.prefetcher.load(self.layer), future)
+
+    def test_load_changed_data(self):
+        # Given
+        future = self.prefetcher.load(self.layer)
+        future.result()
+
+        # When
+        self.layer.data = self.layer.data[::-1].copy()
+
+        # Then
+        self.assertIsNot(self.prefetcher.load(self.layer), future)
+
+    def test_detect_reuses_same_parameters(self):
+        # Given
+        calls = []
+
+        def detect(diameter):
+            calls.append(diameter)
+            return diameter
+
+        # When
+        first = self.prefetcher.detect(('stack', 5), detect, 5)
+        again = self.prefetcher.detect(('stack', 5), detect, 5)
+
+        # Then
+        self.assertIs(first, again)
+        self.assertEqual(again.result(), 5)
+        self.assertEqual(calls, [5])
+
+    def test_detect_cancels_pending_detections(self):
+        # Given, a detection that blocks the prefetch thread
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            return release.wait()
+
+        running = self.prefetcher.detect('running', block)
+        started.wait()
+        pending = self.prefetcher.detect('pending', lambda: 'pending')
+
+        # When
+        latest = self.prefetcher.detect('latest', lambda: 'latest')
+        release.set()
+
+        # Then
+        self.assertTrue(pending.cancelled())
+        self.assertTrue(running.result())
+        self.assertEqual(latest.result(), 'latest')
+        self.assertIn('running', self.prefetcher.detections)
+        self.assertNotIn('pending', self.prefetcher.detections)
@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+
+from ..profiling import MemoryProfiler
+
+MB = 1024 ** 2
+
+
+class TestMemoryProfiler(unittest.TestCase):
+    def setUp(self):
+        self.profiler = MemoryProfiler()
+        self.profiler.enable()
+
+    def tearDown(self):
+        self.profiler.disable()
+
+    def test_peak_and_retained(self):
+        # When
+        with self.profiler.stage('temporary'):
+            np.ones(10 * MB // 8).sum()
+
+        with self.profiler.stage('kept'):
+            kept = np.ones(10 * MB // 8)
+
+        # Then
+        temporary, retained = self.profiler.records
+        self.assertGreaterEqual(temporary['peak'], 10 * MB)
+        self.assertLess(temporary['retained'], MB)
+        self.assertGreaterEqual(retained['retained'], 10 * MB)
+        del kept
+
+    def test_nested_peak(self):
+        # When
+        with self.profiler.stage('outer'):
+            with self.profiler.stage('inner'):
+                np.ones(10 * MB // 8).sum()
+
+        # Then
+        inner, outer = self.profiler.records
+        self.assertEqual('outer', outer['stage'])
+        self.assertGreaterEqual(outer['peak'], inner['peak'])
+
+    def test_profile_decorator_and_report(self):
+        # Given
+        @self.profiler.profile()
+        def allocate():
+            return np.zeros(MB)
+
+        # When
+        allocate()
+        report = self.profiler.report()
+
+        # Then
+        self.assertEqual('allocate', self.profiler.records[0]['stage'])
+        self.assertIn('allocate', report)
+
+    def test_disabled(self):
+        # Given
+        self.profiler.disable()
+
+        # When
+        with self.profiler.stage('ignored'):
+            pass
+
+        # Then
+        self.assertEqual([], self.profiler.records)
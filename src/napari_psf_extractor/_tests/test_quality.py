@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+
+from .test_detection import make_beads
+from ..cache import preprocess_stack
+from ..quality import QUALITY_METRICS, quality_metrics, saturation_level
+
+
+class TestQuality(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        shape = (15, 11, 11)
+
+        # Round, elongated, defocused and saturated beads on a noisy background
+        psfs = np.stack([
+            make_beads(shape, [(7, 5, 5)], sigma=(2.0, 1.2, 1.2)),
+            make_beads(shape, [(7, 5, 5)], sigma=(2.0, 1.0, 2.0)),
+            make_beads(shape, [(10, 5, 5)], sigma=(2.0, 1.2, 1.2)),
+            np.clip(2 * make_beads(shape, [(7, 5, 5)], sigma=(2.0, 1.2, 1.2)), 0, 1),
+        ])
+        self.psfs = 0.5 * psfs + 0.1 + rng.normal(0, 0.01, psfs.shape).astype(np.float32)
+        self.psfs[3] = np.clip(0.1 + psfs[3] + rng.normal(0, 0.01, shape), 0, 1)
+
+    def test_quality_metrics(self):
+        # When
+        metrics = quality_metrics(self.psfs, saturation_level=1.0)
+
+        # Then
+        self.assertEqual(list(QUALITY_METRICS), list(metrics.columns))
+        self.assertTrue(np.allclose(metrics['background'], 0.1, atol=0.01))
+        self.assertTrue(np.all(metrics['snr'][:3] > 20))
+
+        # Only the last bead is saturated
+        self.assertTrue(np.all(metrics['saturation'][:3] == 0))
+        self.assertGreater(metrics['saturation'][3], 0)
+
+        # Only the second bead is elongated
+        self.assertLess(metrics['ellipticity'][0], 0.1)
+        self.assertGreater(metrics['ellipticity'][1], 0.4)
+
+        # Only the third bead is out of focus, saturated beads are centered on their plateau
+        self.assertEqual(3, metrics['z_focus'][2])
+        self.assertTrue(np.all(metrics['z_focus'][[0, 1, 3]] == 0))
+
+    def test_chunks_give_the_same_metrics(self):
+        # When
+        metrics = quality_metrics(self.psfs)
+        metrics_chunked = quality_metrics(np.repeat(self.psfs, 3, axis=0), chunk_size=5)
+
+        # Then
+        self.assertTrue(np.allclose(np.repeat(metrics.to_numpy(), 3, axis=0), metrics_chunked.to_numpy()))
+
+    def test_saturation_is_measured_against_the_raw_level(self):
+        # Given a raw stack whose brightest voxel is below the detector maximum
+        data = np.full((4, 8, 8), 100, dtype=np.uint16)
+        data[1, 2, 2] = 4000
+        data[2, 5, 5] = 4095
+        stack, _ = preprocess_stack(data)
+
+        # When
+        unsaturated = quality_metrics(stack[None], saturation_level=saturation_level(data))
+        saturated = quality_metrics(stack[None], saturation_level=saturation_level(data, 4095))
+
+        # Then
+        self.assertEqual(0, unsaturated['saturation'][0])
+        self.assertEqual(1 / data.size, saturated['saturation'][0])
+
+    def test_saturation_level(self):
+        data = np.array([10, 20, 110], dtype=np.uint8)
+
+        self.assertEqual(np.inf, saturation_level(data))
+        self.assertEqual(0.5, saturation_level(data, 60))
+        self.assertEqual(np.inf, saturation_level(data.astype(np.float32)))
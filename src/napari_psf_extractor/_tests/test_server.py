@@ -0,0 +1,318 @@
+import gc
+import os
+import stat
+import tempfile
+import threading
+import unittest
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+from ..server import (ExtractionClient, ExtractionServer, LocalExtractionServer, SharedArray, get_authkey,
+                      parse_address, runtime_dir)
+
+
+def sum_job(stack, axis=None):
+    return np.sum(stack, axis=axis)
+
+
+def fail_job(stack):
+    raise ValueError("bad input")
+
+
+def scale_job(stack, psfs, factor):
+    return psfs * factor, factor
+
+
+def count_job(stack, n, callback=None):
+    for i in range(n):
+        callback(i)
+
+    return n
+
+
+JOBS = {'sum': sum_job, 'fail': fail_job, 'scale': scale_job, 'count': count_job}
+
+
+def shared_segments():
+    return set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+
+
+class TestLocalExtractionServer(unittest.TestCase):
+    def test_submit(self):
+        # Given
+        server = LocalExtractionServer(jobs=JOBS)
+        stack = np.arange(24).reshape(2, 3, 4)
+
+        # When
+        result = server.submit('sum', stack, axis=0).result()
+
+        # Then
+        self.assertTrue(np.array_equal(stack.sum(axis=0), result))
+        server.close()
+
+    def test_unknown_job(self):
+        # Given
+        server = LocalExtractionServer(jobs=JOBS)
+
+        # When / Then
+        with self.assertRaises(RuntimeError):
+            server.submit('missing').result()
+        server.close()
+
+
+@unittest.skipIf(os.name == 'nt', "Unix sockets are not available")
+class TestExtractionServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.server = ExtractionServer(os.path.join(self.tmp.name, 'server.sock'), authkey=b'key',
+                                       max_workers=1, jobs=JOBS)
+        self.server.start()
+        self.client = ExtractionClient(self.server.address, authkey=b'key')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.tmp.cleanup()
+
+    def test_jobs_share_uploaded_stack(self):
+        # Given
+        stack = np.arange(60, dtype=np.float32).reshape(3, 4, 5)
+
+        # When
+        futures = [self.client.submit('sum', stack, axis=axis) for axis in (0, 1, 2)]
+
+        # Then
+        for axis, future in enumerate(futures):
+            self.assertTrue(np.array_equal(stack.sum(axis=axis), future.result(timeout=60)))
+        self.assertEqual(1, len(self.server.store.segments))
+
+    def test_socket_is_private(self):
+        self.assertEqual(0, os.stat(self.server.address).st_mode & (stat.S_IRWXG | stat.S_IRWXO))
+
+    def test_load_maps_layer_from_file(self):
+        # Given
+        path = os.path.join(self.tmp.name, 'stack.npy')
+        np.save(path, np.arange(60, dtype=np.uint16).reshape(3, 4, 5))
+        layer = SimpleNamespace(data=np.load(path), source=SimpleNamespace(path=path))
+        other_client = ExtractionClient(self.server.address, authkey=b'key')
+
+        # When
+        stack, mip = self.client.load(layer)
+        other_stack, _ = other_client.load(SimpleNamespace(data=np.load(path), source=SimpleNamespace(path=path)))
+        result = self.client.submit('sum', stack, axis=0).result(timeout=60)
+
+        # Then, both sessions map the single normalized stack read by the server
+        self.assertEqual(1, len(self.server.store.segments))
+        self.assertEqual(('path', os.path.realpath(path)), next(iter(self.server.store.segments))[:2])
+        self.assertTrue(np.allclose(np.arange(60).reshape(3, 4, 5) / 59, stack))
+        self.assertTrue(np.array_equal(stack, other_stack))
+        self.assertTrue(np.array_equal(stack.max(axis=0), mip))
+        self.assertTrue(np.allclose(stack.sum(axis=0), result))
+        self.assertFalse(stack.flags.writeable)
+        other_client.close()
+
+    def test_load_uploads_layer_without_file(self):
+        # Given
+        layer = SimpleNamespace(data=np.arange(60, dtype=np.float32).reshape(3, 4, 5))
+
+        # When
+        stack, _ = self.client.load(layer)
+        stack_again, _ = self.client.load(layer)
+
+        # Then
+        self.assertIs(stack, stack_again)
+        self.assertEqual(1, len(self.server.store.segments))
+        self.assertEqual(1, stack.max())
+
+    def test_keys_do_not_keep_stacks_alive(self):
+        # Given
+        stack = np.zeros((2, 3, 4))
+        self.client.ensure_stack(stack)
+        reference = weakref.ref(stack)
+
+        # When
+        del stack
+        gc.collect()
+
+        # Then
+        self.assertIsNone(reference())
+
+    def test_concurrent_requests_get_their_own_replies(self):
+        # Given
+        stacks = [np.full((2, 3, 4), i, dtype=np.float32) for i in range(16)]
+
+        # When
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            keys = list(pool.map(self.client.ensure_stack, stacks))
+
+        # Then
+        self.assertEqual(len(stacks), len(set(keys)))
+        for stack, key in zip(stacks, keys):
+            self.assertEqual(self.server.store.descriptor(key)[1], stack.shape)
+            self.assertEqual(key, self.client.ensure_stack(stack))
+
+    def test_lost_connection_wakes_requests(self):
+        # Given a server stuck reading a stack
+        reading, release = threading.Event(), threading.Event()
+
+        def slow_reader(path):
+            reading.set()
+            release.wait(10)
+            return np.zeros((2, 3, 4))
+
+        self.server.reader = slow_reader
+        path = os.path.join(self.tmp.name, 'stack.npy')
+        np.save(path, np.zeros((2, 3, 4)))
+        layer = SimpleNamespace(data=np.zeros((2, 3, 4)), source=SimpleNamespace(path=path))
+
+        errors = []
+        thread = threading.Thread(target=lambda: errors.append(self._load_error(layer)))
+        thread.start()
+        reading.wait(10)
+
+        # When
+        self.server.shutdown()
+        thread.join(10)
+        release.set()
+
+        # Then
+        self.assertFalse(thread.is_alive())
+        self.assertIsInstance(errors[0], ConnectionError)
+
+        with self.assertRaises(ConnectionError):
+            self.client.submit('sum', None)
+
+    def _load_error(self, layer):
+        try:
+            self.client.load(layer)
+        except Exception as e:
+            return e
+
+    def test_job_error(self):
+        # When / Then
+        with self.assertRaisesRegex(RuntimeError, "bad input"):
+            self.client.submit('fail', np.zeros(3)).result(timeout=60)
+
+    def test_arrays_pass_through_shared_memory(self):
+        # Given
+        psfs = np.arange(60, dtype=np.float32).reshape(3, 4, 5)
+        segments = shared_segments()
+
+        # When
+        with mock.patch.object(self.client, 'conn', wraps=self.client.conn) as conn:
+            scaled, factor = self.client.submit('scale', psfs=psfs, factor=2).result(timeout=60)
+
+        # Then
+        self.assertIsInstance(conn.send.call_args[0][0][4]['psfs'], SharedArray)
+        self.assertTrue(np.array_equal(psfs * 2, scaled))
+        self.assertEqual(2, factor)
+        self.assertEqual(segments, shared_segments())
+
+    def test_progress_is_forwarded(self):
+        # Given
+        progress = []
+
+        # When
+        result = self.client.submit('count', n=3, callback=progress.append).result(timeout=60)
+
+        # Then
+        self.assertEqual(3, result)
+        self.assertEqual([0, 1, 2], progress)
+
+    def test_upload_shares_stack(self):
+        # Given
+        stack = np.arange(60, dtype=np.float32).reshape(3, 4, 5)
+        segments = shared_segments()
+
+        # When
+        with mock.patch.object(self.client, 'conn', wraps=self.client.conn) as conn:
+            key = self.client.ensure_stack(stack)
+
+        # Then, the server keeps the uploaded segment
+        upload = conn.send.call_args[0][0]
+        self.assertEqual('upload', upload[0])
+        self.assertIsInstance(upload[3], SharedArray)
+        self.assertEqual(upload[3].name, self.server.store.descriptor(key)[0])
+        self.assertEqual(len(segments) + 1, len(shared_segments()))
+
+
+@unittest.skipIf(os.name != 'posix', "File permissions are not enforced")
+class TestAuthkey(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'config', 'authkey')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_random_private_key(self):
+        # When
+        key = get_authkey(self.path)
+
+        # Then
+        self.assertEqual(key, get_authkey(self.path))
+        self.assertGreaterEqual(len(key), 32)
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(self.path).st_mode))
+
+    def test_readable_key_is_refused(self):
+        # Given
+        get_authkey(self.path)
+        os.chmod(self.path, 0o644)
+
+        # When / Then
+        with self.assertRaises(PermissionError):
+            get_authkey(self.path)
+
+
+@unittest.skipIf(os.name != 'posix', "File permissions are not enforced")
+class TestSharedServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.gid = os.getgid()
+        self.patch = mock.patch('tempfile.tempdir', self.tmp.name)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.cleanup()
+
+    def test_group_can_connect(self):
+        # When
+        server = ExtractionServer(max_workers=1, jobs=JOBS, group=self.gid)
+        server.start()
+        client = ExtractionClient(group=self.gid)
+
+        # Then, the group may enter the directory, use the socket and read the key, others may not
+        folder = runtime_dir(self.gid)
+        self.assertEqual(os.path.join(folder, 'server.sock'), server.address)
+
+        for path, mode in ((folder, 0o750), (server.address, 0o660), (os.path.join(folder, 'authkey'), 0o640)):
+            info = os.stat(path)
+            self.assertEqual(self.gid, info.st_gid)
+            self.assertEqual(mode, stat.S_IMODE(info.st_mode))
+
+        self.assertEqual(6, client.submit('sum', np.arange(4)).result(timeout=60))
+
+        client.close()
+        server.shutdown()
+
+    def test_key_readable_by_others_is_refused(self):
+        # Given
+        path = os.path.join(runtime_dir(self.gid), 'authkey')
+        get_authkey(path, gid=self.gid)
+        os.chmod(path, 0o644)
+
+        # When / Then
+        with self.assertRaises(PermissionError):
+            get_authkey(path, gid=self.gid)
+
+
+class TestParseAddress(unittest.TestCase):
+    def test_parse_address(self):
+        self.assertEqual(('localhost', 6011), parse_address('localhost:6011'))
+        self.assertEqual(('localhost', 6011), parse_address(':6011'))
+        self.assertEqual('/tmp/server.sock', parse_address('/tmp/server.sock'))
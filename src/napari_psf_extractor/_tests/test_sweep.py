@@ -0,0 +1,101 @@
+import unittest
+from unittest.mock import Mock, patch
+
+import numpy as np
+import pandas as pd
+
+from .test_detection import make_beads
+from ..correlation import batch_pcc
+from ..featureset import FeatureSet, overlap_mask, edge_mask
+from ..sweep import _align, run_sweep, select_mass_ranges
+
+
+def fake_filter_locations(psfs, features_extracted):
+    # Every PSF is centered in its window
+    center = (np.array(psfs.shape[1:]) - 1) / 2
+    locations = pd.DataFrame([center] * len(psfs), columns=['z0', 'y0', 'x0'])
+
+    return psfs, locations, features_extracted
+
+
+def fake_detect_outlier_psfs(psfs, pcc_min, return_pccs):
+    pccs = batch_pcc(psfs)
+
+    return np.flatnonzero(pccs < pcc_min), pccs
+
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = [(15, y, x) for y in range(10, 90, 16) for x in range(10, 90, 16)]
+        self.stack = make_beads((30, 100, 100), centers, sigma=(3.0, 1.5, 1.5))
+        self.features = pd.DataFrame(
+            [(z + rng.uniform(-0.3, 0.3), y, x) for z, y, x in centers], columns=['z', 'y', 'x']
+        )
+        self.features['raw_mass'] = rng.uniform(0, 100, len(self.features))
+
+    def test_select_mass_ranges_matches_extract_psf(self):
+        # Given
+        mass_ranges = [(10, 60), (30, 100)]
+
+        # When
+        masks = select_mass_ranges(self.stack, self.features, mass_ranges, wx=21, wy=21)
+
+        # Then
+        feature_set = FeatureSet.from_dataframe(self.features)
+        for mask, (min_mass, max_mass) in zip(masks, mass_ranges):
+            expected = feature_set.mass_mask(min_mass, max_mass) \
+                & ~overlap_mask(feature_set.x, feature_set.y, 21, 21, candidates=feature_set.mass_mask(min_mass)) \
+                & ~edge_mask(feature_set.x, feature_set.y, 100, 100, 21, 21)
+            self.assertTrue(np.array_equal(expected, mask))
+
+    @patch('napari_psf_extractor.sweep.psfe')
+    @patch('napari_psf_extractor.sweep.filter_locations', side_effect=fake_filter_locations)
+    def test_run_sweep_shares_localisation(self, mock_filter_locations, mock_psfe):
+        # Given
+        mock_psfe.detect_outlier_psfs.side_effect = fake_detect_outlier_psfs
+        calls = Mock()
+        calls.attach_mock(mock_filter_locations, 'filter_locations')
+        calls.attach_mock(mock_psfe.detect_outlier_psfs, 'detect_outlier_psfs')
+
+        # When
+        result = run_sweep(
+            self.stack, self.features,
+            mass_ranges=[(0, 100), (50, 100)], pcc_mins=[None, 0.5, 0.9], usfs=[1, 2],
+            wx=11, wy=11, wz=15, psx=100, psy=100, psz=100, max_workers=2
+        )
+
+        # Then, the windows are localised once for all runs
+        mock_filter_locations.assert_called_once()
+
+        # The PCCs are computed before localisation, once per mass range for all thresholds
+        self.assertEqual(
+            ['detect_outlier_psfs', 'detect_outlier_psfs', 'filter_locations'],
+            [name for name, *_ in calls.mock_calls]
+        )
+
+        self.assertEqual(len(result), 12)
+        self.assertEqual(set(result.attrs['timings']), {'extract', 'localise', 'pcc', 'align'})
+
+        all_beads = result[(result.min_mass == 0) & result.pcc_min.isna()]
+        self.assertTrue((all_beads.beads == len(self.features)).all())
+        self.assertTrue((result.beads <= len(self.features)).all())
+
+        # The FWHM does not depend on the upsampling factor
+        fwhm = all_beads[['fwhm_x', 'fwhm_y', 'fwhm_z']].to_numpy()
+        self.assertTrue(np.allclose(fwhm[0], fwhm[1], rtol=0.1))
+        self.assertTrue(np.allclose(fwhm[:, :2], 2.355 * 1.5 * 100, rtol=0.15))
+
+    @patch('napari_psf_extractor.sweep.psfe')
+    def test_upsample_locations_match_by_label(self, mock_psfe):
+        # Given
+        psfs = np.zeros((3, 5, 5, 5))
+        locations = pd.DataFrame({'z0': [1.0, 2.0, 3.0]}, index=[4, 7, 9])
+
+        # When
+        _align(psfs, locations, usf=2, engine='upsample')
+
+        # Then, the locations are labelled by position, as the PSFs
+        passed = mock_psfe.align_psfs.call_args.args[1]
+        self.assertEqual([0, 1, 2], list(passed.index))
+        self.assertEqual([1.0, 2.0, 3.0], list(passed.z0))
@@ -0,0 +1,154 @@
+import tempfile
+import unittest
+from concurrent.futures import Future
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+try:
+    import napari
+except ImportError:
+    napari = None
+
+
+@unittest.skipIf(napari is None, "napari is not installed")
+class TestMainWidget(unittest.TestCase):
+    def setUp(self):
+        from ..checkpoint import CheckpointStore
+        from ..widget import MainWidget
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.viewer = napari.Viewer(show=False)
+        self.widget = MainWidget(self.viewer)
+        self.widget.checkpoints = CheckpointStore(root=self.tmp.name)
+        self.widget.checkpoint_checkbox.setChecked(True)
+        self.widget._init_optical_settings(520, 0.85, 63.5, 63.5, 100, 5)
+
+        # A loaded stack, with located features
+        stack = np.zeros((8, 16, 16), dtype=np.float32)
+        self.widget.loaded = Future()
+        self.widget.loaded.set_result((stack, stack.max(axis=0), 'stack'))
+        self.widget.features.features_init = pd.DataFrame({'x': [8.0], 'y': [8.0], 'raw_mass': [1.0]})
+
+    def tearDown(self):
+        self.widget.prefetcher.shutdown()
+        self.viewer.close()
+        self.tmp.cleanup()
+
+    def test_extract_resumes_from_psf_sum_checkpoint(self):
+        # Given
+        window = self.widget.psf_window(self.widget.features.get_features())
+        psf_params = dict(self.widget.checkpoint_params(window), usf=self.widget.usf, engine='upsample')
+        psf_sum = np.ones((3, 4, 5), dtype=np.float32)
+        self.widget.save_checkpoint('psf_sum', psf_params, psf_sum=psf_sum)
+
+        # When
+        with mock.patch.object(self.widget, 'extract_selected_psfs') as extract_selected_psfs, \
+                mock.patch.object(self.widget, 'show_psf') as show_psf, \
+                mock.patch('napari_psf_extractor.widget.show_error') as show_error:
+            self.widget.extract()
+
+        # Then
+        show_error.assert_not_called()
+        extract_selected_psfs.assert_not_called()
+        show_psf.assert_called_once()
+        self.assertTrue(np.array_equal(psf_sum, self.widget.psf_sum))
+        self.assertTrue(self.widget.save_button.isEnabled())
+
+    def test_extract_reuses_measured_beads(self):
+        # Given beads measured by the quality panel, the second one too elongated
+        features = self.widget.features.get_features()
+        features = pd.concat([features, features.assign(x=4.0)], ignore_index=True)
+        self.widget.features.features_init = features
+
+        window = self.widget.psf_window(features)
+        params = dict(self.widget.checkpoint_params(window), stack=self.widget.stack_key)
+        psfs = np.random.default_rng(0).random((1,) + tuple(window))
+        metrics = pd.DataFrame({'snr': [20.0, 20.0], 'saturation': [0.0, 0.0],
+                                'ellipticity': [0.1, 0.9], 'z_focus': [0.0, 0.0]})
+
+        self.widget.quality.checkbox.setChecked(True)
+        self.widget.quality.set_metrics(features, features, metrics, params=params)
+
+        def run_job(job, stack=None, **params):
+            return (psfs, params['features']) if job == 'extract_psfs_batched' else np.ones((3, 4, 5))
+
+        # When
+        with mock.patch.object(self.widget, 'extract_selected_psfs') as extract_selected_psfs, \
+                mock.patch.object(self.widget, 'run_job', side_effect=run_job) as run_job, \
+                mock.patch.object(self.widget, 'show_psf'), \
+                mock.patch('napari_psf_extractor.widget.show_error') as show_error:
+            self.widget.extract()
+
+        # Then, only the window of the bead passing the thresholds is extracted again
+        show_error.assert_not_called()
+        extract_selected_psfs.assert_not_called()
+        extract_call, localise_call = run_job.call_args_list
+        self.assertEqual('extract_psfs_batched', extract_call.args[0])
+        self.assertEqual([0], list(extract_call.kwargs['features'].index))
+        self.assertEqual('localise_psf', localise_call.args[0])
+        self.assertTrue(np.array_equal(psfs, localise_call.kwargs['psfs']))
+        self.assertEqual([0], list(localise_call.kwargs['features_extracted'].index))
+
+    def test_data_change_reloads_selected_layer(self):
+        # Given
+        layer = SimpleNamespace(name='beads', data=np.arange(8 * 16 * 16, dtype=np.uint16).reshape(8, 16, 16))
+        self.widget.image_layer = layer
+        loaded = self.widget.loaded
+
+        # When
+        layer.data = layer.data[::-1].copy()
+        self.widget.invalidate_layer(layer)
+
+        # Then
+        self.assertIsNot(loaded, self.widget.loaded)
+        stack, _, _ = self.widget.loaded.result(5)
+        self.assertEqual(1, stack[0].max())
+        self.assertFalse(self.widget.extract_button.isEnabled())
+
+    def test_removed_layer_is_not_reloaded(self):
+        # Given the selected layer
+        layer = napari.layers.Image(np.zeros((8, 16, 16), dtype=np.uint16), name='beads')
+        self.widget.image_layer = layer
+        self.widget.watched_layers.add(layer)
+
+        # When
+        with mock.patch.object(self.widget.prefetcher, 'load') as load:
+            self.widget.layer_removed(SimpleNamespace(value=layer))
+
+        # Then
+        load.assert_not_called()
+        self.assertIsNone(self.widget.image_layer)
+        self.assertIsNone(self.widget.loaded)
+        self.assertNotIn(layer, self.widget.watched_layers)
+        self.assertFalse(self.widget.extract_button.isEnabled())
+
+    def test_auto_window_is_measured_in_a_worker(self):
+        # Given
+        self.widget.auto_window_checkbox.setChecked(True)
+        worker = mock.Mock()
+        report = {'beads': 0}
+
+        # When
+        with mock.patch('napari_psf_extractor.widget.thread_worker', return_value=lambda *args: worker) as thread_worker, \
+                mock.patch('napari_psf_extractor.widget.auto_window') as auto_window, \
+                mock.patch.object(self.widget, 'extract_selected_psfs') as extract_selected_psfs:
+            self.widget.extract()
+
+            # Then, the window is measured in a worker before extracting
+            thread_worker.assert_called_once_with(auto_window)
+            auto_window.assert_not_called()
+            extract_selected_psfs.assert_not_called()
+            self.assertFalse(self.widget.extract_button.isEnabled())
+
+            # When the worker returns
+            with mock.patch('napari_psf_extractor.widget.show_info'), \
+                    mock.patch('napari_psf_extractor.widget.show_error'):
+                finish = worker.returned.connect.call_args.args[0]
+                finish(((5, 7, 7), report))
+
+            # Then, the extraction continues with the measured window
+            extract_selected_psfs.assert_called_once()
+            self.assertEqual([5, 7, 7], extract_selected_psfs.call_args.args[1]['window'])
@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from .test_detection import make_beads
+from ..window import auto_window, crop_psfs, signal_extent
+
+
+class TestWindow(unittest.TestCase):
+    def test_signal_extent(self):
+        # Given
+        psfs = make_beads((21, 15, 15), [(10, 7, 7)], sigma=(2.0, 1.0, 1.0))[None]
+
+        # When
+        extent = signal_extent(psfs, threshold=0.05)
+
+        # Then, a Gaussian drops below 5% of its peak at 2.45 sigma
+        self.assertTrue(np.array_equal(extent[0], [4, 2, 2]))
+
+    def test_crop_psfs(self):
+        # Given
+        psfs = np.arange(2 * 9 * 7 * 7).reshape(2, 9, 7, 7)
+
+        # When
+        cropped = crop_psfs(psfs, (5, 3, 3))
+
+        # Then
+        self.assertEqual(cropped.shape, (2, 5, 3, 3))
+        self.assertTrue(np.array_equal(cropped[:, 2, 1, 1], psfs[:, 4, 3, 3]))
+
+    def test_auto_window_shrinks_to_beads(self):
+        # Given
+        centers = [(20, y, x) for y in range(15, 90, 20) for x in range(15, 90, 20)]
+        stack = make_beads((41, 100, 100), centers, sigma=(2.0, 1.0, 1.0))
+        features = pd.DataFrame(centers, columns=['z', 'y', 'x'], dtype=float)
+
+        # When
+        window, report = auto_window(stack, features, (31, 15, 15), usf=2, n_samples=10)
+
+        # Then
+        self.assertEqual(window, (11, 7, 7))
+        self.assertEqual(report['beads'], 10)
+        self.assertAlmostEqual(report['voxel_fraction'], 11 * 49 / (31 * 225))
+        self.assertGreater(report['time_before'], 0)
+
+    def test_auto_window_never_grows(self):
+        # Given
+        stack = make_beads((21, 40, 40), [(10, 20, 20)], sigma=(4.0, 3.0, 3.0))
+        features = pd.DataFrame({'z': [10.0], 'y': [20.0], 'x': [20.0]})
+
+        # When
+        window, _ = auto_window(stack, features, (9, 7, 7), usf=1)
+
+        # Then
+        self.assertEqual(window, (9, 7, 7))
@@ -0,0 +1,391 @@
+from functools import lru_cache
+
+import numpy as np
+
+from napari_psf_extractor.utils import lazy_import
+
+fft = lazy_import('scipy.fft')
+
+# Number of PSFs transformed at once by the Fourier engine
+FOURIER_BATCH_SIZE = 256
+
+# Defaults of the progressive alignment: the relative L2 change of the PSF
+# at which it has converged, the number of beads aligned between checks,
+# and the number of beads aligned before checking
+PROGRESSIVE_TOL = 1e-3
+PROGRESSIVE_STEP = 32
+PROGRESSIVE_MIN_BEADS = 64
+
+
+def get_centroids(locations):
+    """
+    Get the (z, y, x) centroids of the PSFs from a locations table.
+
+    Parameters
+    ----------
+    locations : pandas.DataFrame
+        The PSF locations as returned by `psfe.localize_psfs`.
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (N, 3) with the z, y and x centroids in px.
+    """
+    return locations[['z0', 'y0', 'x0']].to_numpy(dtype=float)
+
+
+def align_psf(psf, centroid, usf):
+    """
+    Upsample a single PSF and roll it such that its centroid is in the center.
+
+    This mirrors the per-bead step of `psfe.align_psfs`.
+
+    Parameters
+    ----------
+    psf : np.ndarray
+        The PSF of shape (wz, wy, wx).
+    centroid : array-like
+        The (z, y, x) centroid of the PSF in px.
+    usf : int
+        The upsampling factor.
+
+    Returns
+    -------
+    np.ndarray
+        The upsampled and aligned PSF of shape (usf * wz, usf * wy, usf * wx).
+    """
+    usf = int(usf)
+
+    psf_up = psf.repeat(usf, axis=0).repeat(usf, axis=1).repeat(usf, axis=2)
+
+    # Roll centroid to the center of the upsampled PSF
+    center = np.array(psf_up.shape) // 2
+    shift = np.round(center - usf * np.asarray(centroid)).astype(int)
+
+    return np.roll(psf_up, shift=tuple(shift), axis=(0, 1, 2))
+
+
+def align_psf_stack(psfs, locations, usf, dtype=np.float32, out=None):
+    """
+    Upsample and align every PSF, keeping the individual volumes.
+
+    Summing the result over the first axis gives the same (unnormalized)
+    PSF as `psfe.align_psfs`, but the volumes can be reused to build
+    the sum of any subset of beads without realigning.
+
+    Parameters
+    ----------
+    psfs : np.ndarray
+        The PSFs of shape (N, wz, wy, wx).
+    locations : pandas.DataFrame
+        The PSF locations as returned by `psfe.localize_psfs`.
+    usf : int
+        The upsampling factor.
+    dtype : np.dtype
+        The data type of the aligned volumes.
+    out : np.ndarray
+        The array to write the volumes to, e.g. a memory-mapped file.
+
+    Returns
+    -------
+    np.ndarray
+        The aligned volumes of shape (N, usf * wz, usf * wy, usf * wx).
+    """
+    usf = int(usf)
+    centroids = get_centroids(locations)
+
+    shape = (len(psfs),) + tuple(usf * np.array(psfs.shape[1:]))
+    volumes = np.empty(shape, dtype=dtype) if out is None else out
+
+    for i, psf in enumerate(psfs):
+        volumes[i] = align_psf(psf, centroids[i], usf)
+
+    return volumes
+
+
+def normalize_psf(psf_sum):
+    """
+    Normalize an accumulated PSF to the range [0, 1], as `psfe.align_psfs` does.
+    """
+    psf_min, psf_max = psf_sum.min(), psf_sum.max()
+
+    if psf_min == psf_max:
+        return np.ones_like(psf_sum)
+
+    return (psf_sum - psf_min) / (psf_max - psf_min)
+
+
+@lru_cache(maxsize=16)
+def _frequencies(shape):
+    """
+    Get the rfftn frequencies of a PSF window, cached per window shape.
+    """
+    return (
+        np.fft.fftfreq(shape[0]),
+        np.fft.fftfreq(shape[1]),
+        np.fft.rfftfreq(shape[2]),
+    )
+
+
+def _fourier_upsample(spectrum, shape, usf, workers=None):
+    """
+    Upsample a volume by zero-padding its rfftn spectrum.
+
+    Parameters
+    ----------
+    spectrum : np.ndarray
+        The rfftn of the volume.
+    shape : tuple
+        The shape of the volume.
+    usf : int
+        The upsampling factor.
+    workers : int
+        The number of FFT workers.
+    """
+    up_shape = tuple(usf * np.array(shape))
+
+    # Integer frequencies of the full axes, placed at the same frequencies
+    # of the larger spectrum (negative frequencies wrap around the end)
+    iz = np.round(np.fft.fftfreq(shape[0]) * shape[0]).astype(int) % up_shape[0]
+    iy = np.round(np.fft.fftfreq(shape[1]) * shape[1]).astype(int) % up_shape[1]
+    ix = np.arange(spectrum.shape[2])
+
+    padded = np.zeros(up_shape[:2] + (up_shape[2] // 2 + 1,), dtype=spectrum.dtype)
+    padded[np.ix_(iz, iy, ix)] = spectrum
+
+    return fft.irfftn(padded, s=up_shape, workers=workers) * usf ** 3
+
+
+def align_psfs_fourier(psfs, locations, usf, workers=None):
+    """
+    Align and sum PSFs with sub-pixel shifts applied in the Fourier domain.
+
+    Instead of upsampling every PSF before shifting it (as `psfe.align_psfs`
+    does), each PSF is shifted by a phase ramp in frequency space and the
+    spectra are summed. Only the accumulated PSF is upsampled, which saves
+    a factor of about usf^3 in time and memory.
+
+    The centroids end up at the same voxel as with `psfe.align_psfs`, but
+    the result is band-limited interpolated rather than nearest-neighbour
+    upsampled, and the shifts are not rounded to the upsampled grid.
+
+    Parameters
+    ----------
+    psfs : np.ndarray
+        The PSFs of shape (N, wz, wy, wx).
+    locations : pandas.DataFrame
+        The PSF locations as returned by `psfe.localize_psfs`.
+    usf : int
+        The upsampling factor.
+    workers : int
+        The number of FFT workers.
+
+    Returns
+    -------
+    np.ndarray
+        The normalized PSF of shape (usf * wz, usf * wy, usf * wx).
+    """
+    usf = int(usf)
+    shape = psfs.shape[1:]
+    shifts = _fourier_shifts(locations, shape, usf)
+
+    spectrum_sum = np.zeros(_spectrum_shape(shape), dtype=complex)
+
+    for start in range(0, len(psfs), FOURIER_BATCH_SIZE):
+        batch = slice(start, start + FOURIER_BATCH_SIZE)
+        spectrum_sum += _shifted_spectrum_sum(psfs[batch], shifts[batch], workers)
+
+    return upsample_spectrum(spectrum_sum, shape, usf, workers=workers)
+
+
+def align_spectrum_stack(psfs, locations, usf, dtype=np.complex64, out=None, workers=None):
+    """
+    Shift every PSF in the Fourier domain, keeping the individual spectra.
+
+    Upsampling the sum of the spectra over the first axis gives the same
+    PSF as `align_psfs_fourier` (see `upsample_spectrum`), such that the
+    spectra can be reused to build the PSF of any subset of beads without
+    realigning. Unlike `align_psf_stack`, they are not upsampled.
+
+    Parameters
+    ----------
+    psfs : np.ndarray
+        The PSFs of shape (N, wz, wy, wx).
+    locations : pandas.DataFrame
+        The PSF locations as returned by `psfe.localize_psfs`.
+    usf : int
+        The upsampling factor.
+    dtype : np.dtype
+        The data type of the spectra.
+    out : np.ndarray
+        The array to write the spectra to, e.g. a memory-mapped file.
+    workers : int
+        The number of FFT workers.
+
+    Returns
+    -------
+    np.ndarray
+        The shifted rfftn spectra of shape (N, wz, wy, wx // 2 + 1).
+    """
+    usf = int(usf)
+    shape = psfs.shape[1:]
+    shifts = _fourier_shifts(locations, shape, usf)
+
+    spectra = np.empty((len(psfs),) + _spectrum_shape(shape), dtype=dtype) if out is None else out
+
+    for start in range(0, len(psfs), FOURIER_BATCH_SIZE):
+        batch = slice(start, start + FOURIER_BATCH_SIZE)
+        ramp_z, ramp_y, ramp_x = _phase_ramps(shifts[batch], shape)
+        spectra[batch] = fft.rfftn(np.asarray(psfs[batch]), axes=(1, 2, 3), workers=workers) \
+            * ramp_z[:, :, None, None] * ramp_y[:, None, :, None] * ramp_x[:, None, None, :]
+
+    return spectra
+
+
+def upsample_spectrum(spectrum, shape, usf, workers=None):
+    """
+    Upsample an accumulated spectrum into a normalized PSF.
+
+    Parameters
+    ----------
+    spectrum : np.ndarray
+        The rfftn spectrum of the PSF, e.g. a sum of `align_spectrum_stack`.
+    shape : tuple
+        The (wz, wy, wx) shape of the PSF windows.
+    usf : int
+        The upsampling factor.
+    workers : int
+        The number of FFT workers.
+
+    Returns
+    -------
+    np.ndarray
+        The normalized PSF of shape (usf * wz, usf * wy, usf * wx).
+    """
+    return normalize_psf(_fourier_upsample(spectrum, tuple(shape), int(usf), workers=workers))
+
+
+def _spectrum_shape(shape):
+    return shape[0], shape[1], shape[2] // 2 + 1
+
+
+def _fourier_shifts(locations, shape, usf):
+    """
+    Get the shifts [input px] that place the centroids where `psfe.align_psfs` places them.
+    """
+    center = np.array(usf * np.array(shape)) // 2
+    target = (center + (usf - 1) / 2) / usf
+
+    return target - get_centroids(locations)
+
+
+def _phase_ramps(shifts, shape):
+    """
+    Get the separable z, y and x phase ramps that shift PSFs of a shape.
+    """
+    fz, fy, fx = _frequencies(tuple(shape))
+
+    return (
+        np.exp(-2j * np.pi * np.outer(shifts[:, 0], fz)),
+        np.exp(-2j * np.pi * np.outer(shifts[:, 1], fy)),
+        np.exp(-2j * np.pi * np.outer(shifts[:, 2], fx)),
+    )
+
+
+def _shifted_spectrum_sum(psfs, shifts, workers=None):
+    """
+    Sum the rfftn spectra of PSFs, each shifted by a phase ramp.
+    """
+    spectra = fft.rfftn(np.asarray(psfs), axes=(1, 2, 3), workers=workers)
+    ramp_z, ramp_y, ramp_x = _phase_ramps(shifts, psfs.shape[1:])
+
+    return np.einsum('nzyx,nz,ny,nx->zyx', spectra, ramp_z, ramp_y, ramp_x, optimize=True)
+
+
+def relative_change(psf, previous):
+    """
+    Get the relative L2 change of a PSF, or inf if there is no previous one.
+    """
+    if previous is None:
+        return np.inf
+
+    norm = np.linalg.norm(psf)
+
+    return np.linalg.norm(psf - previous) / norm if norm > 0 else 0.0
+
+
+def align_psfs_progressive(psfs, locations, usf, order=None, tol=PROGRESSIVE_TOL, step=PROGRESSIVE_STEP,
+                           min_beads=PROGRESSIVE_MIN_BEADS, engine='fourier', workers=None):
+    """
+    Align and sum PSFs in steps, until the accumulated PSF has converged.
+
+    This is a generator, which yields the running PSF after every step of
+    beads, such that it can be shown while the alignment continues. It
+    stops once the relative L2 change of the running PSF over a step is
+    below `tol`, or when all beads are aligned.
+
+    Parameters
+    ----------
+    psfs : np.ndarray
+        The PSFs of shape (N, wz, wy, wx).
+    locations : pandas.DataFrame
+        The PSF locations as returned by `psfe.localize_psfs`.
+    usf : int
+        The upsampling factor.
+    order : np.ndarray
+        The order the PSFs are aligned in, best first. Defaults to their order.
+    tol : float
+        The relative L2 change below which the PSF has converged.
+        None aligns all beads.
+    step : int
+        The number of beads aligned between convergence checks.
+    min_beads : int
+        The number of beads aligned before convergence is checked.
+    engine : str
+        The alignment engine, 'fourier' (see `align_psfs_fourier`) or
+        'upsample' (see `align_psf`).
+    workers : int
+        The number of FFT workers.
+
+    Yields
+    ------
+    tuple
+        The running normalized PSF, the number of beads it contains and
+        its relative L2 change over the last step.
+    """
+    usf = int(usf)
+    shape = psfs.shape[1:]
+    order = np.arange(len(psfs)) if order is None else np.asarray(order)
+
+    if engine == 'fourier':
+        shifts = _fourier_shifts(locations, shape, usf)
+        accumulated = np.zeros(_spectrum_shape(shape), dtype=complex)
+    elif engine == 'upsample':
+        centroids = get_centroids(locations)
+        accumulated = np.zeros(tuple(usf * np.array(shape)), dtype=np.float64)
+    else:
+        raise ValueError(f"Unknown alignment engine: {engine}")
+
+    previous = None
+
+    for start in range(0, len(order), step):
+        # Sorted, such that memory-mapped PSFs are read in file order
+        batch = np.sort(order[start:start + step])
+
+        if engine == 'fourier':
+            accumulated += _shifted_spectrum_sum(psfs[batch], shifts[batch], workers)
+            psf = normalize_psf(_fourier_upsample(accumulated, shape, usf, workers=workers))
+        else:
+            for i in batch:
+                accumulated += align_psf(psfs[i], centroids[i], usf)
+            psf = normalize_psf(accumulated)
+
+        n_beads = min(start + step, len(order))
+        change = relative_change(psf, previous)
+
+        yield psf, n_beads, change
+
+        if tol is not None and n_beads >= min_beads and change < tol:
+            return
+
+        previous = psf
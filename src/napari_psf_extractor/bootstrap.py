@@ -0,0 +1,189 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from napari_psf_extractor.alignment import align_psf_stack, align_spectrum_stack, normalize_psf, upsample_spectrum
+from napari_psf_extractor.fitting import measure_fwhm
+from napari_psf_extractor.memory import bootstrap_bytes, format_bytes, plan_memory
+from napari_psf_extractor.utils import lazy_import
+
+pd = lazy_import('pandas')
+
+# State shared with the worker processes, set once per worker by `_init_worker`
+_volumes = None
+_pixel_sizes = None
+_upsampling = None
+
+
+def _init_worker(path, pixel_sizes, upsampling=None):
+    global _volumes, _pixel_sizes, _upsampling
+    # Memory-mapped, such that all workers read the same pages
+    _volumes = np.load(path, mmap_mode='r')
+    _pixel_sizes = pixel_sizes
+    _upsampling = upsampling
+
+
+def _resample_psf(psf_sum, upsampling=None):
+    """
+    Normalize a sum of aligned volumes, or upsample it to the (shape, usf)
+    given by `upsampling` if they are spectra.
+    """
+    if upsampling is not None:
+        return upsample_spectrum(psf_sum, *upsampling)
+
+    return normalize_psf(psf_sum)
+
+
+def _resample_fwhm(counts):
+    """
+    Compute the X, Y and Z FWHM [nm] of the PSF built from a bead resample.
+
+    Parameters
+    ----------
+    counts : np.ndarray
+        How many times each bead was drawn in the resample.
+    """
+    psf_sum = np.tensordot(counts.astype(_volumes.dtype), _volumes, axes=1)
+
+    try:
+        return measure_fwhm(_resample_psf(psf_sum, _upsampling), *_pixel_sizes)
+    except RuntimeError:
+        # Gaussian fit did not converge
+        return np.full(3, np.nan)
+
+
+def bootstrap_fwhm(psfs, locations, usf, psx, psy, psz,
+                   n_resamples=200, confidence=0.95, max_workers=None,
+                   seed=None, return_samples=False, engine='upsample', available=None):
+    """
+    Estimate confidence intervals of the PSF FWHM by bootstrapping the beads.
+
+    Each bead is aligned only once, into a temporary memory-mapped file.
+    A resample is then built as a weighted sum of the aligned volumes,
+    after which its X, Y and Z FWHM are fitted on a process pool. The
+    workers map the file instead of receiving copies.
+
+    The 'fourier' engine keeps the shifted spectrum of every bead and only
+    upsamples the resample sums, as `alignment.align_psfs_fourier` does.
+
+    Parameters
+    ----------
+    psfs : np.ndarray
+        The accepted PSFs of shape (N, wz, wy, wx).
+    locations : pandas.DataFrame
+        The locations of the accepted PSFs.
+    usf : int
+        The upsampling factor.
+    psx : float
+        The pixel size in x-direction [nm/px].
+    psy : float
+        The pixel size in y-direction [nm/px].
+    psz : float
+        The pixel size in z-direction [nm/px].
+    n_resamples : int
+        The number of bootstrap resamples.
+    confidence : float
+        The confidence level of the intervals.
+    max_workers : int
+        The number of worker processes. Defaults to the number of CPUs.
+        Every worker holds one resample at a time.
+    seed : int
+        Seed of the random number generator.
+    return_samples : bool
+        Whether to also return the FWHM of every resample.
+    engine : str
+        The alignment engine, 'upsample' or 'fourier' (see `extractor.localise_psf`).
+    available : int
+        The available memory [bytes]. Defaults to the available system memory.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The FWHM [nm] of the full bead set and the lower and upper bound
+        of its confidence interval, indexed by axis.
+    np.ndarray
+        The FWHM [nm] of every resample, of shape (n_resamples, 3).
+        Only returned if `return_samples` is True.
+
+    Raises
+    ------
+    MemoryError
+        If the bootstrap cannot fit in memory.
+    OSError
+        If the aligned volumes cannot fit in the temporary directory.
+    """
+    if len(psfs) < 2:
+        raise ValueError("At least two PSFs are needed to bootstrap the FWHM.")
+
+    if engine not in ('upsample', 'fourier'):
+        raise ValueError(f"Unknown alignment engine: {engine}")
+
+    pixel_sizes = (psx / usf, psy / usf, psz / usf)
+
+    # Draw resamples (with replacement) as per-bead counts
+    rng = np.random.default_rng(seed)
+    n = len(psfs)
+    draws = rng.integers(0, n, size=(n_resamples, n))
+    counts = np.stack([np.bincount(d, minlength=n) for d in draws])
+
+    max_workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, n_resamples // (4 * max_workers))
+
+    wz, wy, wx = psfs.shape[1:]
+    plan_memory(None, psfs.dtype, n, wx, wy, wz, usf, available=available,
+                bootstrap=True, engine=engine, workers=max_workers)
+
+    # The aligned volumes are written to disk
+    required = bootstrap_bytes(n, wx, wy, wz, usf, engine)
+    free = shutil.disk_usage(tempfile.gettempdir()).free
+
+    if required > free:
+        raise OSError(
+            f"The bootstrap needs about {format_bytes(required)} of disk space "
+            f"in {tempfile.gettempdir()}, but only {format_bytes(free)} is free."
+        )
+
+    tmp = tempfile.mkdtemp(prefix='psf-bootstrap-')
+    path = os.path.join(tmp, 'volumes.npy')
+
+    try:
+        if engine == 'fourier':
+            shape = (n, int(wz), int(wy), int(wx) // 2 + 1)
+            volumes = np.lib.format.open_memmap(path, mode='w+', dtype=np.complex64, shape=shape)
+            align_spectrum_stack(psfs, locations, usf, out=volumes)
+            upsampling = ((int(wz), int(wy), int(wx)), int(usf))
+        else:
+            shape = (n,) + tuple(int(usf) * int(w) for w in psfs.shape[1:])
+            volumes = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+            align_psf_stack(psfs, locations, usf, out=volumes)
+            upsampling = None
+
+        volumes.flush()
+
+        # Workers are spawned, as this may run in a thread of the viewer
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(path, pixel_sizes, upsampling)) as pool:
+            samples = np.array(list(pool.map(_resample_fwhm, counts, chunksize=chunksize)))
+
+        # Point estimate from the full bead set
+        fwhm = measure_fwhm(_resample_psf(volumes.sum(axis=0), upsampling), *pixel_sizes)
+    finally:
+        volumes = None
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    alpha = (1 - confidence) / 2
+    ci_low, ci_high = np.nanquantile(samples, [alpha, 1 - alpha], axis=0)
+
+    result = pd.DataFrame(
+        {'fwhm': fwhm, 'ci_low': ci_low, 'ci_high': ci_high},
+        index=pd.Index(['x', 'y', 'z'], name='axis')
+    )
+
+    if return_samples:
+        return result, samples
+
+    return result
@@ -0,0 +1,201 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from napari_psf_extractor.memory import available_memory
+from napari_psf_extractor.profiling import profiler
+from napari_psf_extractor.utils import normalize
+
+# Upper bound of the default cache size [bytes]
+MAX_CACHE_BYTES = 4 * 1024 ** 3
+
+# Fraction of the available memory the cache may use by default
+CACHE_MEMORY_FRACTION = 0.25
+
+# Size of the slabs an array is hashed in [bytes]
+FINGERPRINT_CHUNK_BYTES = 64 * 1024 ** 2
+
+
+def fingerprint(data):
+    """
+    Fingerprint the content of an array.
+
+    The array is hashed in slabs along its first axis, such that lazy
+    arrays (e.g. dask or memory-mapped layer data) are never loaded at once.
+
+    Parameters
+    ----------
+    data : array-like
+        The array to fingerprint.
+
+    Returns
+    -------
+    tuple
+        The shape, the data type and a hash of the data.
+    """
+    if not hasattr(data, 'shape') or len(data.shape) == 0:
+        # Lists and scalars, as arrays of at least one dimension
+        data = np.ascontiguousarray(data)
+
+    shape, dtype = tuple(data.shape), np.dtype(data.dtype)
+    digest = hashlib.blake2b(digest_size=16)
+
+    item_bytes = dtype.itemsize * int(np.prod(shape[1:]))
+    step = max(1, FINGERPRINT_CHUNK_BYTES // max(item_bytes, 1))
+
+    for start in range(0, shape[0], step):
+        slab = np.ascontiguousarray(data[start:start + step], dtype=dtype)
+        digest.update(slab.reshape(-1).view(np.uint8))
+
+    return shape, str(dtype), digest.hexdigest()
+
+
+@profiler.profile()
+def preprocess_stack(data):
+    """
+    Normalize an image stack and compute its maximum intensity projection.
+    """
+    stack = normalize(np.array(data, dtype=np.float32))
+    mip = np.max(stack, axis=0)
+
+    return stack, mip
+
+
+def _reference(obj):
+    """
+    Get a weak reference to an object, or a strong one if it does not support it.
+    """
+    try:
+        return weakref.ref(obj)
+    except TypeError:
+        return lambda: obj
+
+
+class StackCache:
+    """
+    Memory-bounded LRU cache of preprocessed image stacks.
+
+    Entries are keyed by the identity of the image layer and a fingerprint
+    of its data, so renaming a layer reuses its entry while changed data is
+    never served from the cache. The fingerprint of a layer is only
+    recomputed when its data is replaced or `invalidate` is called.
+    """
+
+    def __init__(self, max_bytes=None):
+        """
+        Parameters
+        ----------
+        max_bytes : int
+            The maximum size of the cached arrays [bytes]. Defaults to a
+            quarter of the available memory, up to 4 GB.
+        """
+        if max_bytes is None:
+            available = available_memory()
+            max_bytes = MAX_CACHE_BYTES if available is None \
+                else min(MAX_CACHE_BYTES, int(CACHE_MEMORY_FRACTION * available))
+
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.entries = OrderedDict()
+
+        # Layer id -> (reference to the layer data, fingerprint)
+        self.fingerprints = {}
+
+        # Layer id -> number of invalidations, to drop stacks computed before one
+        self.generations = {}
+
+        # Layers may be loaded in the background while others are invalidated.
+        # Only the entries are locked, never the hashing or preprocessing.
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, layer):
+        """
+        Get the cache key of an image layer.
+        """
+        data = layer.data
+
+        with self.lock:
+            memo = self.fingerprints.get(id(layer))
+            generation = self.generations.get(id(layer), 0)
+
+        if memo is None or memo[0]() is not data:
+            memo = (_reference(data), fingerprint(data))
+
+            with self.lock:
+                if self.generations.get(id(layer), 0) == generation:
+                    self.fingerprints[id(layer)] = memo
+
+        return id(layer), memo[1]
+
+    def load(self, layer):
+        """
+        Get the normalized stack and MIP of an image layer.
+
+        Parameters
+        ----------
+        layer : napari.layers.Image
+            The image layer.
+
+        Returns
+        -------
+        tuple
+            The normalized stack and its maximum intensity projection.
+        """
+        with self.lock:
+            generation = self.generations.get(id(layer), 0)
+
+        key = self.key(layer)
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        stack, mip = preprocess_stack(layer.data)
+
+        with self.lock:
+            # Not cached if the layer was invalidated meanwhile
+            if self.generations.get(id(layer), 0) == generation:
+                self.put(key, stack, mip)
+
+        return stack, mip
+
+    def put(self, key, stack, mip):
+        """
+        Add an entry, evicting the least recently used ones to stay within budget.
+        """
+        nbytes = stack.nbytes + mip.nbytes
+
+        # Too large to cache at all
+        if nbytes > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self._pop(key)
+
+        while self.entries and self.nbytes + nbytes > self.max_bytes:
+            self._pop(next(iter(self.entries)))
+
+        self.entries[key] = (stack, mip)
+        self.nbytes += nbytes
+
+    def invalidate(self, layer):
+        """
+        Drop all entries of an image layer, e.g. after its data changed in place.
+        """
+        with self.lock:
+            self.generations[id(layer)] = self.generations.get(id(layer), 0) + 1
+            self.fingerprints.pop(id(layer), None)
+
+            for key in [key for key in self.entries if key[0] == id(layer)]:
+                self._pop(key)
+
+    def _pop(self, key):
+        stack, mip = self.entries.pop(key)
+        self.nbytes -= stack.nbytes + mip.nbytes
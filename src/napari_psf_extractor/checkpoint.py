@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from napari_psf_extractor.utils import lazy_import
+
+pd = lazy_import('pandas')
+
+# Environment variable with the checkpoint directory
+CHECKPOINT_ENV = 'NAPARI_PSF_EXTRACTOR_CHECKPOINTS'
+
+MANIFEST_NAME = 'manifest.json'
+
+# Number of PSF windows per chunk file
+CHECKPOINT_CHUNK_SIZE = 1024
+
+
+def default_root():
+    """
+    Get the checkpoint directory, from the environment or the user cache.
+    """
+    root = os.environ.get(CHECKPOINT_ENV)
+
+    if root:
+        return root
+
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(cache, 'napari-psf-extractor', 'checkpoints')
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+
+    raise TypeError(f"Cannot serialize {type(value).__name__} in checkpoint parameters.")
+
+
+def params_hash(params):
+    """
+    Hash stage parameters, independently of their order.
+    """
+    text = json.dumps(params, sort_keys=True, default=_json_default)
+
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+def _plain(values):
+    """
+    Get an array that can be stored without pickling, e.g. strings from objects.
+    """
+    if values.dtype == object and all(isinstance(v, str) for v in values):
+        values = values.astype(str)
+
+    if values.dtype.hasobject:
+        raise TypeError("Cannot store Python objects in checkpoints.")
+
+    return values
+
+
+class CheckpointStore:
+    """
+    Store of the outputs of pipeline stages, keyed by stack and parameters.
+
+    A stage output is a dict of named values, each either a numpy array,
+    a pandas DataFrame or None, stored without pickling under
+    <root>/<stack hash>/<stage>-<parameters hash>/. A stage only counts as
+    saved once its manifest is written, which happens last.
+    """
+
+    def __init__(self, root=None, chunk_size=CHECKPOINT_CHUNK_SIZE):
+        """
+        Parameters
+        ----------
+        root : str
+            The checkpoint directory. Defaults to `default_root()`.
+        chunk_size : int
+            The number of items per chunk file of arrays.
+        """
+        self.root = root or default_root()
+        self.chunk_size = chunk_size
+
+    def path(self, stack_key, stage, params):
+        return os.path.join(self.root, stack_key, f"{stage}-{params_hash(params)}")
+
+    def has(self, stack_key, stage, params):
+        return os.path.exists(os.path.join(self.path(stack_key, stage, params), MANIFEST_NAME))
+
+    def save(self, stack_key, stage, params, outputs):
+        """
+        Write the outputs of a stage.
+
+        Parameters
+        ----------
+        stack_key : str
+            The fingerprint of the image stack.
+        stage : str
+            The name of the stage.
+        params : dict
+            The JSON-serializable parameters that produced the outputs.
+        outputs : dict
+            The outputs, by name.
+        """
+        path = self.path(stack_key, stage, params)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write next to the final directory, and move it in place when complete
+        tmp = tempfile.mkdtemp(prefix=f".{stage}-", dir=os.path.dirname(path))
+
+        try:
+            entries = {}
+
+            for name, value in outputs.items():
+                entries[name] = self._write(tmp, name, value)
+
+            with open(os.path.join(tmp, MANIFEST_NAME), 'w') as f:
+                json.dump({'stage': stage, 'params': params, 'outputs': entries},
+                          f, indent=2, default=_json_default)
+
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.replace(tmp, path)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def load(self, stack_key, stage, params, mmap_mode=None):
+        """
+        Read the outputs of a stage.
+
+        Parameters
+        ----------
+        mmap_mode : str
+            If given, arrays stored in a single chunk are memory-mapped
+            with this mode (see `np.load`). Arrays stored in several chunks
+            are always reassembled in a memory-mapped temporary file.
+
+        Returns
+        -------
+        dict
+            The outputs by name, or None if there is no valid checkpoint.
+        """
+        path = self.path(stack_key, stage, params)
+
+        try:
+            with open(os.path.join(path, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+
+            return {
+                name: self._read(path, entry, mmap_mode)
+                for name, entry in manifest['outputs'].items()
+            }
+        except (OSError, ValueError, KeyError):
+            # Missing, incomplete or corrupt checkpoint
+            return None
+
+    def clear(self, stack_key=None):
+        """
+        Delete the checkpoints of a stack, or all of them.
+        """
+        path = self.root if stack_key is None else os.path.join(self.root, stack_key)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def _write(self, path, name, value):
+        if value is None:
+            return {'kind': 'none'}
+
+        if isinstance(value, pd.DataFrame):
+            # One array per column, by position as names need not be strings
+            arrays = {f"column_{i}": _plain(value.iloc[:, i].to_numpy()) for i in range(value.shape[1])}
+            np.savez(os.path.join(path, f"{name}.npz"), index=_plain(value.index.to_numpy()), **arrays)
+
+            return {
+                'kind': 'dataframe', 'file': f"{name}.npz",
+                'columns': value.columns.tolist(), 'index': value.index.name,
+            }
+
+        # Arrays, e.g. memory-mapped PSFs, are copied chunk by chunk
+        files = []
+        for i, start in enumerate(range(0, max(len(value), 1), self.chunk_size)):
+            file = f"{name}_{i:05d}.npy"
+            np.save(os.path.join(path, file), np.asarray(value[start:start + self.chunk_size]), allow_pickle=False)
+            files.append(file)
+
+        return {
+            'kind': 'array', 'files': files,
+            'shape': list(np.shape(value)), 'dtype': str(np.asarray(value[:0]).dtype),
+        }
+
+    def _read(self, path, entry, mmap_mode):
+        if entry['kind'] == 'none':
+            return None
+
+        if entry['kind'] == 'dataframe':
+            with np.load(os.path.join(path, entry['file']), allow_pickle=False) as arrays:
+                columns = [arrays[f"column_{i}"] for i in range(len(entry['columns']))]
+                index = pd.Index(arrays['index'], name=entry['index'])
+
+            value = pd.DataFrame(dict(enumerate(columns)), index=index)
+            value.columns = entry['columns']
+
+            return value
+
+        files = [os.path.join(path, file) for file in entry['files']]
+
+        if len(files) == 1:
+            value = np.load(files[0], mmap_mode=mmap_mode, allow_pickle=False)
+        else:
+            # Copy the chunks one by one into a file instead of concatenating them in memory
+            value = np.memmap(tempfile.TemporaryFile(), dtype=entry['dtype'], shape=tuple(entry['shape']))
+            n = 0
+
+            for file in files:
+                chunk = np.load(file, mmap_mode='r', allow_pickle=False)
+
+                if n + len(chunk) > len(value):
+                    raise ValueError(f"Checkpoint {path} is corrupt.")
+
+                value[n:n + len(chunk)] = chunk
+                n += len(chunk)
+
+            value = value[:n]
+
+        if list(value.shape) != entry['shape']:
+            raise ValueError(f"Checkpoint {path} is incomplete.")
+
+        return value
@@ -0,0 +1,65 @@
+import numpy as np
+from qtpy.QtCore import Qt, QRectF
+from qtpy.QtGui import QColor, QPainter
+from qtpy.QtWidgets import QWidget
+
+
+class Histogram(QWidget):
+    """
+    Bar plot of a precomputed histogram, with the selected range highlighted.
+    """
+
+    def __init__(self, height=40):
+        super().__init__()
+
+        self.counts = np.zeros(0)
+        self.edges = np.zeros(1)
+        self.selection = (-np.inf, np.inf)
+
+        self.setFixedHeight(height)
+
+    def set_histogram(self, counts, edges):
+        """
+        Set the histogram to draw.
+
+        Parameters
+        ----------
+        counts : np.ndarray
+            The counts per bin.
+        edges : np.ndarray
+            The bin edges.
+        """
+        self.counts = np.asarray(counts)
+        self.edges = np.asarray(edges)
+        self.update()
+
+    def set_selection(self, low, high):
+        """
+        Set the selected range, in the units of the bin edges.
+        """
+        self.selection = (low, high)
+        self.update()
+
+    def paintEvent(self, event):
+        if len(self.counts) == 0 or self.counts.max() == 0:
+            return
+
+        painter = QPainter(self)
+        painter.setPen(Qt.NoPen)
+
+        width, height = self.width(), self.height()
+        bar_width = width / len(self.counts)
+
+        # Log scale, such that sparse bright features remain visible
+        heights = np.log1p(self.counts) / np.log1p(self.counts.max()) * height
+
+        low, high = self.selection
+        centers = (self.edges[:-1] + self.edges[1:]) / 2
+        selected = (centers > low) & (centers < high)
+
+        for i, bar_height in enumerate(heights):
+            color = QColor('#00ff00') if selected[i] else QColor('#808080')
+            painter.setBrush(color)
+            painter.drawRect(QRectF(i * bar_width, height - bar_height, bar_width, bar_height))
+
+        painter.end()
@@ -2,8 +2,6 @@ from napari.utils.notifications import show_error
 from qtpy.QtCore import Signal
 from qtpy.QtWidgets import QLineEdit, QHBoxLayout, QCheckBox, QWidget, QVBoxLayout, QLabel, QPushButton
 
-from napari_psf_extractor.extractor import extract_psf, filter_pcc
-
 
 class PCCWidget(QWidget):
     changed = Signal()
@@ -87,20 +85,38 @@ class PCCWidget(QWidget):
         if self.value() is None or features is None:
             return
 
+        # Measure the auto window off the GUI thread first
+        if not self.widget.window_measured(features):
+            self.widget.measure_window(features, self.filter)
+            return
+
         try:
-            psfs, features_extracted = extract_psf(
+            window = self.widget.psf_window(features)
+            params = self.widget.checkpoint_params(window, pcc_min=self.value())
+            checkpoint = self.widget.load_checkpoint('features_pearson', params)
+
+            if checkpoint is not None:
+                self.set_features_label(checkpoint['features'])
+                self.widget.extract_button.setEnabled(True)
+                self.widget.features_pearson = checkpoint['features']
+                return
+
+            plan = self.widget.memory_plan(self.widget.features.count)
+            wz, wy, wx = window
+
+            features_pcc = self.widget.run_job(
+                'filter_pcc',
+                self.widget.stack,
+                pcc_min=self.value(),
                 min_mass=self.widget.mass_slider.value()[0],
                 max_mass=self.widget.mass_slider.value()[1],
-                stack=self.widget.stack,
                 features=features,
-                wx=self.widget.wx, wy=self.widget.wy, wz=self.widget.wz,
+                wx=wx, wy=wy, wz=wz,
+                batch_size=plan['batch_size'], memmap=plan['memmap'],
+                mass_index=self.widget.features.get_mass_index()
             )
 
-            features_pcc = filter_pcc(
-                pcc_min=self.value(),
-                features=features_extracted,
-                psfs=psfs
-            )
+            self.widget.save_checkpoint('features_pearson', params, features=features_pcc)
 
             self.set_features_label(features_pcc)
             self.widget.extract_button.setEnabled(True)
@@ -0,0 +1,32 @@
+from qtpy.QtWidgets import QVBoxLayout, QWidget
+
+from napari_psf_extractor.plotting import PSFFigure
+from napari_psf_extractor.utils import lazy_import
+
+backend_qtagg = lazy_import('matplotlib.backends.backend_qtagg')
+figure = lazy_import('matplotlib.figure')
+
+
+class PSFView(QWidget):
+    """
+    Dock widget showing the extracted PSF.
+
+    The figure is kept between extractions and only redrawn when the PSF changes.
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        self.canvas = backend_qtagg.FigureCanvasQTAgg(figure.Figure(figsize=(6, 6)))
+        self.psf_figure = PSFFigure(self.canvas.figure)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.canvas)
+        self.setLayout(layout)
+
+    def set_psf(self, psf, psx, psy, psz):
+        """
+        Show a PSF; see `PSFFigure.update`.
+        """
+        if self.psf_figure.update(psf, psx, psy, psz):
+            self.canvas.draw_idle()
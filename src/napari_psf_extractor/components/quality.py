@@ -0,0 +1,270 @@
+from napari._qt.qthreading import thread_worker
+from napari.utils.notifications import show_error
+from qtpy.QtCore import Signal
+from qtpy.QtWidgets import QCheckBox, QFormLayout, QLabel, QLineEdit, QPushButton, QVBoxLayout, QWidget
+
+from napari_psf_extractor.featureset import FeatureSet
+from napari_psf_extractor.quality import saturation_level
+
+
+class QualityWidget(QWidget):
+    """
+    Panel to measure the quality of every bead once, and filter them by
+    any combination of thresholds without extracting them again.
+    """
+
+    changed = Signal()
+
+    # Column, bound ('min' or 'max'), label and default of every threshold
+    THRESHOLDS = [
+        ('snr', 'min', "Min SNR", "10"),
+        ('saturation', 'max', "Max saturation", "0"),
+        ('ellipticity', 'max', "Max ellipticity", "0.3"),
+        ('z_focus', 'max', "Max |z focus| [px]", ""),
+    ]
+
+    def __init__(self, widget):
+        super().__init__()
+
+        self.widget = widget
+        self.checkbox = QCheckBox("Quality index")
+        self.compute_button = QPushButton("Measure beads")
+        self.features_label = QLabel("Remaining features:")
+        self.saturation_edit = QLineEdit()
+        self.saturation_edit.setPlaceholderText("dtype max")
+        self.saturation_edit.setToolTip("Raw intensity at which the detector saturates")
+        self.edits = {}
+
+        # Features of the last measurement, with the metrics as columns
+        self.feature_set = None
+        self.measured_with = None
+        self.running = False
+
+        # Parameters of the last measurement, such that its features can be reused
+        self.measured_params = None
+
+        # Layout
+        layout = QVBoxLayout()
+        layout.addWidget(self.checkbox)
+
+        self.form = QWidget()
+        form_layout = QFormLayout()
+        form_layout.addRow("Saturation level", self.saturation_edit)
+        form_layout.addRow(self.compute_button)
+
+        for column, bound, label, default in self.THRESHOLDS:
+            edit = QLineEdit(default)
+            edit.setPlaceholderText("None")
+            edit.textChanged.connect(self.filter)
+            self.edits[column] = edit
+            form_layout.addRow(label, edit)
+
+        form_layout.addRow(self.features_label)
+        self.form.setLayout(form_layout)
+        layout.addWidget(self.form)
+
+        self.setLayout(layout)
+        self.update_checkbox()
+
+        # Signals
+        self.checkbox.stateChanged.connect(self.update_checkbox)
+        self.compute_button.clicked.connect(self.compute)
+
+    def update_checkbox(self):
+        if self.checkbox.isChecked():
+            self.form.show()
+        else:
+            self.form.hide()
+
+        self.changed.emit()
+
+    def bounds(self):
+        """
+        Get the thresholds as `FeatureSet.threshold_mask` bounds.
+
+        Raises a ValueError if a threshold is not a number.
+        """
+        bounds = {}
+
+        for column, bound, label, default in self.THRESHOLDS:
+            text = self.edits[column].text().strip()
+
+            if not text:
+                continue
+
+            value = float(text)
+
+            if column == 'z_focus':
+                bounds[column] = (-value, value)
+            else:
+                bounds[column] = (value, None) if bound == 'min' else (None, value)
+
+        return bounds
+
+    def is_active(self):
+        """
+        Check if extracted beads should be filtered by quality.
+        """
+        return self.checkbox.isChecked() and self.feature_set is not None
+
+    def params(self):
+        """
+        Get the thresholds, as stored in checkpoints. None if not filtering.
+        """
+        if not self.is_active():
+            return None
+
+        return {column: list(bound) for column, bound in self.bounds().items()}
+
+    def keep(self, features):
+        """
+        Get the mask of the given features that pass the thresholds.
+
+        Features that were not measured are dropped.
+        """
+        mask = self.feature_set.threshold_mask(**self.bounds())
+        positions = self.feature_set.positions(features.index.to_numpy())
+
+        return (positions >= 0) & mask[positions]
+
+    def select(self, params, features=None):
+        """
+        Get the measured features that pass the thresholds, among the given ones.
+
+        Only the metrics are kept, so the windows of the selected features are
+        extracted again rather than held in memory until the next measurement.
+
+        Parameters
+        ----------
+        params : dict
+            The parameters the windows are wanted with, as given by
+            `MainWidget.checkpoint_params`.
+        features : pandas.DataFrame
+            The features to select. Defaults to all the measured ones.
+
+        Returns
+        -------
+        pandas.DataFrame or None
+            The features, or None if the beads were measured with other
+            parameters or without some of the features.
+        """
+        if not self.is_active() or self.measured_params != dict(params, stack=self.widget.stack_key):
+            return None
+
+        if features is None:
+            features = self.measured_with
+
+        positions = FeatureSet.from_dataframe(self.measured_with).positions(features.index.to_numpy())
+
+        if (positions < 0).any():
+            return None
+
+        keep = positions[self.keep(features)]
+
+        if len(keep) == 0:
+            raise ValueError("No beads pass the quality thresholds.")
+
+        return self.measured_with.iloc[keep]
+
+    @thread_worker
+    def compute_factory(self, params, data, level):
+        """
+        Create a worker extracting the beads of the mass range and measuring them.
+
+        Saturation is measured against the raw level of the layer data, as the
+        brightest voxel of the normalized stack is always at 1.
+        """
+        return self.widget.run_job('quality_metrics', saturation=saturation_level(data, level), **params)
+
+    def compute(self):
+        """
+        Measure the beads of the current mass range.
+        """
+        features = self.widget.features.get_features()
+
+        if features is None or self.running:
+            return
+
+        # Measure the auto window off the GUI thread first
+        if not self.widget.window_measured(features):
+            self.widget.measure_window(features, self.compute)
+            return
+
+        try:
+            plan = self.widget.memory_plan(self.widget.features.count)
+            text = self.saturation_edit.text().strip()
+            level = float(text) if text else None
+        except (MemoryError, ValueError) as e:
+            show_error(f"Error: {e}")
+            return
+
+        window = self.widget.psf_window(features)
+        wz, wy, wx = window
+        min_mass, max_mass = self.widget.mass_slider.value()
+
+        params = dict(
+            min_mass=min_mass, max_mass=max_mass,
+            stack=self.widget.stack, features=features,
+            wx=wx, wy=wy, wz=wz,
+            batch_size=plan['batch_size'], memmap=plan['memmap'],
+            mass_index=self.widget.features.get_mass_index()
+        )
+
+        self.running = True
+        self.compute_button.setEnabled(False)
+        self.widget.status.start_loading_animation("Measuring beads... ")
+
+        measured_params = dict(self.widget.checkpoint_params(window), stack=self.widget.stack_key)
+
+        worker = self.compute_factory(params, self.widget.image_layer.data, level)
+        worker.returned.connect(lambda result: self.set_metrics(features, *result, params=measured_params))
+        worker.errored.connect(self.show_compute_error)
+        worker.start()
+
+    def finish(self):
+        self.running = False
+        self.compute_button.setEnabled(True)
+        self.widget.status.stop_animation()
+
+    def show_compute_error(self, e):
+        self.finish()
+        show_error(f"Error: {e}")
+
+    def set_metrics(self, features, features_extracted, metrics, params=None):
+        """
+        Store the metrics as columns of the located features, with the
+        parameters the beads were extracted with.
+        """
+        self.finish()
+
+        self.feature_set = FeatureSet.from_dataframe(features)
+        self.feature_set.set_columns(metrics, ids=features_extracted.index.to_numpy())
+        self.measured_with = features_extracted
+        self.measured_params = params
+
+        self.filter()
+
+    def filter(self):
+        """
+        Update the features label when a threshold changes.
+        """
+        if self.feature_set is None or self.measured_with is None:
+            return
+
+        try:
+            remaining = int(self.keep(self.measured_with).sum())
+        except ValueError:
+            self.features_label.setText("Remaining features: thresholds must be numbers")
+            return
+
+        self.features_label.setText(f"Remaining features: {remaining} of {len(self.measured_with)}")
+        self.changed.emit()
+
+    def reset(self):
+        """
+        Forget the measurement, e.g. after features are located again.
+        """
+        self.feature_set = None
+        self.measured_with = None
+        self.measured_params = None
+        self.features_label.setText("Remaining features:")
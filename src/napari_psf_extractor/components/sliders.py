@@ -1,8 +1,11 @@
+import numpy as np
 from napari.utils.notifications import show_error
 from qtpy.QtCore import Qt, QTimer
 from qtpy.QtWidgets import QLabel, QLineEdit, QHBoxLayout, QVBoxLayout, QWidget
 from superqt import QRangeSlider
 
+from napari_psf_extractor.components.histogram import Histogram
+
 
 class RangeSlider(QWidget):
     """
@@ -32,6 +35,9 @@ class RangeSlider(QWidget):
         self.slider.setRange(min_value, max_value)
         self.slider.setValue((min_value, max_value))
 
+        self.histogram = Histogram()
+        self.histogram.hide()
+
         self.min_label = QLabel("Min:")
         self.max_label = QLabel("Max:")
         self.min_value_edit = QLineEdit(str(min_value))
@@ -46,6 +52,7 @@ class RangeSlider(QWidget):
 
         layout = QVBoxLayout()
         layout.addLayout(input_layout)
+        layout.addWidget(self.histogram)
         layout.addWidget(self.slider)
         if result_label is not None:
             layout.addWidget(result_label)
@@ -68,6 +75,7 @@ class RangeSlider(QWidget):
         mass_range = self.slider.value()
         self.min_value_edit.setText(str(mass_range[0] / 10))
         self.max_value_edit.setText(str(mass_range[1] / 10))
+        self.histogram.set_selection(*self.value())
 
         # Restart the timer
         if self.timer.isActive():
@@ -93,6 +101,28 @@ class RangeSlider(QWidget):
 
         self.slider.setValue((min_value, max_value))
 
+    def set_histogram(self, counts, edges):
+        """
+        Show a precomputed histogram above the slider and fit the slider range to it.
+
+        Parameters
+        ----------
+        counts : np.ndarray
+            The counts per bin.
+        edges : np.ndarray
+            The bin edges, in the units of the slider values.
+        """
+        # Widen by one unit, as the range bounds are exclusive
+        min_value = int(np.floor(edges[0] * 10)) - 1
+        max_value = int(np.ceil(edges[-1] * 10)) + 1
+
+        self.slider.setRange(max(min_value, 0), max_value)
+        self.reset()
+
+        self.histogram.set_histogram(counts, edges)
+        self.histogram.set_selection(*self.value())
+        self.histogram.show()
+
     def reset(self):
         """
         Reset the range slider to its initial state.
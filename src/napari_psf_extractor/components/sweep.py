@@ -0,0 +1,184 @@
+from napari._qt.qthreading import thread_worker
+from napari.utils.notifications import show_error, show_info
+from qtpy.QtWidgets import (QCheckBox, QFormLayout, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem,
+                            QVBoxLayout, QWidget)
+
+from napari_psf_extractor.memory import plan_memory, plan_workers
+from napari_psf_extractor.sweep import select_mass_ranges
+
+
+def parse_values(text, cast=float):
+    """
+    Parse comma-separated values.
+    """
+    return [cast(value) for value in text.replace(';', ',').split(',') if value.strip()]
+
+
+def parse_mass_ranges(text):
+    """
+    Parse comma-separated 'min-max' mass ranges.
+    """
+    ranges = []
+
+    for value in text.replace(';', ',').split(','):
+        if value.strip():
+            min_mass, max_mass = value.split('-')
+            ranges.append((float(min_mass), float(max_mass)))
+
+    return ranges
+
+
+class SweepWidget(QWidget):
+    """
+    Panel to run the extraction over a grid of mass ranges, PCC thresholds
+    and upsampling factors, and tabulate the resulting FWHM.
+    """
+
+    COLUMNS = ['min_mass', 'max_mass', 'pcc_min', 'usf', 'beads', 'fwhm_x', 'fwhm_y', 'fwhm_z', 'time']
+
+    def __init__(self, widget):
+        super().__init__()
+
+        self.widget = widget
+        self.checkbox = QCheckBox("Parameter sweep")
+        self.mass_ranges = QLineEdit()
+        self.mass_ranges.setPlaceholderText("e.g. 10-100, 20-100")
+        self.pcc_mins = QLineEdit("0.5, 0.7, 0.9")
+        self.usfs = QLineEdit()
+        self.usfs.setPlaceholderText("e.g. 3, 5")
+        self.run_button = QPushButton("Run sweep")
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+
+        self.results = None
+        self.running = False
+
+        # Layout
+        layout = QVBoxLayout()
+        layout.addWidget(self.checkbox)
+
+        self.form = QWidget()
+        form_layout = QFormLayout()
+        form_layout.addRow("Mass ranges", self.mass_ranges)
+        form_layout.addRow("PCC min", self.pcc_mins)
+        form_layout.addRow("USF", self.usfs)
+        form_layout.addRow(self.run_button)
+        form_layout.addRow(self.table)
+        self.form.setLayout(form_layout)
+        layout.addWidget(self.form)
+
+        self.setLayout(layout)
+        self.update_checkbox()
+
+        # Signals
+        self.checkbox.stateChanged.connect(self.update_checkbox)
+        self.run_button.clicked.connect(self.run)
+
+    def update_checkbox(self):
+        if not self.checkbox.isChecked():
+            self.form.hide()
+            return
+
+        self.form.show()
+
+        # Start from the current parameters
+        if not self.mass_ranges.text():
+            min_mass, max_mass = self.widget.mass_slider.value()
+            self.mass_ranges.setText(f"{min_mass:g}-{max_mass:g}")
+
+        if not self.usfs.text() and hasattr(self.widget, 'usf'):
+            self.usfs.setText(f"{self.widget.usf:g}")
+
+    @thread_worker
+    def sweep_factory(self, params):
+        """
+        Create a worker running the sweep.
+        """
+        return self.widget.run_job('run_sweep', **params)
+
+    def run(self):
+        """
+        Run the sweep on the current features.
+        """
+        features = self.widget.features.get_features()
+
+        if features is None or self.running:
+            return
+
+        # Measure the auto window off the GUI thread first
+        if not self.widget.window_measured(features):
+            self.widget.measure_window(features, self.run)
+            return
+
+        try:
+            mass_ranges = parse_mass_ranges(self.mass_ranges.text())
+            pcc_mins = parse_values(self.pcc_mins.text()) or [None]
+            usfs = parse_values(self.usfs.text(), int)
+        except ValueError:
+            show_error("Error: Mass ranges must be 'min-max' pairs, PCCs and USFs numbers.")
+            return
+
+        if not mass_ranges or not usfs:
+            show_error("Error: Please enter at least one mass range and USF.")
+            return
+
+        wz, wy, wx = self.widget.psf_window(features)
+        stack = self.widget.stack
+        mass_index = self.widget.features.get_mass_index()
+
+        # Plan for the windows of all mass ranges, aligned at the largest USF by every worker
+        try:
+            masks = select_mass_ranges(stack, features, mass_ranges, wx, wy, mass_index)
+            n_features = int(masks.any(axis=0).sum())
+            plan = plan_memory(stack.shape, stack.dtype, n_features, wx, wy, wz, max(usfs))
+            max_workers = plan_workers(plan, stack.shape, n_features)
+        except MemoryError as e:
+            show_error(f"Error: {e}")
+            return
+
+        params = dict(
+            stack=stack, features=features,
+            mass_ranges=mass_ranges, pcc_mins=pcc_mins, usfs=usfs,
+            wx=wx, wy=wy, wz=wz,
+            psx=self.widget.psx, psy=self.widget.psy, psz=self.widget.psz,
+            mass_index=mass_index,
+            engine='fourier' if self.widget.fourier_checkbox.isChecked() else 'upsample',
+            max_workers=max_workers, batch_size=plan['batch_size'], memmap=plan['memmap']
+        )
+
+        self.running = True
+        self.run_button.setEnabled(False)
+        self.widget.status.start_loading_animation("Running sweep... ")
+
+        worker = self.sweep_factory(params)
+        worker.returned.connect(self.show_results)
+        worker.errored.connect(self.show_sweep_error)
+        worker.start()
+
+    def finish(self):
+        self.running = False
+        self.run_button.setEnabled(True)
+        self.widget.status.stop_animation()
+
+    def show_sweep_error(self, e):
+        self.finish()
+        show_error(f"Error: {e}")
+
+    def show_results(self, results):
+        """
+        Fill the table with the results of a sweep.
+        """
+        self.finish()
+        self.results = results
+
+        self.table.setRowCount(len(results))
+
+        for row, values in enumerate(results[self.COLUMNS].itertuples(index=False)):
+            for column, value in enumerate(values):
+                text = "" if value is None else f"{value:.3g}" if isinstance(value, float) else str(value)
+                self.table.setItem(row, column, QTableWidgetItem(text))
+
+        timings = results.attrs.get('timings', {})
+        show_info(f"Sweep of {len(results)} runs done. Shared stages: " + ", ".join(
+            f"{stage} {seconds:.1f} s" for stage, seconds in timings.items()
+        ))
@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Number of PSFs correlated at once
+PCC_CHUNK_SIZE = 512
+
+
+def mean_psf(psfs, chunk_size=PCC_CHUNK_SIZE):
+    """
+    Compute the mean PSF, in chunks such that memory-mapped PSFs are read once.
+    """
+    psf_sum = np.zeros(psfs.shape[1:], dtype=np.float64)
+
+    for start in range(0, len(psfs), chunk_size):
+        psf_sum += np.sum(psfs[start:start + chunk_size], axis=0, dtype=np.float64)
+
+    return psf_sum / max(len(psfs), 1)
+
+
+def batch_pcc(psfs, reference=None, dtype=np.float32, chunk_size=PCC_CHUNK_SIZE, max_workers=None):
+    """
+    Compute the Pearson correlation coefficient of every PSF with a reference.
+
+    The PSFs are flattened and correlated in chunks, each chunk being
+    centered, normalized and multiplied with the centered reference in a
+    single matrix-vector product on a thread pool.
+
+    Parameters
+    ----------
+    psfs : np.ndarray
+        The PSFs of shape (N, wz, wy, wx).
+    reference : np.ndarray
+        The reference PSF of shape (wz, wy, wx). Defaults to the mean PSF.
+    dtype : np.dtype
+        The data type of the computation. float32 halves the memory
+        bandwidth at a precision of about 1e-6.
+    chunk_size : int
+        The number of PSFs per chunk.
+    max_workers : int
+        The number of threads. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    np.ndarray
+        The PCC of every PSF.
+    """
+    n = len(psfs)
+    pccs = np.zeros(n, dtype=np.float64)
+
+    if n == 0:
+        return pccs
+
+    if reference is None:
+        reference = mean_psf(psfs, chunk_size)
+
+    # Center and normalize the reference once
+    ref = np.asarray(reference, dtype=np.float64).ravel()
+    ref = ref - ref.mean()
+    ref_norm = np.linalg.norm(ref)
+    ref = (ref / ref_norm if ref_norm > 0 else ref).astype(dtype)
+
+    def correlate(start):
+        chunk = np.asarray(psfs[start:start + chunk_size], dtype=dtype).reshape(-1, ref.size)
+        chunk = chunk - chunk.mean(axis=1, keepdims=True)
+
+        norms = np.linalg.norm(chunk, axis=1)
+        norms[norms == 0] = np.inf
+
+        pccs[start:start + len(chunk)] = (chunk @ ref) / norms
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        list(pool.map(correlate, range(0, n, chunk_size)))
+
+    return pccs
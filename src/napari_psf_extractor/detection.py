@@ -0,0 +1,181 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from napari_psf_extractor.profiling import profiler
+from napari_psf_extractor.utils import lazy_import
+
+pd = lazy_import('pandas')
+trackpy = lazy_import('trackpy')
+
+# Height of bead-centered windows, in axial FWHMs of the beads
+AXIAL_WINDOW_FWHMS = 3
+
+
+def z_chunks(nz, chunk_size, overlap):
+    """
+    Split a z range into chunks that overlap their neighbours.
+
+    Parameters
+    ----------
+    nz : int
+        The number of slices.
+    chunk_size : int
+        The number of slices each chunk owns.
+    overlap : int
+        The number of extra slices read on each side of a chunk.
+
+    Returns
+    -------
+    list
+        Tuples (start, stop, own_start, own_stop) of the slices read and
+        of the slices whose features the chunk keeps.
+    """
+    chunks = []
+
+    for own_start in range(0, nz, chunk_size):
+        own_stop = min(own_start + chunk_size, nz)
+        chunks.append((max(own_start - overlap, 0), min(own_stop + overlap, nz), own_start, own_stop))
+
+    return chunks
+
+
+@profiler.profile()
+def locate_3d(stack, diameter, chunk_size=None, overlap=None, max_workers=None, **kwargs):
+    """
+    Locate features in 3D, on overlapping z-chunks of the stack in parallel.
+
+    Each chunk only keeps the features centered in the slices it owns, such
+    that features in the overlap are not found twice.
+
+    Parameters
+    ----------
+    stack : np.ndarray
+        The image stack.
+    diameter : tuple
+        The (z, y, x) feature diameters [px], odd integers.
+    chunk_size : int
+        The number of slices owned by each chunk. Defaults to four axial diameters.
+    overlap : int
+        The number of slices shared with neighbouring chunks.
+        Defaults to one axial diameter.
+    max_workers : int
+        The number of threads. Defaults to the number of CPUs.
+    **kwargs
+        Passed on to `trackpy.locate`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The features found, with their z, y and x position [px].
+    """
+    dz = int(diameter[0])
+    chunk_size = chunk_size or 4 * dz
+    overlap = dz if overlap is None else overlap
+
+    def locate(chunk):
+        start, stop, own_start, own_stop = chunk
+
+        # Chunks must be at least a diameter deep
+        if stop - start < dz:
+            return None
+
+        features = trackpy.locate(stack[start:stop], diameter=tuple(diameter), **kwargs)
+        features['z'] += start
+
+        return features[(features['z'] >= own_start) & (features['z'] < own_stop)]
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        results = [f for f in pool.map(locate, z_chunks(len(stack), chunk_size, overlap)) if f is not None]
+
+    if not results:
+        return trackpy.locate(stack, diameter=tuple(diameter), **kwargs).reset_index(drop=True)
+
+    return pd.concat(results).reset_index(drop=True)
+
+
+def axial_window(stack, features, min_wz, max_wz, fwhms=AXIAL_WINDOW_FWHMS):
+    """
+    Get the height of bead-centered windows from the axial extent of located beads.
+
+    The extent is the median full width at half maximum of the axial
+    profiles through the bead centers, above their background.
+
+    Parameters
+    ----------
+    stack : np.ndarray
+        The image stack.
+    features : pandas.DataFrame
+        The features, with z, y and x positions [px].
+    min_wz, max_wz : int
+        The bounds of the window height [px].
+    fwhms : float
+        The window height in axial FWHMs.
+
+    Returns
+    -------
+    int
+        The odd window height [px], `max_wz` if no bead could be measured.
+    """
+    nz = len(stack)
+    centers = np.round(features[['z', 'y', 'x']].to_numpy(dtype=float)).astype(int)
+    centers = centers[np.all((centers >= 0) & (centers < np.array(stack.shape)), axis=1)]
+
+    if len(centers) == 0:
+        return int(max_wz)
+
+    z, y, x = centers.T
+    profiles = np.asarray(stack[:, y, x], dtype=float).T
+    background = np.percentile(profiles, 10, axis=1)
+    peak = profiles[np.arange(len(profiles)), z]
+
+    # Slices around each center above half maximum
+    below = profiles < ((background + peak) / 2)[:, None]
+    slices = np.arange(nz)
+    first = np.where(below & (slices < z[:, None]), slices, -1).max(axis=1) + 1
+    last = np.where(below & (slices > z[:, None]), slices, nz).min(axis=1) - 1
+    fwhm = np.median(last - first + 1)
+
+    wz = int(np.ceil(fwhms * fwhm)) // 2 * 2 + 1
+
+    return int(np.clip(wz, min_wz, max_wz))
+
+
+def extract_windows(stack, features, shape):
+    """
+    Extract PSF windows centered on 3D feature positions.
+
+    Windows that do not fit in the stack are skipped.
+
+    Parameters
+    ----------
+    stack : np.ndarray
+        The image stack.
+    features : pandas.DataFrame
+        The features, with z, y and x positions [px].
+    shape : tuple
+        The (wz, wy, wx) window size [px].
+
+    Returns
+    -------
+    np.ndarray
+        The PSFs of shape (N, wz, wy, wx).
+    pandas.DataFrame
+        The features the PSFs were extracted for.
+    """
+    shape = np.asarray(shape, dtype=int)
+    centers = np.round(features[['z', 'y', 'x']].to_numpy(dtype=float)).astype(int)
+    starts = centers - shape // 2
+    stops = starts + shape
+
+    inside = np.all((starts >= 0) & (stops <= np.array(stack.shape)), axis=1)
+    positions = np.flatnonzero(inside)
+
+    psfs = np.empty((len(positions),) + tuple(shape), dtype=stack.dtype)
+
+    for i, position in enumerate(positions):
+        (z0, y0, x0), (z1, y1, x1) = starts[position], stops[position]
+        psfs[i] = stack[z0:z1, y0:y1, x0:x1]
+
+    return psfs, features.iloc[positions]
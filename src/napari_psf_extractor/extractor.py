@@ -1,43 +1,76 @@
-import cv2
+import tempfile
+
 import numpy as np
-import psf_extractor as psfe
-import trackpy
 
+from napari_psf_extractor.alignment import PROGRESSIVE_TOL, align_psfs_fourier, align_psfs_progressive
+from napari_psf_extractor.correlation import batch_pcc
+from napari_psf_extractor.detection import extract_windows
+from napari_psf_extractor.featureset import FeatureSet, overlap_mask, edge_mask
+from napari_psf_extractor.memory import plan_memory
 from napari_psf_extractor.plotting import plot_mass_range
-from napari_psf_extractor.utils import remove_plot_background
+from napari_psf_extractor.profiling import profiler
+from napari_psf_extractor.utils import lazy_import, remove_plot_background
+
+cv2 = lazy_import('cv2')
+pd = lazy_import('pandas')
+psfe = lazy_import('psf_extractor')
+trackpy = lazy_import('trackpy')
 
 
-def get_features_plot_data(plot_fig, mip, dx, dy, mass):
+@profiler.profile()
+def locate_features(mip, dx, dy):
     """
-    Get plot data for the features layer.
+    Locate features in the maximum intensity projection of the stack.
 
     Parameters
     ----------
-    plot_fig : FigureCanvas
-        The plot figure.
     mip : np.ndarray
         The maximum intensity projection of the stack.
     dx : int
         The width of the PSF.
     dy : int
         The height of the PSF.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The features found.
+    """
+    return trackpy.locate(mip, diameter=[dy, dx]).reset_index(drop=True)
+
+
+@profiler.profile()
+def get_features_plot_data(plot_fig, mip, mass, features, mass_index=None):
+    """
+    Get plot data for the features layer.
+
+    Parameters
+    ----------
+    plot_fig : FigureCanvas
+        The plot figure.
+    mip : np.ndarray
+        The maximum intensity projection of the stack.
     mass : tuple
         The mass range to plot.
+    features : pandas.DataFrame
+        The features found in the MIP.
+    mass_index : MassIndex
+        The sorted raw mass index of the features.
 
     Returns
     -------
     np.ndarray
         The plot data in the form of green circles on top of
         a transparent background.
+    int
+        The number of features in the mass range.
     """
     # Clear previous plot
     plot_fig.canvas.figure.clear()
     ax = plot_fig.canvas.figure.add_subplot(111)
 
     # Plot features
-    features_init = trackpy.locate(mip, diameter=[dy, dx]).reset_index(drop=True)
-
-    feature_count = plot_mass_range(mip=mip, ax=ax, mass=mass, features=features_init)
+    feature_count = plot_mass_range(mip=mip, ax=ax, mass=mass, features=features, mass_index=mass_index)
     plot_fig.canvas.draw()
 
     # Fetch plot matplotlib data from buffer
@@ -47,45 +80,143 @@ def get_features_plot_data(plot_fig, mip, dx, dy, mass):
 
     data = cv2.resize(data, dsize=(mip.shape[1], mip.shape[0]), interpolation=cv2.INTER_NEAREST)
 
-    return data, features_init, feature_count
+    return data, feature_count
 
 
-def extract_psf(min_mass, max_mass, stack, features, wx, wy, wz):
+def extract_psfs(stack, features, shape):
+    """
+    Extract PSF windows of the given shape around the features.
+
+    Features located in 3D (with a 'z' column) get windows centered on
+    their z position; others are extracted by `psfe.extract_psfs`.
+    """
+    if 'z' in features.columns:
+        return extract_windows(stack, features, shape)
+
+    return psfe.extract_psfs(stack, features=features, shape=shape)
+
+
+@profiler.profile()
+def extract_psfs_batched(stack, features, shape, batch_size, memmap=False):
+    """
+    Extract PSFs in batches of features, optionally into a memory-mapped file.
+
+    Parameters
+    ----------
+    stack : np.ndarray
+        The image stack.
+    features : pandas.DataFrame
+        The features to extract.
+    shape : tuple
+        The (wz, wy, wx) PSF window.
+    batch_size : int
+        The number of features to extract at once.
+    memmap : bool
+        Whether to store the PSFs in a temporary file instead of in memory.
+
+    Returns
+    -------
+    tuple
+        The extracted PSFs and features, as `psfe.extract_psfs` returns them.
+    """
+    psfs = None
+    features_extracted = []
+    n = 0
+
+    for start in range(0, len(features), batch_size):
+        psfs_batch, features_batch = extract_psfs(
+            stack,
+            features=features.iloc[start:start + batch_size],
+            shape=shape
+        )
+
+        if len(psfs_batch) == 0:
+            continue
+
+        if psfs is None:
+            # Allocate for all features, trimmed afterwards
+            out_shape = (len(features),) + psfs_batch.shape[1:]
+            if memmap:
+                psfs = np.memmap(tempfile.TemporaryFile(), dtype=psfs_batch.dtype, shape=out_shape)
+            else:
+                psfs = np.empty(out_shape, dtype=psfs_batch.dtype)
+
+        psfs[n:n + len(psfs_batch)] = psfs_batch
+        features_extracted.append(features_batch)
+        n += len(psfs_batch)
+
+    if psfs is None:
+        return extract_psfs(stack, features=features, shape=shape)
+
+    return psfs[:n], pd.concat(features_extracted)
+
+
+@profiler.profile()
+def extract_psf(min_mass, max_mass, stack, features, wx, wy, wz,
+                batch_size=None, memmap=False, mass_index=None, available=None):
     """
     Extract a PSF from a given stack and feature set.
+
+    If a `batch_size` is given (see `memory.plan_memory`), the PSFs are
+    extracted in batches, and stored in a temporary file if `memmap` is True.
+    Otherwise, they are planned to fit in the `available` memory [bytes],
+    which defaults to the available system memory.
+    If the `mass_index` of the features is given, the mass range is
+    selected from it rather than recomputed.
+
+    Raises
+    ------
+    MemoryError
+        If the PSF windows cannot fit in memory.
     """
-    # Update feature set
-    features_min_mass = features.loc[(features['raw_mass'] > min_mass)]
-    features_mass = features.loc[(features['raw_mass'] > min_mass)
-                                 & (features['raw_mass'] < max_mass)]
+    feature_set = FeatureSet.from_dataframe(features, mass_index=mass_index)
+
+    # Mass range
+    feature_set.set_mask('mass', feature_set.mass_mask(min_mass, max_mass))
 
-    overlapping = psfe.detect_overlapping_features(features_min_mass, wx, wy)
+    # Overlapping features (also with those above the mass range)
+    feature_set.set_mask('isolated', ~overlap_mask(
+        feature_set.x, feature_set.y, wx, wy,
+        candidates=feature_set.mass_mask(min_mass)
+    ))
 
     # Detect edge features
     dz, dy, dx = stack.shape
-    edges = psfe.detect_edge_features(features_mass, dx, dy, wx, wy)
-
-    # Combine
-    overlapping = np.concatenate([overlapping, edges])
+    feature_set.set_mask('inside', ~edge_mask(feature_set.x, feature_set.y, dx, dy, wx, wy))
 
     # Update feature set
-    features_overlap = features_mass.loc[~features_mass.index.isin(overlapping)]
+    features_overlap = feature_set.to_dataframe(feature_set.mask('mass', 'isolated', 'inside'))
+
+    # Plan the extraction, unless the caller did
+    if batch_size is None and not memmap:
+        plan = plan_memory(None, stack.dtype, len(features_overlap), wx, wy, wz, 1, available=available)
+        batch_size, memmap = plan['batch_size'], plan['memmap']
 
     # Extract PSFs
-    psfs, features_extracted = psfe.extract_psfs(
-        stack,
-        features=features_overlap,
-        shape=(wz, wy, wx)
-    )
+    if batch_size is None:
+        psfs, features_extracted = extract_psfs(
+            stack,
+            features=features_overlap,
+            shape=(wz, wy, wx)
+        )
+    else:
+        psfs, features_extracted = extract_psfs_batched(
+            stack, features_overlap, (wz, wy, wx), batch_size, memmap
+        )
 
     return psfs, features_extracted
 
 
-def localise_psf(psfs, features_extracted, usf):
+@profiler.profile()
+def filter_locations(psfs, features_extracted):
     """
-    Filter PSFs by PCC and location.
+    Localise PSFs and drop those with an invalid location.
+
+    Returns
+    -------
+    tuple
+        The filtered PSFs, their locations and their features.
     """
-    # Filter locations
     locations = psfe.localize_psfs(psfs, integrate=False)
 
     loc_filtered, features_filtered, psfs_filtered = psfe.filt_locations(
@@ -94,19 +225,124 @@ def localise_psf(psfs, features_extracted, usf):
         psfs
     )
 
+    return psfs_filtered, loc_filtered, features_filtered
+
+
+def check_memory(psfs, usf, available=None):
+    """
+    Check that the extracted PSFs can be localised and aligned in memory.
+
+    See `memory.plan_memory`. The PSFs are already in memory, such that
+    only their filtered copy and the alignment are planned.
+
+    Raises
+    ------
+    MemoryError
+        If a stage cannot fit in the `available` memory [bytes].
+    """
+    wz, wy, wx = psfs.shape[1:]
+    plan_memory(None, psfs.dtype, len(psfs), wx, wy, wz, usf, available=available)
+
+
+@profiler.profile()
+def localise_psf(psfs, features_extracted, usf, engine='upsample', available=None):
+    """
+    Filter PSFs by PCC and location.
+
+    The PSFs are aligned either by upsampling each of them ('upsample')
+    or by shifting them in the Fourier domain ('fourier').
+
+    Raises
+    ------
+    MemoryError
+        If the alignment cannot fit in the `available` memory [bytes],
+        which defaults to the available system memory.
+    """
+    check_memory(psfs, usf, available)
+
+    # Filter locations
+    psfs_filtered, loc_filtered, _ = filter_locations(psfs, features_extracted)
+
     # Align PSFs
-    psf_sum = psfe.align_psfs(psfs_filtered, loc_filtered, upsample_factor=usf)
+    if engine == 'fourier':
+        psf_sum = align_psfs_fourier(psfs_filtered, loc_filtered, usf)
+    elif engine == 'upsample':
+        psf_sum = psfe.align_psfs(psfs_filtered, loc_filtered, upsample_factor=usf)
+    else:
+        raise ValueError(f"Unknown alignment engine: {engine}")
 
     return psf_sum
 
 
+def quality_order(psfs, features, by='pcc'):
+    """
+    Order PSFs by quality, best first.
+
+    PSFs are ranked by their PCC with the mean PSF ('pcc') or by the raw
+    mass of their feature ('mass').
+    """
+    if by == 'pcc':
+        scores = batch_pcc(psfs)
+    elif by == 'mass':
+        scores = features['raw_mass'].to_numpy()
+    else:
+        raise ValueError(f"Unknown quality measure: {by}")
+
+    return np.argsort(-scores, kind='stable')
+
+
+@profiler.profile()
+def localise_psf_progressive(psfs, features_extracted, usf, engine='fourier', order_by='pcc',
+                             tol=PROGRESSIVE_TOL, callback=None, available=None):
+    """
+    Filter PSFs by location and align them best first, until the PSF has converged.
+
+    See `alignment.align_psfs_progressive`. The `callback` is called with
+    the running PSF, its number of beads and its relative change after
+    every step.
+
+    Returns
+    -------
+    np.ndarray
+        The PSF.
+    dict
+        The number of beads aligned ('beads') out of those accepted
+        ('total'), and the last relative change ('change').
+
+    Raises
+    ------
+    MemoryError
+        If the alignment cannot fit in the `available` memory [bytes].
+    """
+    check_memory(psfs, usf, available)
+
+    psfs_filtered, loc_filtered, features_filtered = filter_locations(psfs, features_extracted)
+    order = quality_order(psfs_filtered, features_filtered, order_by)
+
+    psf_sum, n_beads, change = None, 0, np.inf
+
+    for psf_sum, n_beads, change in align_psfs_progressive(
+            psfs_filtered, loc_filtered, usf, order=order, tol=tol, engine=engine):
+        if callback is not None:
+            callback(psf_sum, n_beads, change)
+
+    return psf_sum, {'beads': n_beads, 'total': len(psfs_filtered), 'change': change}
+
+
+@profiler.profile()
 def filter_pcc(pcc_min, features, psfs):
+    """
+    Drop the features whose PSF correlates poorly with the others.
+
+    Outliers are detected by `psfe.detect_outlier_psfs`.
+    """
     # Detect outlier PCCs
     outliers_, pccs = psfe.detect_outlier_psfs(psfs, pcc_min=pcc_min, return_pccs=True)
 
-    df = features.reset_index()
-    outliers = df[df.index.isin(outliers_)]['index'].values
+    # Outliers are given by position
+    keep = np.ones(len(features), dtype=bool)
+    keep[np.asarray(outliers_, dtype=int)] = False
 
-    features_pearson = features.loc[~features.index.isin(outliers)]
+    features_pearson = features.iloc[keep]
 
     return features_pearson
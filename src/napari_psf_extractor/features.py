@@ -4,10 +4,14 @@ import napari
 import numpy as np
 from napari._qt.qthreading import thread_worker
 from napari.utils.notifications import show_error
-from psf_extractor.plotting import fire
 from qtpy.QtWidgets import QLabel
 
 from napari_psf_extractor.extractor import get_features_plot_data
+from napari_psf_extractor.mass import MassIndex
+from napari_psf_extractor.profiling import profiler
+from napari_psf_extractor.utils import lazy_import
+
+psfe_plotting = lazy_import('psf_extractor.plotting')
 
 
 class Features:
@@ -19,7 +23,12 @@ class Features:
         self.data = None
         self.count = None
         self.features_init = None
+        self.mass_index = None
         self.layer = None
+
+        # MIP and feature diameters the features were located with
+        self.located_with = None
+        self.relocated = False
         self.label = QLabel(f"Features found: {self.count}")
 
     @thread_worker
@@ -32,12 +41,44 @@ class Features:
             pass
 
         if self.widget.mip is not None and isinstance(self.widget.mip, np.ndarray):
-            self.data, self.features_init, self.count = get_features_plot_data(
-                self.widget.plot_fig,
-                self.widget.mip,
-                self.widget.dx, self.widget.dy,
-                self.widget.mass_slider.value()
-            )
+            with profiler.stage('features'):
+                self.locate()
+
+                self.data, self.count = get_features_plot_data(
+                    self.widget.plot_fig,
+                    self.widget.mip,
+                    self.widget.mass_slider.value(),
+                    self.features_init,
+                    self.mass_index
+                )
+
+    def locate(self):
+        """
+        Locate features, unless they were already located with the current MIP,
+        feature diameters and detection mode. Mass range changes only need the
+        mass index. Features located before are loaded from their checkpoint.
+        """
+        mip = self.widget.mip
+        settings = (self.widget.dx, self.widget.dy, self.widget.dz, self.widget.detect_3d_checkbox.isChecked())
+
+        if self.located_with is not None:
+            located_mip, located_settings = self.located_with
+            if located_mip is mip and located_settings == settings:
+                return
+
+        params = self.widget.feature_params()
+        checkpoint = self.widget.load_checkpoint('features_init', params)
+
+        if checkpoint is not None:
+            self.features_init = checkpoint['features']
+        else:
+            # Usually detected in the background already
+            self.features_init = self.widget.detect_features()
+            self.widget.save_checkpoint('features_init', params, features=self.features_init)
+
+        self.mass_index = MassIndex.from_features(self.features_init)
+        self.located_with = (mip, settings)
+        self.relocated = True
 
     def update(self):
         """
@@ -71,9 +112,16 @@ class Features:
 
         # Create features layer if it doesn't exist
         if not self.layer_exists("Features"):
+            fire = psfe_plotting.fire
             cmap = napari.utils.Colormap(fire.colors, display_name=fire.name)
             self.layer = self.widget.viewer.add_image(data=self.data, colormap=cmap, name='Features')
 
+        # Fit the mass slider to the newly located features
+        if self.relocated:
+            self.relocated = False
+            self.widget.quality.reset()
+            self.widget.mass_slider.set_histogram(self.mass_index.histogram, self.mass_index.bin_edges)
+
         # Update features layer
         self.layer.data = self.data
         self.label.setText(f"Features found: {self.count}")
@@ -91,6 +139,9 @@ class Features:
     def get_features(self):
         return self.features_init
 
+    def get_mass_index(self):
+        return self.mass_index
+
     def layer_exists(self, layer_name):
         """
         Check if a layer with the given name is already present in the viewer.
@@ -0,0 +1,214 @@
+import numpy as np
+
+from napari_psf_extractor.mass import MassIndex
+from napari_psf_extractor.utils import lazy_import
+
+spatial = lazy_import('scipy.spatial')
+
+
+class FeatureSet:
+    """
+    Struct-of-arrays view of a feature table.
+
+    The coordinates, raw mass and a stable id (the DataFrame index) of every
+    feature are kept as arrays. Filtering stages set named boolean masks,
+    which are composed instead of copying the table at every step. The
+    DataFrame is only sliced once, when the selection leaves the pipeline.
+
+    Per-feature metrics, such as the quality index, can be attached as
+    columns and thresholded without touching the table.
+    """
+
+    def __init__(self, x, y, raw_mass, ids=None, frame=None, mass_index=None):
+        """
+        Parameters
+        ----------
+        x, y : np.ndarray
+            The feature coordinates [px].
+        raw_mass : np.ndarray
+            The feature raw mass.
+        ids : np.ndarray
+            The stable feature ids. Defaults to the feature positions.
+        frame : pandas.DataFrame
+            The feature table the arrays were taken from.
+        mass_index : MassIndex
+            The sorted raw mass index of the features.
+        """
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.raw_mass = np.asarray(raw_mass, dtype=float)
+        self.id = np.arange(len(self.x)) if ids is None else np.asarray(ids)
+        self.frame = frame
+        self.mass_index = MassIndex(self.raw_mass) if mass_index is None else mass_index
+        self.masks = {}
+        self.columns = {}
+
+    @classmethod
+    def from_dataframe(cls, features, mass_index=None):
+        """
+        Create a feature set from a feature table, without copying it.
+        """
+        return cls(
+            features['x'].to_numpy(),
+            features['y'].to_numpy(),
+            features['raw_mass'].to_numpy(),
+            ids=features.index.to_numpy(),
+            frame=features,
+            mass_index=mass_index,
+        )
+
+    def __len__(self):
+        return len(self.x)
+
+    def set_mask(self, name, mask):
+        """
+        Set a named boolean mask of the features to keep.
+        """
+        self.masks[name] = np.asarray(mask, dtype=bool)
+
+    def mask(self, *names):
+        """
+        Combine named masks. All features are kept if no names are given.
+        """
+        mask = np.ones(len(self), dtype=bool)
+
+        for name in names:
+            mask &= self.masks[name]
+
+        return mask
+
+    def positions(self, ids):
+        """
+        Get the positions of features from their ids, -1 for unknown ids.
+        """
+        ids = np.asarray(ids)
+        order = np.argsort(self.id, kind='stable')
+        sorted_ids = self.id[order]
+
+        index = np.clip(np.searchsorted(sorted_ids, ids), 0, max(len(self) - 1, 0))
+        found = (sorted_ids[index] == ids) if len(self) else np.zeros(len(ids), dtype=bool)
+
+        return np.where(found, order[index] if len(self) else -1, -1)
+
+    def set_columns(self, columns, ids=None):
+        """
+        Set per-feature metric columns.
+
+        Parameters
+        ----------
+        columns : dict or pandas.DataFrame
+            The values of every column, by name.
+        ids : np.ndarray
+            The ids of the features the values belong to. Defaults to all
+            features; the others get NaN.
+        """
+        positions = np.arange(len(self)) if ids is None else self.positions(ids)
+
+        if np.any(positions < 0):
+            raise ValueError("Cannot set columns of unknown features.")
+
+        for name in columns:
+            column = np.full(len(self), np.nan)
+            column[positions] = np.asarray(columns[name], dtype=float)
+            self.columns[name] = column
+
+    def threshold_mask(self, **bounds):
+        """
+        Get the mask of the features whose columns are within (inclusive) bounds.
+
+        Bounds are given as name=(min, max), with None for an open bound.
+        Features without a value for a thresholded column are dropped.
+        """
+        mask = np.ones(len(self), dtype=bool)
+
+        for name, (low, high) in bounds.items():
+            values = self.columns[name]
+            mask &= ~np.isnan(values)
+
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+
+        return mask
+
+    def mass_mask(self, min_mass=-np.inf, max_mass=np.inf):
+        """
+        Get the mask of the features with a raw mass within (min_mass, max_mass).
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.mass_index.positions(min_mass, max_mass)] = True
+
+        return mask
+
+    def to_dataframe(self, mask=None):
+        """
+        Get the rows of the feature table selected by a mask.
+        """
+        if self.frame is None:
+            raise ValueError("The feature set was not created from a DataFrame.")
+
+        if mask is None:
+            return self.frame
+
+        return self.frame.iloc[np.flatnonzero(mask)]
+
+
+def overlap_mask(x, y, wx, wy, candidates=None):
+    """
+    Detect features whose PSF windows overlap.
+
+    Two windows of wx by wy px overlap (or touch) when the features are no
+    further than wx apart in x and wy apart in y.
+
+    Parameters
+    ----------
+    x, y : np.ndarray
+        The feature coordinates [px].
+    wx, wy : int
+        The PSF window size [px].
+    candidates : np.ndarray
+        Mask of the features to consider. Defaults to all features.
+
+    Returns
+    -------
+    np.ndarray
+        Mask of the candidates that overlap with another candidate.
+    """
+    if candidates is None:
+        candidates = np.ones(len(x), dtype=bool)
+
+    positions = np.flatnonzero(candidates)
+    mask = np.zeros(len(x), dtype=bool)
+
+    if len(positions) < 2:
+        return mask
+
+    # Chebyshev distance on window-scaled coordinates
+    points = np.column_stack([x[positions] / wx, y[positions] / wy])
+    pairs = spatial.cKDTree(points).query_pairs(r=1, p=np.inf, output_type='ndarray')
+
+    mask[positions[pairs.ravel()]] = True
+
+    return mask
+
+
+def edge_mask(x, y, dx, dy, wx, wy):
+    """
+    Detect features whose PSF windows do not fit in the image.
+
+    Parameters
+    ----------
+    x, y : np.ndarray
+        The feature coordinates [px].
+    dx, dy : int
+        The image width and height [px].
+    wx, wy : int
+        The PSF window size [px].
+
+    Returns
+    -------
+    np.ndarray
+        Mask of the features too close to the image edges.
+    """
+    return (x < wx / 2) | (x > dx - wx / 2) | (y < wy / 2) | (y > dy - wy / 2)
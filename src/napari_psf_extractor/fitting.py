@@ -0,0 +1,84 @@
+import numpy as np
+
+from napari_psf_extractor.utils import lazy_import
+
+psfe = lazy_import('psf_extractor')
+
+
+def fit_profiles(psf, psx, psy, psz):
+    """
+    Fit 1D Gaussians to the central X, Y and Z profiles of a PSF.
+
+    Parameters
+    ----------
+    psf : numpy.ndarray
+        The PSF to fit.
+    psx : float
+        The pixel size in x-direction [nm/px].
+    psy : float
+        The pixel size in y-direction [nm/px].
+    psz : float
+        The pixel size in z-direction [nm/px].
+
+    Returns
+    -------
+    dict
+        For each axis ('x', 'y', 'z'), a tuple (coordinates [μm], profile, popt).
+    """
+    # PSF dimensions
+    Nz, Ny, Nx = psf.shape
+    # PSF volume [μm]
+    wz, wy, wx = 1e-3*psz*Nz, 1e-3*psy*Ny, 1e-3*psx*Nx
+    # PSF center coords
+    z0, y0, x0 = Nz//2, Ny//2, Nx//2
+
+    # 1D PSFs (slices)
+    prof_z = psf[:, y0, x0]
+    prof_y = psf[z0, :, x0]
+    prof_x = psf[z0, y0, :]
+    # 1D Axes
+    z = np.linspace(-wz/2, wz/2, prof_z.size)
+    y = np.linspace(-wy/2, wy/2, prof_y.size)
+    x = np.linspace(-wx/2, wx/2, prof_x.size)
+    # Do 1D PSF fits
+    popt_z = psfe.fit_gaussian_1D(prof_z, z, p0=psfe.guess_gaussian_1D_params(prof_z, z))
+    popt_y = psfe.fit_gaussian_1D(prof_y, y, p0=psfe.guess_gaussian_1D_params(prof_y, y))
+    popt_x = psfe.fit_gaussian_1D(prof_x, x, p0=psfe.guess_gaussian_1D_params(prof_x, x))
+
+    return {
+        'x': (x, prof_x, popt_x),
+        'y': (y, prof_y, popt_y),
+        'z': (z, prof_z, popt_z),
+    }
+
+
+def fwhm_from_popt(popt):
+    """
+    Get the FWHM [μm] of a fitted 1D Gaussian.
+    """
+    return np.abs(2.355 * popt[1])
+
+
+def measure_fwhm(psf, psx, psy, psz):
+    """
+    Measure the FWHM of a PSF along X, Y and Z.
+
+    Parameters
+    ----------
+    psf : numpy.ndarray
+        The PSF to measure.
+    psx : float
+        The pixel size in x-direction [nm/px].
+    psy : float
+        The pixel size in y-direction [nm/px].
+    psz : float
+        The pixel size in z-direction [nm/px].
+
+    Returns
+    -------
+    np.ndarray
+        The X, Y and Z FWHM [nm].
+    """
+    fits = fit_profiles(psf, psx, psy, psz)
+
+    return np.array([1e3 * fwhm_from_popt(fits[axis][2]) for axis in ('x', 'y', 'z')])
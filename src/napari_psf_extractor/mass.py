@@ -0,0 +1,82 @@
+import numpy as np
+
+# Number of bins of the raw mass histogram shown on the mass slider
+HISTOGRAM_BINS = 64
+
+
+class MassIndex:
+    """
+    Sorted index of the raw mass of a feature set.
+
+    Counts and subsets of any open mass range (min_mass, max_mass)
+    are found by binary search instead of masking the whole feature table.
+    """
+
+    def __init__(self, raw_mass, bins=HISTOGRAM_BINS):
+        """
+        Parameters
+        ----------
+        raw_mass : array-like
+            The raw mass of every feature, in feature order.
+        bins : int
+            The number of bins of the raw mass histogram.
+        """
+        raw_mass = np.asarray(raw_mass, dtype=float)
+
+        self.order = np.argsort(raw_mass, kind='stable')
+        self.sorted_mass = raw_mass[self.order]
+
+        if len(raw_mass):
+            self.histogram, self.bin_edges = np.histogram(raw_mass, bins=bins)
+        else:
+            self.histogram, self.bin_edges = np.zeros(bins, dtype=int), np.linspace(0, 1, bins + 1)
+
+    @classmethod
+    def from_features(cls, features, bins=HISTOGRAM_BINS):
+        return cls(features['raw_mass'].to_numpy(), bins=bins)
+
+    def __len__(self):
+        return len(self.sorted_mass)
+
+    def min(self):
+        return self.sorted_mass[0] if len(self) else 0
+
+    def max(self):
+        return self.sorted_mass[-1] if len(self) else 0
+
+    def bounds(self, min_mass=-np.inf, max_mass=np.inf):
+        """
+        Get the slice of the sorted masses that lies within (min_mass, max_mass).
+        """
+        lo = np.searchsorted(self.sorted_mass, min_mass, side='right')
+        hi = np.searchsorted(self.sorted_mass, max_mass, side='left')
+
+        return lo, max(lo, hi)
+
+    def count(self, min_mass=-np.inf, max_mass=np.inf):
+        """
+        Count the features with a raw mass within (min_mass, max_mass).
+        """
+        lo, hi = self.bounds(min_mass, max_mass)
+
+        return hi - lo
+
+    def positions(self, min_mass=-np.inf, max_mass=np.inf):
+        """
+        Get the positions of the features with a raw mass within (min_mass, max_mass),
+        in their original order.
+        """
+        lo, hi = self.bounds(min_mass, max_mass)
+
+        return np.sort(self.order[lo:hi])
+
+    def select(self, features, min_mass=-np.inf, max_mass=np.inf):
+        """
+        Select the features with a raw mass within (min_mass, max_mass).
+
+        Parameters
+        ----------
+        features : pandas.DataFrame
+            The feature set the index was built from.
+        """
+        return features.iloc[self.positions(min_mass, max_mass)]
@@ -0,0 +1,244 @@
+import os
+
+import numpy as np
+
+# The normalized stack and the extracted PSFs are stored as float64
+FLOAT_BYTES = np.dtype(np.float64).itemsize
+
+# Fraction of the available memory a run is allowed to use
+SAFETY_FACTOR = 0.8
+
+# Rough number of MIP-sized temporaries `trackpy.locate` keeps alive
+DETECTION_COPIES = 6
+
+
+def available_memory():
+    """
+    Get the available system memory [bytes], or None if it cannot be determined.
+    """
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def format_bytes(n_bytes):
+    """
+    Format a number of bytes in a human-readable way.
+    """
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(n_bytes) < 1024:
+            return f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+
+    return f"{n_bytes:.1f} TB"
+
+
+def estimate_memory(stack_shape, dtype, n_features, wx, wy, wz, usf, workers=None, engine='upsample'):
+    """
+    Estimate the peak memory of each pipeline stage.
+
+    Parameters
+    ----------
+    stack_shape : tuple
+        The (z, y, x) shape of the image stack.
+    dtype : np.dtype
+        The data type of the image layer.
+    n_features : int
+        The number of features to extract.
+    wx, wy, wz : int
+        The PSF window size [px].
+    usf : int
+        The upsampling factor.
+    workers : int
+        The number of bootstrap worker processes. Defaults to the number of CPUs.
+    engine : str
+        The alignment engine the FWHM is bootstrapped with, 'upsample' or 'fourier'.
+
+    Returns
+    -------
+    dict
+        The estimated peak memory [bytes] per stage, on top of the memory
+        retained by the normalized stack (except for the 'load' stage).
+    """
+    workers = workers or os.cpu_count() or 1
+    n_voxels = int(np.prod(stack_shape))
+    mip_voxels = int(np.prod(stack_shape[1:]))
+    window_voxels = wz * wy * wx
+    upsampled_voxels = window_voxels * int(usf) ** 3
+
+    return {
+        # Layer data, float32 copy and float64 normalized copy
+        'load': n_voxels * (np.dtype(dtype).itemsize + 4 + FLOAT_BYTES),
+        'detect': mip_voxels * FLOAT_BYTES * DETECTION_COPIES,
+        # List of windows and the stacked array
+        'extract': 2 * n_features * window_voxels * FLOAT_BYTES,
+        # Extracted PSFs and their filtered copy
+        'localise': 2 * n_features * window_voxels * FLOAT_BYTES,
+        # Accumulated PSF, upsampled PSF and its rolled copy
+        'align': 3 * upsampled_voxels * FLOAT_BYTES,
+        # Aligned per-bead volumes (memory-mapped once for all workers),
+        # and a resample sum and its normalized copy (float32) per worker
+        'bootstrap': bootstrap_bytes(n_features, wx, wy, wz, usf, engine) + 2 * workers * upsampled_voxels * 4,
+    }
+
+
+def bootstrap_bytes(n_features, wx, wy, wz, usf, engine='upsample'):
+    """
+    Get the size [bytes] of the aligned per-bead volumes the FWHM is bootstrapped from.
+
+    These are the upsampled volumes (float32), or the spectra of the
+    windows (complex64) for the 'fourier' engine.
+    """
+    if engine == 'fourier':
+        return n_features * wz * wy * (wx // 2 + 1) * 8
+
+    return n_features * wz * wy * wx * int(usf) ** 3 * 4
+
+
+def plan_memory(stack_shape, dtype, n_features, wx, wy, wz, usf,
+                available=None, bootstrap=False, engine='upsample', workers=None):
+    """
+    Plan a run such that no stage exceeds the available memory.
+
+    Extraction is done in batches and spilled to a memory-mapped file
+    when the PSF windows do not fit in memory twice.
+
+    Parameters
+    ----------
+    stack_shape : tuple
+        The (z, y, x) shape of the image stack, or None if the normalized
+        stack is already in memory. The load and detect stages are then
+        not planned, and the available memory is taken to exclude it.
+    dtype : np.dtype
+        The data type of the image layer.
+    n_features : int
+        The number of features to extract.
+    wx, wy, wz : int
+        The PSF window size [px].
+    usf : int
+        The upsampling factor.
+    available : int
+        The available memory [bytes]. Defaults to the available system memory.
+    bootstrap : bool
+        Whether the FWHM confidence intervals will be bootstrapped.
+    engine, workers :
+        The bootstrap settings (see `estimate_memory`).
+
+    Returns
+    -------
+    dict
+        The per-stage 'estimates' [bytes], the memory 'budget' [bytes]
+        and the extraction 'batch_size' and 'memmap' settings.
+
+    Raises
+    ------
+    MemoryError
+        If a stage cannot fit in memory with any setting.
+    """
+    estimates = estimate_memory(stack_shape or (0, 0, 0), dtype, n_features, wx, wy, wz, usf,
+                                workers=workers, engine=engine)
+
+    if available is None:
+        available = available_memory()
+
+    plan = {
+        'estimates': estimates,
+        'budget': None,
+        'batch_size': None,
+        'memmap': False,
+    }
+
+    if available is None:
+        return plan
+
+    budget = SAFETY_FACTOR * available
+    plan['budget'] = budget
+
+    def refuse(stage, required, hint):
+        raise MemoryError(
+            f"The {stage} stage needs about {format_bytes(required)}, "
+            f"but only {format_bytes(budget)} is available. {hint}"
+        )
+
+    if estimates['load'] > budget:
+        refuse('load', estimates['load'], "Crop the image stack.")
+
+    # Normalized stack retained by all subsequent stages
+    retained = int(np.prod(stack_shape or (0, 0, 0))) * FLOAT_BYTES
+
+    if retained + estimates['detect'] > budget:
+        refuse('detect', retained + estimates['detect'], "Crop the image stack.")
+
+    if retained + estimates['extract'] > budget:
+        # Write windows to disk in batches instead of stacking them in memory,
+        # such that only the filtered copy made while localising is in memory
+        psfs_bytes = estimates['extract'] // 2
+
+        if retained + psfs_bytes > budget:
+            refuse('localise', retained + psfs_bytes,
+                   "Narrow the mass range or reduce the PSF window.")
+
+        window_bytes = psfs_bytes // max(n_features, 1)
+        plan['memmap'] = True
+        plan['batch_size'] = max(1, int((budget - retained) // (2 * window_bytes)))
+
+    if retained + estimates['align'] > budget:
+        refuse('align', retained + estimates['align'], "Reduce the upsampling factor.")
+
+    if bootstrap and retained + estimates['bootstrap'] > budget:
+        refuse('bootstrap', retained + estimates['bootstrap'],
+               "Reduce the upsampling factor or disable bootstrapping.")
+
+    return plan
+
+
+def plan_workers(plan, stack_shape, n_features, max_workers=None):
+    """
+    Get the number of alignments that fit in memory at once, e.g. in a sweep.
+
+    Every alignment holds a copy of its PSF windows (at most all of them) and
+    its upsampled volumes, on top of the normalized stack and the windows.
+
+    Parameters
+    ----------
+    plan : dict
+        The plan of the run, as given by `plan_memory` for the upsampling
+        factor of the largest alignment.
+    stack_shape : tuple
+        The (z, y, x) shape of the image stack.
+    n_features : int
+        The number of features extracted.
+    max_workers : int
+        The maximum number of alignments at once. Defaults to the number of CPUs.
+
+    Raises
+    ------
+    MemoryError
+        If a single alignment cannot fit in memory.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    budget = plan['budget']
+
+    if budget is None:
+        return max_workers
+
+    psfs_bytes = plan['estimates']['extract'] // 2
+    retained = int(np.prod(stack_shape)) * FLOAT_BYTES + psfs_bytes
+    per_worker = psfs_bytes + plan['estimates']['align']
+    workers = int((budget - retained) // per_worker)
+
+    if workers < 1:
+        raise MemoryError(
+            f"An alignment needs about {format_bytes(retained + per_worker)}, "
+            f"but only {format_bytes(budget)} is available. "
+            f"Narrow the mass ranges or reduce the upsampling factors."
+        )
+
+    return min(workers, max_workers)
@@ -0,0 +1,236 @@
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from napari_psf_extractor.cache import fingerprint
+from napari_psf_extractor.utils import lazy_import
+
+fft = lazy_import('scipy.fft')
+
+MANIFEST_NAME = 'otf.json'
+
+# Number of OTFs kept in memory by default
+MAX_CACHED_OTFS = 8
+
+
+def bin_psf(psf, usf):
+    """
+    Bin an upsampled PSF back to the sampling of the images.
+
+    Blocks of `usf` voxels are summed along every axis, with the peak of
+    the PSF in the middle of the central block and as many blocks on both
+    sides of it.
+
+    Parameters
+    ----------
+    psf : np.ndarray
+        The PSF, upsampled by `usf` along every axis.
+    usf : int
+        The upsampling factor.
+
+    Returns
+    -------
+    np.ndarray
+        The PSF at image sampling, with its peak at the center voxel.
+    """
+    usf = int(usf)
+
+    if usf <= 1:
+        return psf
+
+    peak = np.unravel_index(np.argmax(psf), psf.shape)
+    slices = []
+
+    for n, p in zip(psf.shape, peak):
+        if n < usf:
+            raise ValueError(f"Cannot bin a PSF of shape {psf.shape} by {usf}.")
+
+        # Start of the central block, and the number of whole blocks on each side
+        start = min(max(p - usf // 2, 0), n - usf)
+        k = min(start // usf, (n - start - usf) // usf)
+        slices.append(slice(start - k * usf, start + (k + 1) * usf))
+
+    binned = psf[tuple(slices)]
+    shape = [(s.stop - s.start) // usf for s in slices]
+
+    return binned.reshape(shape[0], usf, shape[1], usf, shape[2], usf).sum(axis=(1, 3, 5))
+
+
+def pad_psf(psf, shape):
+    """
+    Pad a PSF to a target shape, with its center moved to the origin.
+
+    Parameters
+    ----------
+    psf : np.ndarray
+        The PSF.
+    shape : tuple
+        The target (z, y, x) shape, at least as large as the PSF.
+
+    Returns
+    -------
+    np.ndarray
+        The padded PSF, wrapped around such that its center is at index 0.
+    """
+    shape = tuple(int(n) for n in shape)
+
+    if len(shape) != psf.ndim or any(n < m for n, m in zip(shape, psf.shape)):
+        raise ValueError(f"Cannot pad a PSF of shape {psf.shape} to {shape}.")
+
+    # Center the PSF in the target volume, then wrap its center to the origin
+    before = [n // 2 - m // 2 for n, m in zip(shape, psf.shape)]
+    padded = np.zeros(shape, dtype=np.float32)
+    padded[tuple(slice(b, b + m) for b, m in zip(before, psf.shape))] = psf
+
+    return fft.ifftshift(padded)
+
+
+def compute_otf(psf, shape=None, workers=None):
+    """
+    Compute the normalized OTF of a PSF.
+
+    Parameters
+    ----------
+    psf : np.ndarray
+        The PSF.
+    shape : tuple
+        The (z, y, x) shape of the images the OTF is applied to.
+        Defaults to the PSF shape.
+    workers : int
+        The number of FFT workers.
+
+    Returns
+    -------
+    np.ndarray
+        The complex64 OTF of shape (z, y, x // 2 + 1), with a DC component of 1.
+    """
+    otf = fft.rfftn(pad_psf(psf, psf.shape if shape is None else shape), workers=workers)
+
+    dc = otf[(0,) * otf.ndim].real
+    if dc != 0:
+        otf /= dc
+
+    return otf.astype(np.complex64)
+
+
+class OTFCache:
+    """
+    LRU cache of OTFs, keyed by the PSF hash and the target shape.
+    """
+
+    def __init__(self, max_entries=MAX_CACHED_OTFS):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, psf, shape=None, psf_hash=None):
+        """
+        Get the OTF of a PSF, computing it unless it is cached.
+        """
+        shape = tuple(int(n) for n in (psf.shape if shape is None else shape))
+        key = (psf_hash or fingerprint(psf)[2], shape)
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        otf = compute_otf(psf, shape)
+        self.entries[key] = otf
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        return otf
+
+
+def export_otf(psf, folder, psx, psy, psz, shapes=None, cache=None, usf=1):
+    """
+    Save the OTFs of a PSF for the given image shapes, with a manifest.
+
+    An upsampled PSF is first binned back to the sampling of the images
+    (see `bin_psf`). Files are named after the hash and shape of that PSF,
+    such that exporting the same PSF again only adds the missing shapes.
+
+    Parameters
+    ----------
+    psf : np.ndarray
+        The PSF.
+    folder : str
+        The folder to save to.
+    psx, psy, psz : float
+        The pixel sizes of the images [nm/px].
+    shapes : list
+        The (z, y, x) image shapes. Defaults to the binned PSF shape.
+    cache : OTFCache
+        The cache OTFs are taken from and added to.
+    usf : int
+        The upsampling factor of the PSF.
+
+    Returns
+    -------
+    list
+        The paths of the saved OTFs.
+    """
+    psf = bin_psf(np.asarray(psf, dtype=np.float32), usf)
+    psf_hash = fingerprint(psf)[2]
+    cache = OTFCache() if cache is None else cache
+
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    manifest = {'otfs': []}
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    entries = {entry['file']: entry for entry in manifest.get('otfs', [])}
+    paths = []
+
+    for shape in shapes or [psf.shape]:
+        shape = tuple(int(n) for n in shape)
+        name = f"otf_{psf_hash[:12]}_{'x'.join(map(str, shape))}.npy"
+        path = os.path.join(folder, name)
+
+        if name not in entries or not os.path.exists(path):
+            otf = cache.get(psf, shape, psf_hash)
+            np.save(path, otf)
+
+            entries[name] = {
+                'file': name,
+                'psf_hash': psf_hash,
+                'psf_shape': list(psf.shape),
+                'shape': list(shape),
+                'otf_shape': list(otf.shape),
+                'dtype': str(otf.dtype),
+                'pixel_size': {'z': psz, 'y': psy, 'x': psx},
+                'unit': 'nm',
+                'origin': 'PSF center at index 0, DC normalized to 1',
+            }
+
+        paths.append(path)
+
+    with open(manifest_path, 'w') as f:
+        json.dump({'otfs': list(entries.values())}, f, indent=2)
+
+    return paths
+
+
+def parse_shapes(text):
+    """
+    Parse comma-separated 'ZxYxX' shapes, e.g. '64x512x512, 32x256x256'.
+    """
+    shapes = []
+
+    for value in text.replace(';', ',').split(','):
+        if value.strip():
+            shape = tuple(int(n) for n in value.lower().split('x'))
+
+            if len(shape) != 3:
+                raise ValueError(f"Expected a (z, y, x) shape, got '{value.strip()}'.")
+
+            shapes.append(shape)
+
+    return shapes
@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from napari_psf_extractor.profiling import profiler
+
+# Number of feature detections kept by default
+MAX_DETECTIONS = 8
+
+
+class Prefetcher:
+    """
+    Speculatively preprocesses image stacks and detects features in the background.
+
+    The stack of a layer starts loading as soon as the layer is selected,
+    and features are detected as soon as the parameters they depend on are
+    known. Results are kept under the parameters that produced them, such
+    that changing unrelated parameters reuses them, while pending work for
+    parameters that are no longer selected is cancelled.
+
+    Jobs run on a single thread in submission order, so a detection always
+    runs after the load of its stack.
+    """
+
+    def __init__(self, stack_cache, max_detections=MAX_DETECTIONS):
+        """
+        Parameters
+        ----------
+        stack_cache : StackCache or ExtractionClient
+            The cache stacks are loaded through.
+        max_detections : int
+            The number of detection results kept.
+        """
+        self.stack_cache = stack_cache
+        self.max_detections = max_detections
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.Lock()
+
+        # Layer, data and future of the current load
+        self.loading = None
+        self.detections = OrderedDict()
+
+    def _load(self, layer):
+        with profiler.stage('load'):
+            stack, mip = self.stack_cache.load(layer)
+
+        return stack, mip, self.stack_cache.key(layer)[1][2]
+
+    def load(self, layer):
+        """
+        Start loading a layer, unless it is already loaded or loading.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future (stack, MIP, stack fingerprint hash) of the layer.
+        """
+        with self.lock:
+            if self.loading is not None:
+                loading_layer, loading_data, future = self.loading
+
+                if loading_layer is layer and loading_data is layer.data and not future.cancelled():
+                    return future
+
+                # Another layer was selected before this one loaded
+                future.cancel()
+                self._cancel_detections()
+
+            future = self.pool.submit(self._load, layer)
+            self.loading = (layer, layer.data, future)
+
+            return future
+
+    def detect(self, key, func, *args):
+        """
+        Start a detection, unless one with the same key was started before.
+
+        Pending detections with other keys are cancelled; finished ones are kept.
+
+        Parameters
+        ----------
+        key : hashable
+            The stack and parameters of the detection.
+        func : callable
+            The detection, called with `args` on the prefetch thread.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future features.
+        """
+        with self.lock:
+            future = self.detections.get(key)
+
+            if future is not None and not future.cancelled():
+                self.detections.move_to_end(key)
+                return future
+
+            self._cancel_detections()
+
+            future = self.pool.submit(func, *args)
+            self.detections[key] = future
+
+            while len(self.detections) > self.max_detections:
+                self.detections.popitem(last=False)
+
+            return future
+
+    def invalidate(self, layer):
+        """
+        Forget the load and detections of a layer, e.g. after its data changed.
+        """
+        with self.lock:
+            if self.loading is not None and self.loading[0] is layer:
+                self.loading[2].cancel()
+                self.loading = None
+                self.detections.clear()
+
+    def _cancel_detections(self):
+        for key, future in list(self.detections.items()):
+            # Only pending detections can be cancelled
+            if future.cancel():
+                del self.detections[key]
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
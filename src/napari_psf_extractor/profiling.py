@@ -0,0 +1,209 @@
+import functools
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Environment variable enabling the profiler before napari starts
+PROFILE_ENV = 'NAPARI_PSF_EXTRACTOR_PROFILE'
+
+# Interval between RSS samples [s]
+RSS_INTERVAL = 0.01
+
+
+def current_rss():
+    """
+    Get the resident set size of this process [bytes], or None if unavailable.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class RSSSampler:
+    """
+    Samples the resident set size in a background thread and keeps its maximum.
+    """
+
+    def __init__(self, interval=RSS_INTERVAL):
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss()
+            if rss is not None:
+                self.peak = max(self.peak, rss)
+
+    def __enter__(self):
+        if self.peak is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread.is_alive():
+            self._stop.set()
+            self._thread.join()
+
+        rss = current_rss()
+        if rss is not None:
+            self.peak = max(self.peak, rss)
+
+
+class MemoryProfiler:
+    """
+    Records the peak and retained memory of named pipeline stages.
+
+    Nested stages are supported; the peak of an outer stage includes those
+    of its inner stages. Stages running concurrently in different threads
+    share the tracemalloc peak.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.records = []
+        self.lock = threading.Lock()
+
+        # Start allocation and highest peak of the stages being profiled
+        self._open = []
+        self._started_tracing = False
+
+    def enable(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+        self.enabled = True
+
+    def disable(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+        self.enabled = False
+
+    def clear(self):
+        self.records = []
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profile the memory of a block of code.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        with self.lock:
+            current, peak = tracemalloc.get_traced_memory()
+
+            # Hand the peak so far to the enclosing stages before resetting it
+            for entry in self._open:
+                entry[1] = max(entry[1], peak)
+
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+
+            entry = [current, current]
+            self._open.append(entry)
+
+        rss_before = current_rss()
+        start = time.perf_counter()
+
+        try:
+            with RSSSampler() as sampler:
+                yield
+        finally:
+            duration = time.perf_counter() - start
+
+            with self.lock:
+                current_after, peak = tracemalloc.get_traced_memory()
+                self._open.remove(entry)
+
+                peak = max(entry[1], peak)
+                for outer in self._open:
+                    outer[1] = max(outer[1], peak)
+
+                self.records.append({
+                    'stage': name,
+                    'time': duration,
+                    'peak': peak - entry[0],
+                    'retained': current_after - entry[0],
+                    'rss_before': rss_before,
+                    'rss_peak': sampler.peak,
+                    'rss_after': current_rss(),
+                })
+
+    def profile(self, name=None):
+        """
+        Decorator that profiles every call of a function as a stage.
+        """
+        def decorator(func):
+            stage_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+
+                with self.stage(stage_name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def report(self):
+        """
+        Format the recorded stages as a table, in MB.
+        """
+        def mb(n_bytes):
+            return f"{n_bytes / 1024 ** 2:10.1f}" if n_bytes is not None else f"{'n/a':>10}"
+
+        lines = [
+            f"napari-psf-extractor memory profile "
+            f"(Python {platform.python_version()}, {platform.platform()})",
+            f"{'stage':<28}{'time [s]':>10}{'peak':>10}{'retained':>10}{'RSS peak':>10}{'RSS after':>10}",
+        ]
+
+        for r in self.records:
+            lines.append(
+                f"{r['stage']:<28}{r['time']:10.2f}{mb(r['peak'])}{mb(r['retained'])}"
+                f"{mb(r['rss_peak'])}{mb(r['rss_after'])}"
+            )
+
+        return "\n".join(lines)
+
+    def save_report(self, path):
+        """
+        Save the report as text, and the raw records as JSON next to it.
+        """
+        with open(path, 'w') as f:
+            f.write(self.report() + "\n")
+
+        with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+            json.dump({
+                'python': sys.version,
+                'platform': platform.platform(),
+                'records': self.records,
+            }, f, indent=2)
+
+
+profiler = MemoryProfiler()
+
+if os.environ.get(PROFILE_ENV):
+    profiler.enable()
@@ -0,0 +1,152 @@
+import numpy as np
+
+from napari_psf_extractor.profiling import profiler
+from napari_psf_extractor.utils import lazy_import
+
+pd = lazy_import('pandas')
+
+# Number of PSFs measured at once
+QUALITY_CHUNK_SIZE = 512
+
+QUALITY_METRICS = ('snr', 'background', 'saturation', 'ellipticity', 'z_focus')
+
+
+def _border_mask(shape):
+    """
+    Get the mask of the outer shell of a window.
+    """
+    mask = np.ones(shape, dtype=bool)
+    mask[1:-1, 1:-1, 1:-1] = False
+
+    return mask
+
+
+def _ellipticity(images):
+    """
+    Compute the ellipticity 1 - b/a of images from their second moments.
+
+    Parameters
+    ----------
+    images : np.ndarray
+        The non-negative images of shape (N, wy, wx).
+    """
+    n, wy, wx = images.shape
+    y, x = np.mgrid[:wy, :wx]
+
+    total = images.sum(axis=(1, 2))
+    total[total == 0] = np.inf
+
+    my = np.einsum('nyx,yx->n', images, y) / total
+    mx = np.einsum('nyx,yx->n', images, x) / total
+
+    dy = y[None] - my[:, None, None]
+    dx = x[None] - mx[:, None, None]
+
+    cyy = np.sum(images * dy ** 2, axis=(1, 2)) / total
+    cxx = np.sum(images * dx ** 2, axis=(1, 2)) / total
+    cxy = np.sum(images * dx * dy, axis=(1, 2)) / total
+
+    # Eigenvalues of the covariance matrix
+    mean = (cxx + cyy) / 2
+    spread = np.sqrt(((cxx - cyy) / 2) ** 2 + cxy ** 2)
+    major, minor = mean + spread, np.clip(mean - spread, 0, None)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(major > 0, 1 - np.sqrt(minor / major), np.nan)
+
+
+def saturation_level(data, level=None):
+    """
+    Get the saturation level of raw image data in units of its normalized stack.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The raw image data the stack is normalized from.
+    level : float
+        The raw intensity at which the detector saturates. Defaults to the
+        maximum of integer dtypes.
+
+    Returns
+    -------
+    float
+        The level, mapped like `normalize` maps the data. Infinite if it is
+        unknown or above the data, so that no voxel is saturated.
+    """
+    if level is None:
+        if not np.issubdtype(data.dtype, np.integer):
+            return np.inf
+
+        level = np.iinfo(data.dtype).max
+
+    # Same float32 rounding as the stack
+    dmin, dmax, level = (float(np.float32(v)) for v in (np.min(data), np.max(data), level))
+
+    if level > dmax:
+        return np.inf
+
+    if dmax == dmin:
+        return 1.0
+
+    return (level - dmin) / (dmax - dmin)
+
+
+@profiler.profile()
+def quality_metrics(psfs, saturation_level=np.inf, chunk_size=QUALITY_CHUNK_SIZE):
+    """
+    Measure the quality of every PSF window in one batched pass.
+
+    Parameters
+    ----------
+    psfs : np.ndarray
+        The PSFs of shape (N, wz, wy, wx).
+    saturation_level : float
+        The intensity at which the detector saturates, in the units of the
+        PSFs (see `saturation_level`). Defaults to no voxel being saturated.
+    chunk_size : int
+        The number of PSFs measured at once.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Per PSF:
+
+        - snr: the peak above background over the background noise
+        - background: the median intensity of the window border
+        - saturation: the fraction of voxels at the saturation level
+        - ellipticity: 1 - b/a of the in-focus slice, from its second moments
+        - z_focus: the offset of the brightest slice from the window center [px]
+    """
+    n = len(psfs)
+    shape = psfs.shape[1:]
+    border = _border_mask(shape).ravel()
+
+    metrics = {name: np.zeros(n) for name in QUALITY_METRICS}
+
+    for start in range(0, n, chunk_size):
+        chunk = np.asarray(psfs[start:start + chunk_size], dtype=np.float32)
+        rows = slice(start, start + len(chunk))
+        flat = chunk.reshape(len(chunk), -1)
+
+        background = np.median(flat[:, border], axis=1)
+        noise = np.std(flat[:, border], axis=1)
+        peak = flat.max(axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            metrics['snr'][rows] = np.where(noise > 0, (peak - background) / noise, np.inf)
+
+        metrics['background'][rows] = background
+        metrics['saturation'][rows] = np.mean(flat >= np.float32(saturation_level), axis=1)
+
+        # Focus at the slice with the brightest voxel, the middle one if saturated
+        slice_max = chunk.max(axis=(2, 3))
+        brightest = slice_max == slice_max.max(axis=1, keepdims=True)
+        focus = np.rint(brightest @ np.arange(shape[0]) / brightest.sum(axis=1)).astype(int)
+        metrics['z_focus'][rows] = focus - (shape[0] - 1) / 2
+
+        # Moments of the signal only, as the noise makes any spot look round
+        in_focus = chunk[np.arange(len(chunk)), focus] - background[:, None, None]
+        in_focus[in_focus < 3 * noise[:, None, None]] = 0
+        metrics['ellipticity'][rows] = _ellipticity(in_focus)
+
+    return pd.DataFrame(metrics, columns=list(QUALITY_METRICS))
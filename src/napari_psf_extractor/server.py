@@ -0,0 +1,1134 @@
+import argparse
+import hashlib
+import itertools
+import multiprocessing
+import os
+import secrets
+import socket
+import sys
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from napari_psf_extractor.cache import _reference, fingerprint, preprocess_stack
+from napari_psf_extractor.utils import lazy_import
+
+psfe = lazy_import('psf_extractor')
+
+# Environment variables read by the widget and the server
+SERVER_ENV = 'NAPARI_PSF_EXTRACTOR_SERVER'
+AUTHKEY_ENV = 'NAPARI_PSF_EXTRACTOR_AUTHKEY'
+
+# Group sharing the server, e.g. the lab members using one analysis machine
+GROUP_ENV = 'NAPARI_PSF_EXTRACTOR_GROUP'
+
+# TCP address used where Unix sockets are not available
+DEFAULT_TCP_ADDRESS = 'localhost:6011'
+
+AUTHKEY_BYTES = 32
+
+# Names of the shared memory segments created by this process
+_created = set()
+
+# Segments mapped by stacks still in use, closed once they are collected
+_unclosed = []
+
+# Upper bound of the memory used for hot stacks [bytes]
+MAX_SHARED_BYTES = 16 * 1024 ** 3
+
+
+def _extract_psf_job(stack, **params):
+    from napari_psf_extractor.extractor import extract_psf
+    return extract_psf(stack=stack, **params)
+
+
+def _extract_psfs_batched_job(stack, **params):
+    from napari_psf_extractor.extractor import extract_psfs_batched
+    return extract_psfs_batched(stack, **params)
+
+
+def _localise_psf_job(stack, **params):
+    from napari_psf_extractor.extractor import localise_psf
+    return localise_psf(**params)
+
+
+def _localise_psf_progressive_job(stack, **params):
+    from napari_psf_extractor.extractor import localise_psf_progressive
+    return localise_psf_progressive(**params)
+
+
+def _filter_pcc_job(stack, pcc_min, **params):
+    from napari_psf_extractor.extractor import extract_psf, filter_pcc
+    psfs, features_extracted = extract_psf(stack=stack, **params)
+    return filter_pcc(pcc_min, features_extracted, psfs)
+
+
+def _quality_metrics_job(stack, saturation, **params):
+    from napari_psf_extractor.extractor import extract_psf
+    from napari_psf_extractor.quality import quality_metrics
+    psfs, features_extracted = extract_psf(stack=stack, **params)
+    return features_extracted, quality_metrics(psfs, saturation_level=saturation)
+
+
+def _bootstrap_fwhm_job(stack, psfs, features_extracted, **params):
+    from napari_psf_extractor.bootstrap import bootstrap_fwhm
+    from napari_psf_extractor.extractor import filter_locations
+    psfs_filtered, loc_filtered, _ = filter_locations(psfs, features_extracted)
+    return bootstrap_fwhm(psfs_filtered, loc_filtered, **params)
+
+
+def _run_sweep_job(stack, **params):
+    from napari_psf_extractor.sweep import run_sweep
+    return run_sweep(stack, **params)
+
+
+JOBS = {
+    'extract_psf': _extract_psf_job,
+    'extract_psfs_batched': _extract_psfs_batched_job,
+    'localise_psf': _localise_psf_job,
+    'localise_psf_progressive': _localise_psf_progressive_job,
+    'filter_pcc': _filter_pcc_job,
+    'quality_metrics': _quality_metrics_job,
+    'bootstrap_fwhm': _bootstrap_fwhm_job,
+    'run_sweep': _run_sweep_job,
+}
+
+# Description of an array in shared memory, passed to and from jobs instead of the array
+SharedArray = namedtuple('SharedArray', ['name', 'shape', 'dtype'])
+
+
+def parse_address(address):
+    """
+    Parse 'host:port' into a TCP address; anything else is a Unix socket path.
+    """
+    host, sep, port = address.rpartition(':')
+
+    if sep and port.isdigit():
+        return host or 'localhost', int(port)
+
+    return address
+
+
+def server_group(group=None):
+    """
+    Get the id of the group sharing the server, or None if it is private to the user.
+
+    Parameters
+    ----------
+    group : str or int
+        The group name or id. Defaults to the NAPARI_PSF_EXTRACTOR_GROUP
+        environment variable.
+    """
+    group = group if group is not None else os.environ.get(GROUP_ENV)
+
+    if group is None or group == '':
+        return None
+
+    if isinstance(group, int) or str(group).isdigit():
+        return int(group)
+
+    import grp
+    return grp.getgrnam(group).gr_gid
+
+
+def _check_access(path, gid, forbidden):
+    """
+    Check that a file is owned by the current user, or by the group sharing the server.
+    """
+    if os.name != 'posix':
+        return
+
+    info = os.stat(path)
+    owned = info.st_uid == os.getuid() if gid is None else info.st_gid == gid
+
+    if not owned or info.st_mode & forbidden:
+        owner = "the current user" if gid is None else f"group {gid}"
+        raise PermissionError(f"{path} must be owned by and only accessible to {owner}.")
+
+
+def _restrict(path, gid, mode):
+    """
+    Give a file created by the current user to the group sharing the server, with the given mode.
+    """
+    if gid is not None:
+        os.chown(path, -1, gid)
+
+    os.chmod(path, mode)
+
+
+def _private_dir(path, gid=None):
+    """
+    Create a directory only the current user, or the group sharing the server,
+    can access, or check an existing one.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    else:
+        if os.name == 'posix':
+            _restrict(path, gid, 0o700 if gid is None else 0o750)
+
+    # Group members may enter a shared directory, but not change it
+    _check_access(path, gid, 0o077 if gid is None else 0o027)
+
+    return path
+
+
+def runtime_dir(gid=None):
+    """
+    Get the directory of the server socket, private to the user or to the group sharing the server.
+    """
+    if gid is not None:
+        return _private_dir(os.path.join(tempfile.gettempdir(), f"napari-psf-extractor-group-{gid}"), gid)
+
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return _private_dir(os.path.join(os.environ['XDG_RUNTIME_DIR'], 'napari-psf-extractor'))
+
+    return _private_dir(os.path.join(tempfile.gettempdir(), f"napari-psf-extractor-{os.getuid()}"))
+
+
+def default_address(gid=None):
+    """
+    Get the default server address: a Unix socket in the runtime directory if available.
+    """
+    if os.name != 'posix':
+        return DEFAULT_TCP_ADDRESS
+
+    return os.path.join(runtime_dir(gid), 'server.sock')
+
+
+def authkey_path(gid=None):
+    """
+    Get the path of the authentication key file, of the current user or of the
+    group sharing the server.
+    """
+    if gid is not None:
+        return os.path.join(runtime_dir(gid), 'authkey')
+
+    config = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+
+    return os.path.join(config, 'napari-psf-extractor', 'authkey')
+
+
+def get_authkey(path=None, gid=None):
+    """
+    Get the authentication key, from the environment or the key file.
+
+    A random key is generated on first use. Without a group, it is stored
+    in the configuration directory of the user, readable by the user only
+    (0600). A server shared by a group stores it next to its socket, in a
+    directory of that group (0750), readable by the members of the group
+    (0640): anyone who can read the key can connect and run jobs.
+    """
+    key = os.environ.get(AUTHKEY_ENV)
+
+    if key:
+        return key.encode()
+
+    path = path or authkey_path(gid)
+
+    if gid is None:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(AUTHKEY_BYTES))
+
+        if os.name == 'posix':
+            _restrict(path, gid, 0o600 if gid is None else 0o640)
+
+    try:
+        _check_access(path, gid, 0o077 if gid is None else 0o037)
+    except PermissionError:
+        raise PermissionError(
+            f"The authentication key {path} must only be readable by "
+            + ("the current user." if gid is None else f"group {gid}.")
+        ) from None
+
+    with open(path) as f:
+        return f.read().strip().encode()
+
+
+def read_stack(path):
+    """
+    Read an image stack from a file.
+    """
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+
+    return psfe.load_stack(path)
+
+
+def attach(descriptor):
+    """
+    Map a stack from shared memory, as described by the server.
+
+    Returns
+    -------
+    tuple
+        The shared memory segment, to be kept open while the stack is
+        used, and the read-only stack.
+    """
+    name, shape, dtype = descriptor
+
+    # Tracked segments are unlinked when this process exits, while the server still uses them
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        shm = shared_memory.SharedMemory(name=name)
+
+        if name not in _created:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+
+    stack = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    stack.flags.writeable = False
+
+    return shm, stack
+
+
+def _create_segment(nbytes, track=True):
+    """
+    Create a shared memory segment.
+
+    Untracked segments are handed over to another process, which unlinks
+    them, so the resource tracker of this one must not unlink them on exit.
+    """
+    if not track and sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(create=True, size=max(nbytes, 1), track=False)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+
+    if not track:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+
+    return shm
+
+
+def share_array(array, track=True):
+    """
+    Copy an array into a new shared memory segment.
+
+    Returns
+    -------
+    tuple
+        The segment and the `SharedArray` describing the copy.
+    """
+    array = np.asarray(array)
+    shm = _create_segment(array.nbytes, track)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+
+    return shm, SharedArray(shm.name, array.shape, array.dtype.str)
+
+
+def _shareable(value):
+    return isinstance(value, np.ndarray) and not value.dtype.hasobject
+
+
+def _release(shm):
+    """
+    Close and unlink a segment this process owns.
+    """
+    shm.close()
+
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _collect(value):
+    """
+    Copy the arrays of a job result out of shared memory, and unlink their segments.
+    """
+    if isinstance(value, SharedArray):
+        shm = shared_memory.SharedMemory(name=value.name)
+
+        try:
+            return np.array(np.ndarray(value.shape, dtype=value.dtype, buffer=shm.buf))
+        finally:
+            _release(shm)
+
+    if isinstance(value, tuple):
+        return tuple(_collect(item) for item in value)
+
+    return value
+
+
+def _discard(value):
+    """
+    Unlink the segments of a job result that will not be collected.
+    """
+    if isinstance(value, SharedArray):
+        try:
+            _release(shared_memory.SharedMemory(name=value.name))
+        except FileNotFoundError:
+            pass
+    elif isinstance(value, tuple):
+        for item in value:
+            _discard(item)
+
+
+def _share_result(value):
+    """
+    Leave the arrays of a job result in shared memory, for the client to collect.
+    """
+    if _shareable(value):
+        shm, shared = share_array(value, track=False)
+        shm.close()
+        return shared
+
+    if isinstance(value, tuple):
+        return tuple(_share_result(item) for item in value)
+
+    return value
+
+
+def _run_job(handler, descriptor, params):
+    """
+    Run a job in a worker process, on a stack attached from shared memory.
+
+    Arrays among the parameters are attached from the segments of the
+    client, and arrays among the results are left in new segments.
+    """
+    segments = []
+    stack = None
+
+    try:
+        if descriptor is not None:
+            name, shape, dtype = descriptor
+            segments.append(shared_memory.SharedMemory(name=name))
+            stack = np.ndarray(shape, dtype=dtype, buffer=segments[-1].buf)
+
+        for key, value in params.items():
+            if isinstance(value, SharedArray):
+                shm, params[key] = attach(value)
+                segments.append(shm)
+
+        return _share_result(handler(stack, **params))
+    finally:
+        stack = params = None
+
+        for shm in segments:
+            try:
+                shm.close()
+            except BufferError:
+                # A result still refers to the input; closed when collected
+                pass
+
+
+class _Progress:
+    """
+    Progress callback of a job, forwarded to the client through a queue of the server.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def __call__(self, *args):
+        self.queue.put(args)
+
+
+class SharedStackStore:
+    """
+    LRU store of normalized image stacks in shared memory, with their MIPs.
+
+    Stacks are keyed by the fingerprint of their data, or by the path,
+    modification time and size of the file they were read from.
+    """
+
+    def __init__(self, max_bytes=MAX_SHARED_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.segments = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.segments
+
+    def put(self, key, stack, mip=None):
+        """
+        Copy a stack into shared memory.
+        """
+        with self.lock:
+            if key in self.segments:
+                self.segments.move_to_end(key)
+                return
+
+        shm, shared = share_array(np.ascontiguousarray(stack))
+        self.adopt(key, shm, shared.shape, shared.dtype, mip)
+
+    def adopt(self, key, shm, shape, dtype, mip=None):
+        """
+        Store a stack that is already in a shared memory segment, which the
+        store then owns, e.g. one uploaded by a client.
+        """
+        with self.lock:
+            if key in self.segments:
+                self.segments.move_to_end(key)
+                _release(shm)
+                return
+
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+            while self.segments and self.nbytes + nbytes > self.max_bytes:
+                self._drop(next(iter(self.segments)))
+
+            _created.add(shm.name)
+
+            self.segments[key] = (shm, tuple(shape), np.dtype(dtype).str, mip)
+            self.nbytes += nbytes
+
+    def descriptor(self, key):
+        """
+        Get the (name, shape, dtype) with which workers attach to a stack.
+        """
+        with self.lock:
+            self.segments.move_to_end(key)
+            shm, shape, dtype, _ = self.segments[key]
+
+            return shm.name, shape, dtype
+
+    def mip(self, key):
+        with self.lock:
+            return self.segments[key][3]
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.segments):
+                self._drop(key)
+
+    def _drop(self, key):
+        shm, shape, dtype, _ = self.segments.pop(key)
+        self.nbytes -= int(np.prod(shape)) * np.dtype(dtype).itemsize
+        shm.close()
+        shm.unlink()
+        _created.discard(shm.name)
+
+
+class ExtractionServer:
+    """
+    Server that runs extraction jobs from a queue on a fixed worker pool.
+
+    Messages are tuples sent over a `multiprocessing.connection`. Requests
+    carry an id, which their reply ('reply', id, value) repeats:
+
+    - ('open', id, path) -> ('stack', key, descriptor, mip): read and normalize
+      the stack of a file, unless it is already in shared memory
+    - ('attach', id, key) -> ('stack', ...), or None if the server does not have it
+    - ('upload', id, key, data, preprocess) -> ('stack', ...): store uploaded
+      data, normalized if `preprocess`. The data is a `SharedArray`, whose
+      segment the server takes over.
+    - ('submit', id, job, key, params, progress); the reply ('result', id, result)
+      or ('error', id, message) is sent when the job finishes, preceded by
+      ('progress', id, args) for each call of its callback if `progress`.
+    - ('close',)
+
+    Arrays among the parameters and results of jobs are `SharedArray`s,
+    whose segments are unlinked by the client.
+
+    Requests that fail are answered with ('failed', id, message).
+    """
+
+    def __init__(self, address=None, authkey=None, max_workers=None, jobs=None, max_bytes=MAX_SHARED_BYTES,
+                 reader=read_stack, group=None):
+        """
+        Parameters
+        ----------
+        group : str or int
+            The group whose members may connect, see `server_group`. Defaults
+            to the NAPARI_PSF_EXTRACTOR_GROUP environment variable, and to
+            the current user only if it is not set.
+        """
+        self.gid = server_group(group)
+        address = address or default_address(self.gid)
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.authkey = authkey or get_authkey(gid=self.gid)
+        self.jobs = JOBS if jobs is None else jobs
+        self.reader = reader
+        self.store = SharedStackStore(max_bytes)
+        self.load_lock = threading.Lock()
+        # Workers are spawned, as the server itself is multi-threaded
+        self.pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        # Manager of the queues forwarding the progress of jobs, started on first use
+        self.manager = None
+        self.manager_lock = threading.Lock()
+        self.listener = None
+        self.connections = set()
+
+    def listen(self):
+        self.listener = Listener(self.address, authkey=self.authkey)
+        self.address = self.listener.address
+
+        # Only the current user, or the group sharing the server, may connect to the socket
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            _restrict(self.address, self.gid, 0o600 if self.gid is None else 0o660)
+
+    def serve_forever(self):
+        """
+        Accept clients until `shutdown` is called.
+        """
+        if self.listener is None:
+            self.listen()
+
+        try:
+            self._accept()
+        finally:
+            self.shutdown()
+
+    def start(self):
+        """
+        Accept clients in a background thread.
+        """
+        self.listen()
+
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except (OSError, EOFError, AttributeError):
+                # Listener closed
+                return
+
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        """
+        Handle the messages of a single client.
+        """
+        send_lock = threading.Lock()
+
+        def send(message):
+            with send_lock:
+                try:
+                    conn.send(message)
+                except (OSError, EOFError):
+                    return False
+
+            return True
+
+        def reply(job_id, future):
+            try:
+                result = future.result()
+            except Exception as e:
+                send(('error', job_id, f"{type(e).__name__}: {e}"))
+                return
+
+            # Nobody is left to collect the shared arrays of the result
+            if not send(('result', job_id, result)):
+                _discard(result)
+
+        def forward(job_id, queue, future):
+            for args in iter(queue.get, None):
+                send(('progress', job_id, args))
+
+            reply(job_id, future)
+
+        self.connections.add(conn)
+
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (OSError, EOFError):
+                    self.connections.discard(conn)
+                    return
+
+                kind = message[0]
+
+                if kind in ('open', 'attach', 'upload'):
+                    request_id = message[1]
+
+                    try:
+                        send(('reply', request_id, self.load(kind, *message[2:])))
+                    except Exception as e:
+                        send(('failed', request_id, f"{type(e).__name__}: {e}"))
+                elif kind == 'submit':
+                    _, job_id, job, key, params, progress = message
+
+                    if job not in self.jobs:
+                        send(('error', job_id, f"Unknown job: {job}"))
+                        continue
+
+                    try:
+                        descriptor = self.store.descriptor(key) if key is not None else None
+                    except KeyError:
+                        send(('error', job_id, "The stack was evicted from the server, resubmit the job."))
+                        continue
+
+                    if progress:
+                        queue = self.progress_queue()
+                        params = dict(params, callback=_Progress(queue))
+
+                    future = self.pool.submit(_run_job, self.jobs[job], descriptor, params)
+
+                    if progress:
+                        future.add_done_callback(lambda f, queue=queue: queue.put(None))
+                        threading.Thread(target=forward, args=(job_id, queue, future), daemon=True).start()
+                    else:
+                        future.add_done_callback(lambda f, job_id=job_id: reply(job_id, f))
+                elif kind == 'close':
+                    self.connections.discard(conn)
+                    return
+
+    def load(self, kind, *args):
+        """
+        Get the description of a stack in shared memory, loading it if needed.
+        """
+        if kind == 'open':
+            path = os.path.realpath(args[0])
+            info = os.stat(path)
+            key = ('path', path, info.st_mtime_ns, info.st_size)
+        else:
+            key = args[0]
+
+        # The server owns the segments of uploads
+        upload = shared_memory.SharedMemory(name=args[1].name) if kind == 'upload' else None
+
+        try:
+            # Sessions opening the same stack at once load it once
+            with self.load_lock:
+                if key not in self.store:
+                    if kind == 'attach':
+                        return None
+
+                    if kind == 'open':
+                        self.store.put(key, *preprocess_stack(self.reader(path)))
+                    elif args[2]:
+                        data = np.ndarray(args[1].shape, dtype=args[1].dtype, buffer=upload.buf)
+                        self.store.put(key, *preprocess_stack(data))
+                        data = None
+                    else:
+                        # Kept in the uploaded segment, without a copy
+                        upload, shm = None, upload
+                        self.store.adopt(key, shm, args[1].shape, args[1].dtype)
+
+                return 'stack', key, self.store.descriptor(key), self.store.mip(key)
+        finally:
+            if upload is not None:
+                _release(upload)
+
+    def progress_queue(self):
+        """
+        Get a queue through which a job in a worker reports its progress.
+        """
+        with self.manager_lock:
+            if self.manager is None:
+                self.manager = multiprocessing.get_context('spawn').Manager()
+
+            return self.manager.Queue()
+
+    def shutdown(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+
+        # Disconnect the clients, whose pending requests then fail
+        for conn in list(self.connections):
+            _hang_up(conn)
+
+        self.pool.shutdown(wait=False)
+        self.store.clear()
+
+        if self.manager is not None:
+            self.manager.shutdown()
+            self.manager = None
+
+
+class ExtractionClient:
+    """
+    Client of an `ExtractionServer`.
+
+    Image layers are loaded by the server, from their file if they have
+    one, and mapped from its shared memory, such that sessions do not hold
+    copies of the stacks. `load`, `key` and `invalidate` mirror `StackCache`.
+    `submit` returns a future that is resolved when the server streams back
+    the result.
+    """
+
+    def __init__(self, address=None, authkey=None, group=None):
+        gid = server_group(group)
+        address = address or default_address(gid)
+        address = parse_address(address) if isinstance(address, str) else address
+
+        self.conn = Client(address, authkey=authkey or get_authkey(gid=gid))
+        self.closed = False
+        self.lock = threading.Lock()
+
+        # Futures of the pending requests and jobs, and progress callbacks of jobs, by id
+        self.futures = {}
+        self.callbacks = {}
+        self.request_ids = itertools.count()
+
+        # Stack keys on the server, by stack identity, without keeping stacks alive
+        self.keys = {}
+
+        # Layer id -> (reference to the layer data, fingerprint, shared memory, stack, MIP)
+        self.layers = {}
+
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (OSError, EOFError):
+                break
+
+            kind, request_id, value = message
+
+            if kind == 'progress':
+                with self.lock:
+                    callback = self.callbacks.get(request_id)
+
+                try:
+                    callback(*value)
+                except Exception:
+                    # The job goes on regardless of how its progress is shown
+                    pass
+
+                continue
+
+            with self.lock:
+                future = self.futures.pop(request_id)
+                self.callbacks.pop(request_id, None)
+
+            if kind == 'reply':
+                future.set_result(value)
+            elif kind == 'result':
+                try:
+                    future.set_result(_collect(value))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                future.set_exception(RuntimeError(value))
+
+        # Fail pending requests and jobs once the connection is gone, waking their callers
+        with self.lock:
+            self.closed = True
+            futures, self.futures = self.futures, {}
+            self.callbacks = {}
+
+        for future in futures.values():
+            future.set_exception(ConnectionError("Connection to the extraction server was lost."))
+
+    def _send(self, *message, callback=None):
+        """
+        Send a request, tagged with an id.
+
+        Parameters
+        ----------
+        callback : callable
+            Called with the progress the server reports for the request.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future reply.
+        """
+        future = Future()
+
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("Connection to the extraction server was lost.")
+
+            request_id = next(self.request_ids)
+            self.futures[request_id] = future
+
+            if callback is not None:
+                self.callbacks[request_id] = callback
+
+            try:
+                self.conn.send((message[0], request_id) + message[1:])
+            except (OSError, EOFError) as e:
+                self.futures.pop(request_id)
+                self.callbacks.pop(request_id, None)
+                raise ConnectionError("Connection to the extraction server was lost.") from e
+
+        return future
+
+    def _request(self, *message):
+        """
+        Send a request and wait for its reply.
+
+        Raises a RuntimeError if the request failed, and a ConnectionError
+        if the connection was lost.
+        """
+        return self._send(*message).result()
+
+    def _upload(self, key, data, preprocess):
+        """
+        Upload a stack through a shared memory segment, which the server takes over.
+        """
+        shm, shared = share_array(data, track=False)
+        shm.close()
+
+        try:
+            return self._request('upload', key, shared, preprocess)
+        except ConnectionError:
+            # The server may not have received it
+            _discard(shared)
+            raise
+
+    def _remember(self, stack, key):
+        self.keys[id(stack)] = (weakref.ref(stack), key)
+
+        # Forget collected stacks
+        self.keys = {i: memo for i, memo in self.keys.items() if memo[0]() is not None}
+
+    def ensure_stack(self, stack):
+        """
+        Upload a stack unless the server already has it.
+
+        Returns
+        -------
+        tuple
+            The key of the stack on the server.
+        """
+        memo = self.keys.get(id(stack))
+
+        if memo is not None and memo[0]() is stack:
+            return memo[1]
+
+        key = fingerprint(stack)
+
+        if self._request('attach', key) is None:
+            self._upload(key, stack, False)
+
+        self._remember(stack, key)
+
+        return key
+
+    def load(self, layer):
+        """
+        Get the normalized stack and MIP of an image layer, mapped from the server.
+
+        Layers read from a file are read by the server. Others are uploaded,
+        unless the server already has their data.
+
+        Returns
+        -------
+        tuple
+            The read-only normalized stack and its maximum intensity projection.
+        """
+        with self.lock:
+            memo = self.layers.get(id(layer))
+
+        if memo is not None and memo[0]() is layer.data:
+            return memo[3], memo[4]
+
+        path = getattr(getattr(layer, 'source', None), 'path', None)
+        reply = None
+
+        if path and os.path.isfile(path):
+            try:
+                reply = self._request('open', path)
+            except RuntimeError:
+                # Not readable by the server, uploaded instead
+                pass
+
+        # The file was read differently than napari read it
+        if reply is not None and tuple(reply[2][1]) != tuple(np.shape(layer.data)):
+            reply = None
+
+        if reply is None:
+            key = ('layer',) + fingerprint(layer.data)
+            reply = self._request('attach', key) or self._upload(key, layer.data, True)
+
+        _, key, descriptor, mip = reply
+        shm, stack = attach(descriptor)
+        self._remember(stack, key)
+
+        with self.lock:
+            previous = self.layers.get(id(layer))
+            self.layers[id(layer)] = (_reference(layer.data), (stack.shape, str(stack.dtype), key_hash(key)),
+                                      shm, stack, mip)
+
+        if previous is not None:
+            _close(previous[2])
+
+        return stack, mip
+
+    def key(self, layer):
+        """
+        Get the key of an image layer, as `StackCache.key`, loading it if needed.
+        """
+        self.load(layer)
+
+        with self.lock:
+            return id(layer), self.layers[id(layer)][1]
+
+    def invalidate(self, layer):
+        """
+        Forget the stack of an image layer, e.g. after its data changed in place.
+        """
+        with self.lock:
+            memo = self.layers.pop(id(layer), None)
+
+        if memo is not None:
+            _close(memo[2])
+
+    def submit(self, job, stack=None, callback=None, **params):
+        """
+        Submit a job.
+
+        Parameters
+        ----------
+        job : str
+            The name of the job, e.g. 'extract_psf' or 'localise_psf'.
+        stack : np.ndarray
+            The image stack the job runs on, if any.
+        callback : callable
+            Passed to the job, which reports its progress with it.
+        **params
+            The keyword arguments of the job. Arrays are passed through
+            shared memory.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future result of the job.
+        """
+        key = self.ensure_stack(stack) if stack is not None else None
+        segments = []
+
+        for name, value in params.items():
+            if _shareable(value):
+                shm, params[name] = share_array(value)
+                segments.append(shm)
+
+        try:
+            future = self._send('submit', job, key, params, callback is not None, callback=callback)
+        except ConnectionError:
+            for shm in segments:
+                _release(shm)
+            raise
+
+        future.add_done_callback(lambda f: [_release(shm) for shm in segments])
+
+        return future
+
+    def close(self):
+        with self.lock:
+            layers, self.layers = self.layers, {}
+
+        for memo in layers.values():
+            _close(memo[2])
+
+        try:
+            with self.lock:
+                self.conn.send(('close',))
+        except (OSError, EOFError):
+            pass
+
+        self.conn.close()
+
+
+def _close(shm):
+    """
+    Close a mapped segment, or keep it until the stacks using it are collected.
+    """
+    for segment in _unclosed + [shm]:
+        try:
+            segment.close()
+        except BufferError:
+            if segment is shm:
+                _unclosed.append(shm)
+        else:
+            if segment is not shm:
+                _unclosed.remove(segment)
+
+
+def _hang_up(conn):
+    """
+    Shut a connection down, waking the threads blocked reading from either end.
+    """
+    try:
+        with socket.socket(fileno=os.dup(conn.fileno())) as sock:
+            sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def key_hash(key):
+    """
+    Hash the key of a stack on the server, like the hash of `cache.fingerprint`.
+    """
+    return hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+
+
+class LocalExtractionServer:
+    """
+    In-process stand-in for an extraction server and its client.
+
+    Jobs run on a thread pool on the given stacks directly, without
+    sockets or shared memory.
+    """
+
+    def __init__(self, max_workers=None, jobs=None):
+        self.jobs = JOBS if jobs is None else jobs
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, job, stack=None, callback=None, **params):
+        if job not in self.jobs:
+            future = Future()
+            future.set_exception(RuntimeError(f"Unknown job: {job}"))
+            return future
+
+        if callback is not None:
+            params['callback'] = callback
+
+        return self.pool.submit(self.jobs[job], stack, **params)
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+
+def main():
+    """
+    Start a server, e.g. with `python -m napari_psf_extractor.server`.
+
+    The widget uses it if NAPARI_PSF_EXTRACTOR_SERVER is set to the printed
+    address. Users sharing a server set NAPARI_PSF_EXTRACTOR_GROUP to its group.
+    """
+    parser = argparse.ArgumentParser(description="Local PSF extraction server.")
+    parser.add_argument('--address', default=None,
+                        help="Unix socket path or host:port to listen on. Defaults to a socket "
+                             "only the current user, or the group, can access.")
+    parser.add_argument('--group', default=None,
+                        help="Group whose members may connect, e.g. the users of a shared machine. "
+                             "Its members can read the authentication key. Defaults to "
+                             f"${GROUP_ENV}, or to the current user only.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes.")
+    parser.add_argument('--max-gb', type=float, default=MAX_SHARED_BYTES / 1024 ** 3,
+                        help="Shared memory budget for hot stacks [GB].")
+    args = parser.parse_args()
+
+    server = ExtractionServer(args.address, max_workers=args.workers,
+                              max_bytes=int(args.max_gb * 1024 ** 3), group=args.group)
+    server.listen()
+    print(f"Serving PSF extraction on {server.address}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
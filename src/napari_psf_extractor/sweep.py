@@ -0,0 +1,173 @@
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from napari_psf_extractor.alignment import align_psfs_fourier
+from napari_psf_extractor.extractor import extract_psfs_batched, filter_locations
+from napari_psf_extractor.featureset import FeatureSet, overlap_mask, edge_mask
+from napari_psf_extractor.fitting import measure_fwhm
+from napari_psf_extractor.profiling import profiler
+from napari_psf_extractor.utils import lazy_import
+
+pd = lazy_import('pandas')
+psfe = lazy_import('psf_extractor')
+
+
+def select_mass_ranges(stack, features, mass_ranges, wx, wy, mass_index=None):
+    """
+    Select the features of every mass range, as `extractor.extract_psf` does.
+
+    Returns
+    -------
+    np.ndarray
+        A boolean mask of shape (len(mass_ranges), len(features)).
+    """
+    feature_set = FeatureSet.from_dataframe(features, mass_index=mass_index)
+
+    dz, dy, dx = stack.shape
+    inside = ~edge_mask(feature_set.x, feature_set.y, dx, dy, wx, wy)
+
+    # Overlaps only depend on the lower mass bound
+    isolated = {}
+    masks = np.zeros((len(mass_ranges), len(feature_set)), dtype=bool)
+
+    for i, (min_mass, max_mass) in enumerate(mass_ranges):
+        if min_mass not in isolated:
+            isolated[min_mass] = ~overlap_mask(
+                feature_set.x, feature_set.y, wx, wy,
+                candidates=feature_set.mass_mask(min_mass)
+            )
+
+        masks[i] = feature_set.mass_mask(min_mass, max_mass) & isolated[min_mass] & inside
+
+    return masks
+
+
+def _align(psfs, locations, usf, engine):
+    if engine == 'fourier':
+        return align_psfs_fourier(psfs, locations, usf, workers=1)
+    elif engine == 'upsample':
+        # psfe matches the locations to the PSFs by label
+        return psfe.align_psfs(psfs, locations.reset_index(drop=True), upsample_factor=usf)
+
+    raise ValueError(f"Unknown alignment engine: {engine}")
+
+
+@profiler.profile()
+def run_sweep(stack, features, mass_ranges, pcc_mins, usfs, wx, wy, wz, psx, psy, psz,
+              mass_index=None, engine='fourier', max_workers=None,
+              batch_size=None, memmap=False):
+    """
+    Run the extraction for every combination of mass range, PCC threshold
+    and upsampling factor.
+
+    Parameters
+    ----------
+    stack : np.ndarray
+        The image stack.
+    features : pandas.DataFrame
+        The features found in the stack.
+    mass_ranges : list
+        The (min_mass, max_mass) ranges.
+    pcc_mins : list
+        The minimum PCCs. None disables PCC filtering.
+    usfs : list
+        The upsampling factors.
+    wx, wy, wz : int
+        The PSF window [px].
+    psx, psy, psz : float
+        The pixel sizes [nm/px].
+    mass_index : MassIndex
+        The sorted raw mass index of the features.
+    engine : str
+        The alignment engine, 'fourier' or 'upsample' (see `extractor.localise_psf`).
+    max_workers : int
+        The number of runs aligned at once. Defaults to the number of CPUs.
+    batch_size, memmap :
+        The extraction settings (see `memory.plan_memory`).
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per run, with its parameters, the number of beads, the
+        X, Y and Z FWHM [nm] and the run time [s]. The times of the shared
+        stages are in the `timings` entry of its `attrs`.
+    """
+    timings = {}
+
+    # Extract the windows of all mass ranges at once
+    start = time.perf_counter()
+    masks = select_mass_ranges(stack, features, mass_ranges, wx, wy, mass_index)
+    union = features.iloc[np.flatnonzero(masks.any(axis=0))]
+    psfs, features_extracted = extract_psfs_batched(
+        stack, features=union, shape=(wz, wy, wx),
+        batch_size=batch_size or max(len(union), 1), memmap=memmap
+    )
+    timings['extract'] = time.perf_counter() - start
+
+    # Features of every mass range and PCC threshold, filtered before localisation as in the widget
+    start = time.perf_counter()
+    positions = features.index.get_indexer(features_extracted.index)
+    thresholds = [pcc_min for pcc_min in pcc_mins if pcc_min is not None]
+    selected = {}
+
+    for i, mask in enumerate(masks):
+        subset = np.flatnonzero(mask[positions])
+
+        # The PCCs of a mass range do not depend on the threshold
+        if thresholds and len(subset):
+            _, pccs = psfe.detect_outlier_psfs(psfs[subset], pcc_min=min(thresholds), return_pccs=True)
+
+        for pcc_min in pcc_mins:
+            if pcc_min is None or len(subset) == 0:
+                selected[i, pcc_min] = features_extracted.index[subset]
+            else:
+                selected[i, pcc_min] = features_extracted.index[subset[np.asarray(pccs) >= pcc_min]]
+
+    timings['pcc'] = time.perf_counter() - start
+
+    # Localise the windows of all mass ranges at once
+    start = time.perf_counter()
+    psfs, locations, features_filtered = filter_locations(psfs, features_extracted)
+    timings['localise'] = time.perf_counter() - start
+
+    def run(params):
+        (i, (min_mass, max_mass)), pcc_min, usf = params
+        subset = features_filtered.index.get_indexer(selected[i, pcc_min])
+        subset = subset[subset >= 0]
+
+        row = {
+            'min_mass': min_mass, 'max_mass': max_mass, 'pcc_min': pcc_min, 'usf': usf,
+            'beads': len(subset), 'fwhm_x': np.nan, 'fwhm_y': np.nan, 'fwhm_z': np.nan,
+        }
+
+        start = time.perf_counter()
+
+        if len(subset):
+            try:
+                psf_sum = _align(psfs[subset], locations.iloc[subset], usf, engine)
+                row['fwhm_x'], row['fwhm_y'], row['fwhm_z'] = measure_fwhm(psf_sum, psx / usf, psy / usf, psz / usf)
+            except RuntimeError:
+                # Gaussian fit did not converge
+                pass
+
+        row['time'] = time.perf_counter() - start
+
+        return row
+
+    runs = itertools.product(enumerate(mass_ranges), pcc_mins, usfs)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        rows = list(pool.map(run, runs))
+    timings['align'] = time.perf_counter() - start
+
+    result = pd.DataFrame(rows, columns=[
+        'min_mass', 'max_mass', 'pcc_min', 'usf', 'beads', 'fwhm_x', 'fwhm_y', 'fwhm_z', 'time'
+    ])
+    result.attrs['timings'] = timings
+
+    return result
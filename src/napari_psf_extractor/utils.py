@@ -1,6 +1,46 @@
+import importlib
+import sys
+import types
+
 import numpy as np
 
+from napari_psf_extractor.profiling import profiler
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module that is only imported when one of its attributes is first accessed.
+    """
+
+    def __getattr__(self, attr):
+        # Always resolve on the real module, such that patches apply
+        return getattr(importlib.import_module(self.__name__), attr)
+
+
+def lazy_import(name):
+    """
+    Import a module on first use.
+
+    Heavy dependencies (cv2, trackpy, psf_extractor, pandas, matplotlib) are
+    imported this way to keep napari plugin discovery and startup fast.
+
+    Parameters
+    ----------
+    name : str
+        The full name of the module.
+
+    Returns
+    -------
+    types.ModuleType
+        The module, or a placeholder that imports it on first attribute access.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    return LazyModule(name)
+
 
+@profiler.profile()
 def normalize(input_array):
     """
     Normalize an array to the range [0, 1].
@@ -1,19 +1,36 @@
+import os
+import weakref
 from typing import TYPE_CHECKING
 
 import numpy as np
-import psf_extractor as psfe
 from magicgui import magicgui
-from matplotlib import pyplot as plt
+from napari._qt.qthreading import thread_worker
 from napari.utils.notifications import show_error, show_info
-from qtpy.QtWidgets import QWidget, QVBoxLayout, QPushButton, QFileDialog, QHBoxLayout
+from qtpy.QtCore import Signal
+from qtpy.QtWidgets import QWidget, QVBoxLayout, QPushButton, QFileDialog, QHBoxLayout, QCheckBox, QLineEdit
 
+from napari_psf_extractor.alignment import PROGRESSIVE_TOL
+from napari_psf_extractor.cache import StackCache
+from napari_psf_extractor.checkpoint import CHECKPOINT_ENV, CheckpointStore
 from napari_psf_extractor.components.pcc import PCCWidget
+from napari_psf_extractor.components.psf_view import PSFView
+from napari_psf_extractor.components.quality import QualityWidget
 from napari_psf_extractor.components.sliders import RangeSlider
 from napari_psf_extractor.components.statusbar import StatusMessage
-from napari_psf_extractor.extractor import extract_psf, localise_psf
+from napari_psf_extractor.components.sweep import SweepWidget
+from napari_psf_extractor.detection import axial_window, locate_3d
+from napari_psf_extractor.extractor import locate_features
 from napari_psf_extractor.features import Features
-from napari_psf_extractor.plotting import plot_psf
-from napari_psf_extractor.utils import normalize
+from napari_psf_extractor.memory import plan_memory
+from napari_psf_extractor.otf import OTFCache, export_otf, parse_shapes
+from napari_psf_extractor.prefetch import Prefetcher
+from napari_psf_extractor.profiling import profiler
+from napari_psf_extractor.server import JOBS, SERVER_ENV, ExtractionClient
+from napari_psf_extractor.utils import lazy_import
+from napari_psf_extractor.window import auto_window
+
+plt = lazy_import('matplotlib.pyplot')
+psfe = lazy_import('psf_extractor')
 
 # Hide napari imports from type support and autocompletion
 # https://napari.org/stable/guides/magicgui.html?highlight=type_checking
@@ -28,6 +45,9 @@ class MainWidget(QWidget):
     Main widget for the PSF Extractor plugin.
     """
 
+    # Running PSF, number of beads and relative change of a progressive alignment
+    psf_progress = Signal(object, int, float)
+
     def __init__(self, napari_viewer, parent=None):
 
         # ------------------
@@ -63,15 +83,28 @@ class MainWidget(QWidget):
 
             self._init_optical_settings(lambda_emission, na, psx, psy, psz, usf)
 
+            # Refuse stacks and upsampling factors that cannot fit in memory
+            try:
+                plan_memory(image_layer.data.shape, image_layer.data.dtype, 0,
+                            self.wx, self.wy, self.wz, self.usf)
+            except MemoryError as e:
+                show_error(f"Error: {e}")
+                return
+
             # Disable buttons on parameters change
             self.disable_non_param_widgets()
 
-            # Check if the image has changed
-            if self.img_name != image_layer.name:
-                self.stack = normalize(np.array(image_layer.data, dtype=np.float32))
-                self.mip = np.max(self.stack, axis=0)
+            # Load the preprocessed stack in the background, from the cache if the data is unchanged
+            self.loaded = self.prefetcher.load(image_layer)
+            self.img_name = image_layer.name
+            self.image_layer = image_layer
 
-                self.img_name = image_layer.name
+            if image_layer not in self.watched_layers:
+                self.watched_layers.add(image_layer)
+                image_layer.events.data.connect(lambda event: self.invalidate_layer(event.source))
+
+            # Detect features with these parameters before they are asked for
+            self.prefetch_detection()
 
         # ---------------------
         # Widget initialization
@@ -82,6 +115,15 @@ class MainWidget(QWidget):
         self.viewer = napari_viewer
 
         self.features = Features(self)
+        self.server = None
+        self._connect_server()
+
+        # Stacks are mapped from the server's shared memory when connected, instead of copied
+        self.stack_cache = StackCache() if self.server is None else self.server
+        self.prefetcher = Prefetcher(self.stack_cache)
+        self.otf_cache = OTFCache()
+        self.checkpoints = CheckpointStore()
+        self.watched_layers = weakref.WeakSet()
         self.status = StatusMessage(self.viewer)
         self.mass_slider = RangeSlider(
             min_value=0, max_value=100,
@@ -91,13 +133,47 @@ class MainWidget(QWidget):
         self.save_button = QPushButton("Save")
         self.extract_button = QPushButton("Extract")
         self.find_features_button = QPushButton("Find features")
+        self.detect_3d_checkbox = QCheckBox("3D detection")
+        self.detect_3d_checkbox.setToolTip(
+            "Locate features in 3D, such that PSFs are extracted in tighter, bead-centered z windows"
+        )
+        self.auto_window_checkbox = QCheckBox("Auto window")
+        self.auto_window_checkbox.setToolTip(
+            "Shrink the PSF window to the signal extent measured on a sample of beads"
+        )
+        self.checkpoint_checkbox = QCheckBox("Checkpoints")
+        self.checkpoint_checkbox.setToolTip(
+            f"Save every completed stage to {self.checkpoints.root}, and resume from it "
+            f"when the same stack and parameters are used again"
+        )
+        self.checkpoint_checkbox.setChecked(bool(os.environ.get(CHECKPOINT_ENV)))
+        self.memory_report_button = QPushButton("Save memory report")
+        self.bootstrap_checkbox = QCheckBox("Bootstrap FWHM")
+        self.fourier_checkbox = QCheckBox("Fourier alignment")
+        self.progressive_checkbox = QCheckBox("Progressive")
+        self.progressive_checkbox.setToolTip(
+            "Align the best beads first, and stop once the PSF changes less than the tolerance"
+        )
+        self.progressive_tol = QLineEdit(f"{PROGRESSIVE_TOL:g}")
+        self.progressive_tol.setToolTip("Relative L2 change of the PSF at which it has converged")
+        self.otf_checkbox = QCheckBox("Export OTF")
+        self.otf_shapes = QLineEdit()
+        self.otf_shapes.setPlaceholderText("Image shapes, e.g. 64x512x512")
+        self.otf_shapes.setToolTip("Shapes the OTF is padded to. Defaults to the PSF shape.")
         self.pcc = PCCWidget(self)
+        self.quality = QualityWidget(self)
+        self.sweep = SweepWidget(self)
 
-        self.plot_fig = plt.figure()
+        self._plot_fig = None
         self.img_name = None
-        self.stack = None
-        self.mip = None
+        self.image_layer = None
+        self.loaded = None
         self.psf_sum = None
+        self.fwhm_ci = None
+        self.auto_window_result = None
+        self.auto_window_job = None
+        self.axial_window_result = None
+        self.psf_view = None
         self.features_pearson = None
 
         self.hide_all()
@@ -109,17 +185,39 @@ class MainWidget(QWidget):
         self.setLayout(QVBoxLayout())
 
         self.layout().addWidget(param_setter.native)
+        self.layout().addWidget(self.detect_3d_checkbox)
+        self.layout().addWidget(self.auto_window_checkbox)
+        self.layout().addWidget(self.checkpoint_checkbox)
         self.layout().addWidget(self.find_features_button)
         self.layout().addWidget(self.mass_slider)
         self.layout().addWidget(self.pcc)
+        self.layout().addWidget(self.quality)
+        self.layout().addWidget(self.sweep)
 
         self.layout().addStretch(1)
 
         buttons_layout = QHBoxLayout()
+        buttons_layout.addWidget(self.bootstrap_checkbox)
+        buttons_layout.addWidget(self.fourier_checkbox)
         buttons_layout.addWidget(self.extract_button)
         buttons_layout.addWidget(self.save_button)
         self.layout().addLayout(buttons_layout)
 
+        progressive_layout = QHBoxLayout()
+        progressive_layout.addWidget(self.progressive_checkbox)
+        progressive_layout.addWidget(self.progressive_tol)
+        self.layout().addLayout(progressive_layout)
+
+        otf_layout = QHBoxLayout()
+        otf_layout.addWidget(self.otf_checkbox)
+        otf_layout.addWidget(self.otf_shapes)
+        self.layout().addLayout(otf_layout)
+
+        if profiler.enabled:
+            self.layout().addWidget(self.memory_report_button)
+        else:
+            self.memory_report_button.hide()
+
         # ---------------
         # Connect Signals
         # ---------------
@@ -127,11 +225,78 @@ class MainWidget(QWidget):
         self.save_button.clicked.connect(self.save_to_folder)
         self.extract_button.clicked.connect(self.extract)
         self.find_features_button.clicked.connect(self.find_features)
+        self.memory_report_button.clicked.connect(self.save_memory_report)
+        self.detect_3d_checkbox.stateChanged.connect(lambda _: self.disable_non_param_widgets())
+        self.auto_window_checkbox.stateChanged.connect(lambda _: self.disable_non_param_widgets())
 
         self.pcc.changed.connect(self.pcc_changed)
+        self.quality.changed.connect(lambda: self.save_button.setEnabled(False))
+        self.psf_progress.connect(self.show_progress)
 
         self.viewer.layers.events.inserted.connect(param_setter.reset_choices)
         self.viewer.layers.events.removed.connect(param_setter.reset_choices)
+        self.viewer.layers.events.removed.connect(self.layer_removed)
+
+    @property
+    def stack(self):
+        """
+        The normalized image stack, waiting for it to load if needed.
+        """
+        return self.loaded.result()[0] if self.loaded is not None else None
+
+    @property
+    def mip(self):
+        """
+        The maximum intensity projection of the stack.
+        """
+        return self.loaded.result()[1] if self.loaded is not None else None
+
+    @property
+    def stack_key(self):
+        """
+        The fingerprint hash of the stack data.
+        """
+        return self.loaded.result()[2] if self.loaded is not None else None
+
+    def prefetch_detection(self):
+        """
+        Start detecting features on the stack with the current parameters,
+        unless that detection was started before.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future features.
+        """
+        params = self.feature_params()
+        key = (self.loaded,) + tuple(sorted(params.items()))
+
+        return self.prefetcher.detect(key, self._detect, self.loaded, params)
+
+    @staticmethod
+    def _detect(loaded, params):
+        stack, mip, _ = loaded.result()
+
+        if params['detect_3d']:
+            return locate_3d(stack, diameter=(params['dz'], params['dy'], params['dx']))
+
+        return locate_features(mip, params['dx'], params['dy'])
+
+    def detect_features(self):
+        """
+        Get the features detected with the current parameters, waiting for the detection if needed.
+        """
+        return self.prefetch_detection().result()
+
+    @property
+    def plot_fig(self):
+        """
+        The figure the features overlay is drawn on, created on first use.
+        """
+        if self._plot_fig is None:
+            self._plot_fig = plt.figure()
+
+        return self._plot_fig
 
     def _init_optical_settings(self, lambda_emission, na, psx, psy, psz, usf):
         """
@@ -160,6 +325,254 @@ class MainWidget(QWidget):
         self.wy = int(np.round(4 * dy_nm / psx))    # px
         self.wz = int(np.round(10 * dx_nm / psz))   # px
 
+    def psf_window(self, features):
+        """
+        Get the (wz, wy, wx) PSF window for a feature set.
+
+        The auto window is measured here if `measure_window` did not measure it before.
+        """
+        key, window, located = self.window_request(features)
+
+        if key is None:
+            return window
+
+        if self.auto_window_result is None or self.auto_window_result[0] != key:
+            self.set_auto_window(key, window, auto_window(self.stack, located, window, self.usf))
+
+        return self.auto_window_result[1]
+
+    def window_request(self, features):
+        """
+        Get the key of the auto window measurement, the window it starts from
+        and the features it is measured on. The key is None if it is not used.
+        """
+        wz = self.axial_window(features) if features is not None and 'z' in features.columns else self.wz
+        window = (wz, self.wy, self.wx)
+
+        # Measure on all features, such that PCC filtering keeps the window
+        located = self.features.get_features()
+
+        if not self.auto_window_checkbox.isChecked() or located is None:
+            return None, window, located
+
+        return (id(self.stack), id(located), window, self.usf), window, located
+
+    def set_auto_window(self, key, window, result):
+        """
+        Store and report a window measured by `auto_window`.
+        """
+        fitted, report = result
+        self.auto_window_result = (key, fitted)
+        self.report_auto_window(window, report)
+
+    def window_measured(self, features):
+        """
+        Check if the PSF window of a feature set is known without measuring it.
+        """
+        key, _, _ = self.window_request(features)
+
+        return key is None or (self.auto_window_result is not None and self.auto_window_result[0] == key)
+
+    def measure_window(self, features, then):
+        """
+        Measure the auto window for a feature set in a worker, then call `then`.
+
+        The measurement extracts and aligns sample beads, so it is kept off
+        the GUI thread. `then` is called right away if it is not needed.
+        """
+        if self.window_measured(features):
+            then()
+            return
+
+        key, window, located = self.window_request(features)
+
+        # Wait for a running measurement of the same window
+        if self.auto_window_job is not None and self.auto_window_job[0] == key:
+            self.auto_window_job[1].append(then)
+            return
+
+        callbacks = [then]
+        self.auto_window_job = (key, callbacks)
+
+        def finish(result):
+            self.status.stop_animation()
+            self.extract_button.setEnabled(True)
+            self.auto_window_job = None
+            self.set_auto_window(key, window, result)
+
+            for callback in callbacks:
+                callback()
+
+        def fail(e):
+            self.status.stop_animation()
+            self.extract_button.setEnabled(True)
+            self.auto_window_job = None
+            show_error(f"Error: {e}")
+
+        self.extract_button.setEnabled(False)
+        self.status.start_loading_animation("Measuring PSF window... ")
+
+        worker = thread_worker(auto_window)(self.stack, located, window, self.usf)
+        worker.returned.connect(finish)
+        worker.errored.connect(fail)
+        worker.start()
+
+    def report_auto_window(self, window, report):
+        """
+        Report the window found by `auto_window` and the savings it brings.
+        """
+        if report['beads'] == 0:
+            show_info("Auto window: no beads to measure, keeping the window.")
+            return
+
+        message = (
+            f"Auto window: {'x'.join(map(str, window))} -> {'x'.join(map(str, report['window']))} px "
+            f"({100 * (1 - report['voxel_fraction']):.0f}% fewer voxels"
+        )
+
+        if report['time_before']:
+            message += f", {100 * (1 - report['time_after'] / report['time_before']):.0f}% faster alignment"
+
+        show_info(message + f", measured on {report['beads']} beads).")
+
+    def feature_params(self):
+        """
+        Get the parameters features are located with, as stored in checkpoints.
+        """
+        return {
+            'dx': int(self.dx), 'dy': int(self.dy), 'dz': int(self.dz),
+            'detect_3d': self.detect_3d_checkbox.isChecked(),
+        }
+
+    def checkpoint_params(self, window, pcc_min=None):
+        """
+        Get the parameters a selection of PSF windows is extracted with.
+        """
+        return dict(
+            self.feature_params(),
+            mass=[float(m) for m in self.mass_slider.value()],
+            window=[int(w) for w in window],
+            pcc_min=pcc_min,
+        )
+
+    def load_checkpoint(self, stage, params):
+        """
+        Load the outputs of a stage, if checkpoints are enabled and it completed before.
+        """
+        if not self.checkpoint_checkbox.isChecked() or self.stack_key is None:
+            return None
+
+        return self.checkpoints.load(self.stack_key, stage, params)
+
+    def save_checkpoint(self, stage, params, **outputs):
+        """
+        Save the outputs of a stage, if checkpoints are enabled.
+        """
+        if not self.checkpoint_checkbox.isChecked() or self.stack_key is None:
+            return
+
+        try:
+            self.checkpoints.save(self.stack_key, stage, params, outputs)
+        except OSError as e:
+            show_error(f"Error: Could not save the {stage} checkpoint: {e}")
+
+    def axial_window(self, features):
+        """
+        Get the window height of features located in 3D, from the axial
+        extent of the located beads.
+        """
+        # Measure on all features, such that PCC filtering keeps the window
+        located = self.features.get_features()
+
+        if located is None or 'z' not in located.columns:
+            located = features
+
+        key = (id(self.stack), id(located), self.dz, self.wz)
+
+        if self.axial_window_result is None or self.axial_window_result[0] != key:
+            self.axial_window_result = (key, axial_window(self.stack, located, self.dz, self.wz))
+
+        return self.axial_window_result[1]
+
+    def memory_plan(self, n_features):
+        """
+        Plan the memory of a run on the current stack.
+
+        Raises a MemoryError with a user-facing message if it cannot fit.
+        """
+        # Features located in 3D only need a window around their focus, once measured
+        wz = self.wz
+        result = self.axial_window_result
+
+        if self.detect_3d_checkbox.isChecked() and result is not None and result[0][0] == id(self.stack):
+            wz = result[1]
+
+        return plan_memory(
+            self.stack.shape, self.stack.dtype, n_features or 0,
+            self.wx, self.wy, wz, self.usf,
+            bootstrap=self.bootstrap_checkbox.isChecked(),
+            engine='fourier' if self.fourier_checkbox.isChecked() else 'upsample'
+        )
+
+    def _connect_server(self):
+        """
+        Connect to a local extraction server, if one is configured.
+        """
+        address = os.environ.get(SERVER_ENV)
+
+        if not address:
+            return
+
+        try:
+            self.server = ExtractionClient(address)
+        except (OSError, EOFError) as e:
+            show_error(f"Error: Could not connect to the extraction server at {address}: {e}")
+
+    def run_job(self, job, stack=None, callback=None, **params):
+        """
+        Run a pipeline function, on the extraction server if connected.
+
+        Jobs reporting their progress call `callback` with it.
+        """
+        if self.server is not None:
+            return self.server.submit(job, stack, callback=callback, **params).result()
+
+        if callback is not None:
+            params['callback'] = callback
+
+        return JOBS[job](stack, **params)
+
+    def layer_removed(self, event):
+        """
+        Drop the cached stack of a removed layer, and deselect it without loading it again.
+        """
+        layer = event.value
+
+        self.stack_cache.invalidate(layer)
+        self.prefetcher.invalidate(layer)
+        self.watched_layers.discard(layer)
+
+        if layer is self.image_layer:
+            self.disable_non_param_widgets()
+
+            self.image_layer = None
+            self.loaded = None
+
+    def invalidate_layer(self, layer):
+        """
+        Drop the cached stack and prefetched features of a layer, and load
+        it again if it is the selected one.
+        """
+        self.stack_cache.invalidate(layer)
+        self.prefetcher.invalidate(layer)
+
+        if layer is self.image_layer:
+            # The located features are outdated
+            self.disable_non_param_widgets()
+
+            self.loaded = self.prefetcher.load(layer)
+            self.prefetch_detection()
+
     def pcc_changed(self):
         """
         This function is called when the PCC value is changed.
@@ -178,8 +591,16 @@ class MainWidget(QWidget):
         self.mass_slider.hide()
         self.features.label.hide()
         self.pcc.hide()
+        self.quality.hide()
+        self.sweep.hide()
         self.extract_button.hide()
         self.save_button.hide()
+        self.bootstrap_checkbox.hide()
+        self.fourier_checkbox.hide()
+        self.progressive_checkbox.hide()
+        self.progressive_tol.hide()
+        self.otf_checkbox.hide()
+        self.otf_shapes.hide()
 
     def save_to_folder(self):
         """
@@ -206,48 +627,297 @@ class MainWidget(QWidget):
                     self.psf_sum, folder_path,
                     psx=self.psx, psy=self.psy, psz=self.psz, usf=self.usf
                 )
+
+                # Save the OTF for deconvolution, at the sampling of the images
+                if self.otf_checkbox.isChecked():
+                    export_otf(
+                        self.psf_sum, folder_path,
+                        psx=self.psx, psy=self.psy, psz=self.psz, usf=self.usf,
+                        shapes=parse_shapes(self.otf_shapes.text()),
+                        cache=self.otf_cache
+                    )
+
+                show_info("PSF stack saved successfully.")
             except Exception as e:
                 show_error(f"Error: {e}")
 
-        show_info("PSF stack saved successfully.")
         self.save_button.setEnabled(True)
 
+    def save_memory_report(self):
+        """
+        Save the memory profile of the pipeline stages run so far.
+        """
+        path, _ = QFileDialog.getSaveFileName(
+            None, "Save memory report", "memory-report.txt", "Text files (*.txt)"
+        )
+
+        if path:
+            try:
+                profiler.save_report(path)
+                show_info(f"Memory report saved to {path}.")
+            except OSError as e:
+                show_error(f"Error: {e}")
+
     def extract(self):
         """
-        Extract PSFs from the selected image stack.
+        Extract PSFs from the selected image stack, once its window is measured.
 
         This function is called when the "Extract" button is clicked.
         """
+        features = self.features_pearson if self.pcc.checkbox.isChecked() else self.features.get_features()
+
+        if not self.window_measured(features):
+            self.measure_window(features, self.extract)
+            return
+
         try:
             # If PCC filtering is enabled, extract from the filtered features
             if self.pcc.checkbox.isChecked():
-                psfs, features_extracted = psfe.extract_psfs(
-                    self.stack,
-                    features=self.features_pearson,
-                    shape=(self.wz, self.wy, self.wx)
-                )
+                window = self.psf_window(self.features_pearson)
+                params = self.checkpoint_params(window, pcc_min=self.pcc.value())
+            else:
+                window = self.psf_window(self.features.get_features())
+                params = self.checkpoint_params(window)
+
+            engine = 'fourier' if self.fourier_checkbox.isChecked() else 'upsample'
+            psf_params = dict(params, usf=self.usf, engine=engine)
+
+            if self.progressive_checkbox.isChecked():
+                psf_params['tol'] = float(self.progressive_tol.text())
+
+            if self.quality.is_active():
+                psf_params['quality'] = self.quality.params()
+
+            # Resume from the last completed stage
+            checkpoint = self.load_checkpoint('psf_sum', psf_params)
+
+            # Only extracted if not resumed, or to bootstrap the FWHM
+            psfs = features_extracted = None
+
+            if checkpoint is None or self.bootstrap_checkbox.isChecked():
+                psfs, features_extracted = self.select_psfs(window, params)
+
+            if checkpoint is not None:
+                self.psf_sum = checkpoint['psf_sum']
+            elif self.progressive_checkbox.isChecked():
+                self.align_progressive(psfs, features_extracted, psf_params)
+                return
             else:
-                psfs, features_extracted = extract_psf(
-                    min_mass=self.mass_slider.value()[0],
-                    max_mass=self.mass_slider.value()[1],
-                    stack=self.stack,
-                    features=self.features.get_features(),
-                    wx=self.wx, wy=self.wy, wz=self.wz,
+                self.psf_sum = self.run_job(
+                    'localise_psf',
+                    psfs=psfs,
+                    features_extracted=features_extracted,
+                    usf=self.usf,
+                    engine=engine
+                )
+                self.save_checkpoint('psf_sum', psf_params, psf_sum=self.psf_sum)
+
+            self.finish_extraction(psfs, features_extracted, engine)
+        except Exception as e:
+            show_error(f"Error: {e}")
+
+    def finish_extraction(self, psfs, features_extracted, engine):
+        """
+        Report and show the extracted PSF.
+
+        The FWHM is only bootstrapped if the PSFs were extracted, with the
+        alignment `engine` of the PSF.
+        """
+        # Plot extracted PSFs
+        self.show_psf()
+
+        self.save_button.setEnabled(True)
+
+        if self.bootstrap_checkbox.isChecked() and psfs is not None:
+            self.report_fwhm_ci(psfs, features_extracted, engine)
+
+    def align_progressive(self, psfs, features_extracted, psf_params):
+        """
+        Align the PSFs best first in a worker, showing the running PSF, until it has converged.
+        """
+        def finish(result):
+            self.psf_sum, info = result
+            self.status.stop_animation()
+            self.extract_button.setEnabled(True)
+
+            show_info(
+                f"PSF converged after {info['beads']} of {info['total']} beads "
+                f"(relative change {info['change']:.1e})."
+                if info['beads'] < info['total'] else
+                f"Aligned all {info['total']} beads (relative change {info['change']:.1e})."
+            )
+
+            self.save_checkpoint('psf_sum', psf_params, psf_sum=self.psf_sum)
+
+            try:
+                self.finish_extraction(psfs, features_extracted, psf_params['engine'])
+            except Exception as e:
+                show_error(f"Error: {e}")
+
+        def fail(e):
+            self.status.stop_animation()
+            self.extract_button.setEnabled(True)
+            show_error(f"Error: {e}")
+
+        self.extract_button.setEnabled(False)
+        self.status.start_loading_animation("Aligning PSFs... ")
+
+        worker = thread_worker(self.run_job)(
+            'localise_psf_progressive',
+            psfs=psfs,
+            features_extracted=features_extracted,
+            usf=self.usf,
+            engine=psf_params['engine'],
+            tol=psf_params['tol'],
+            callback=self.psf_progress.emit
+        )
+        worker.returned.connect(finish)
+        worker.errored.connect(fail)
+        worker.start()
+
+    def show_progress(self, psf, n_beads, change):
+        """
+        Show the running PSF of a progressive alignment.
+        """
+        self.psf_sum = psf
+
+        try:
+            self.show_psf()
+        except RuntimeError:
+            # Gaussian fit did not converge on the running PSF
+            pass
+
+    def extract_selected_psfs(self, window, params):
+        """
+        Extract the PSF windows of the selected features, or load them from a checkpoint.
+        """
+        checkpoint = self.load_checkpoint('psfs', params)
+
+        if checkpoint is not None:
+            return checkpoint['psfs'], checkpoint['features']
+
+        wz, wy, wx = window
+
+        if self.pcc.checkbox.isChecked():
+            plan = self.memory_plan(len(self.features_pearson))
+
+            psfs, features_extracted = self.run_job(
+                'extract_psfs_batched',
+                self.stack,
+                features=self.features_pearson,
+                shape=window,
+                batch_size=plan['batch_size'] or max(len(self.features_pearson), 1),
+                memmap=plan['memmap']
+            )
+        else:
+            plan = self.memory_plan(self.features.count)
+
+            psfs, features_extracted = self.run_job(
+                'extract_psf',
+                self.stack,
+                min_mass=self.mass_slider.value()[0],
+                max_mass=self.mass_slider.value()[1],
+                features=self.features.get_features(),
+                wx=wx, wy=wy, wz=wz,
+                batch_size=plan['batch_size'], memmap=plan['memmap'],
+                mass_index=self.features.get_mass_index()
+            )
+
+        self.save_checkpoint('psfs', params, psfs=psfs, features=features_extracted)
+
+        return psfs, features_extracted
+
+    def select_psfs(self, window, params):
+        """
+        Get the PSF windows to align, passing the quality thresholds if filtering.
+
+        If the beads measured by the quality panel were extracted with the same
+        parameters, only the windows of those passing the thresholds are extracted.
+        """
+        if self.quality.is_active():
+            features = self.features_pearson if self.pcc.checkbox.isChecked() else None
+            selected = self.quality.select(dict(params, pcc_min=None), features)
+
+            if selected is not None:
+                plan = self.memory_plan(len(selected))
+
+                return self.run_job(
+                    'extract_psfs_batched',
+                    self.stack,
+                    features=selected,
+                    shape=window,
+                    batch_size=plan['batch_size'] or len(selected),
+                    memmap=plan['memmap']
                 )
 
-            self.psf_sum = localise_psf(
+        psfs, features_extracted = self.extract_selected_psfs(window, params)
+
+        if self.quality.is_active():
+            psfs, features_extracted = self.filter_quality(psfs, features_extracted)
+
+        return psfs, features_extracted
+
+    def filter_quality(self, psfs, features_extracted):
+        """
+        Keep the extracted PSFs whose beads pass the quality thresholds.
+
+        The beads are measured once by the quality panel, so changing the
+        thresholds does not extract them again.
+        """
+        keep = self.quality.keep(features_extracted)
+
+        if not keep.any():
+            raise ValueError("No beads pass the quality thresholds.")
+
+        return psfs[keep], features_extracted.iloc[keep]
+
+    def show_psf(self):
+        """
+        Show the extracted PSF in its dock widget, created on first use.
+        """
+        if self.psf_view is None:
+            self.psf_view = PSFView()
+            self.psf_view.destroyed.connect(lambda: setattr(self, 'psf_view', None))
+            self.viewer.window.add_dock_widget(self.psf_view, name="Extracted PSF", area='right')
+
+        self.psf_view.set_psf(self.psf_sum, self.psx / self.usf, self.psy / self.usf, self.psz / self.usf)
+
+    def report_fwhm_ci(self, psfs, features_extracted, engine):
+        """
+        Report the FWHM of the extracted PSF with confidence intervals
+        bootstrapped in a worker.
+        """
+        def bootstrap():
+            return self.run_job(
+                'bootstrap_fwhm',
                 psfs=psfs,
                 features_extracted=features_extracted,
-                usf=self.usf
+                usf=self.usf,
+                psx=self.psx, psy=self.psy, psz=self.psz,
+                engine=engine
             )
 
-            # Plot extracted PSFs
-            plot_psf(self.psf_sum, self.psx / self.usf, self.psy / self.usf, self.psz / self.usf)
+        def finish(fwhm_ci):
+            self.fwhm_ci = fwhm_ci
+            self.status.stop_animation()
 
-            self.save_button.setEnabled(True)
-        except Exception as e:
+            show_info("FWHM (95% CI): " + ", ".join(
+                f"{axis.upper()} {row.fwhm:.0f} nm [{row.ci_low:.0f}, {row.ci_high:.0f}]"
+                for axis, row in fwhm_ci.iterrows()
+            ))
+
+        def fail(e):
+            self.status.stop_animation()
             show_error(f"Error: {e}")
 
+        self.fwhm_ci = None
+        self.status.start_loading_animation("Bootstrapping FWHM... ")
+
+        worker = thread_worker(bootstrap)()
+        worker.returned.connect(finish)
+        worker.errored.connect(fail)
+        worker.start()
+
     def find_features(self):
         """
         Find features in the selected image stack.
@@ -257,10 +927,20 @@ class MainWidget(QWidget):
         self.mass_slider.show()
         self.save_button.show()
         self.extract_button.show()
+        self.bootstrap_checkbox.show()
+        self.fourier_checkbox.show()
+        self.progressive_checkbox.show()
+        self.progressive_tol.show()
+        self.otf_checkbox.show()
+        self.otf_shapes.show()
         self.pcc.show()
+        self.quality.show()
+        self.sweep.show()
 
         # Enable all widgets, except for the save button
         self.pcc.setEnabled(True)
+        self.quality.setEnabled(True)
+        self.sweep.setEnabled(True)
         self.mass_slider.setEnabled(True)
         self.extract_button.setEnabled(True)
 
@@ -272,6 +952,8 @@ class MainWidget(QWidget):
         and the features found become outdated.
         """
         self.pcc.setEnabled(False)
+        self.quality.setEnabled(False)
+        self.sweep.setEnabled(False)
         self.mass_slider.setEnabled(False)
         self.extract_button.setEnabled(False)
         self.save_button.setEnabled(False)
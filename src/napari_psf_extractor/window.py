@@ -0,0 +1,172 @@
+import time
+
+import numpy as np
+
+from napari_psf_extractor.alignment import align_psf_stack
+from napari_psf_extractor.extractor import extract_psfs
+from napari_psf_extractor.featureset import edge_mask
+from napari_psf_extractor.profiling import profiler
+from napari_psf_extractor.utils import lazy_import
+
+pd = lazy_import('pandas')
+
+# Number of beads the extent is measured on
+AUTO_WINDOW_SAMPLES = 50
+
+# Fraction of the peak above background that counts as signal
+AUTO_WINDOW_THRESHOLD = 0.05
+
+# Factor the measured extent is enlarged by
+AUTO_WINDOW_MARGIN = 1.25
+
+# Number of sample beads the alignment is timed on
+TIMING_SAMPLES = 10
+
+
+def signal_extent(psfs, threshold=AUTO_WINDOW_THRESHOLD):
+    """
+    Measure how far the signal of every PSF reaches from its window center.
+
+    Parameters
+    ----------
+    psfs : np.ndarray
+        The PSFs of shape (N, wz, wy, wx).
+    threshold : float
+        The fraction of the peak above background that counts as signal.
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (N, 3) with the z, y and x half-extents [px] of the
+        signal, measured from the window center.
+    """
+    n = len(psfs)
+    shape = np.array(psfs.shape[1:])
+    center = (shape - 1) / 2
+    extents = np.zeros((n, 3))
+
+    psfs = np.asarray(psfs, dtype=np.float32).reshape(n, -1)
+    background = np.median(psfs, axis=1)
+    peak = psfs.max(axis=1) - background
+    signal = (psfs - background[:, None]) > threshold * peak[:, None]
+    signal = signal.reshape((n,) + tuple(shape))
+
+    for axis in range(3):
+        # Signal positions projected on the axis
+        other = tuple(a + 1 for a in range(3) if a != axis)
+        profile = signal.any(axis=other)
+        found = profile.any(axis=1)
+
+        first = np.where(found, np.argmax(profile, axis=1), center[axis])
+        last = np.where(found, shape[axis] - 1 - np.argmax(profile[:, ::-1], axis=1), center[axis])
+
+        extents[:, axis] = np.maximum(np.abs(first - center[axis]), np.abs(last - center[axis]))
+
+    return extents
+
+
+def crop_psfs(psfs, window):
+    """
+    Crop PSF windows around their center.
+    """
+    shape = np.array(psfs.shape[1:])
+    start = (shape - np.asarray(window)) // 2
+
+    return psfs[(slice(None),) + tuple(slice(s, s + w) for s, w in zip(start, window))]
+
+
+def centroid_locations(psfs):
+    """
+    Locate PSFs by their background-subtracted center of mass.
+    """
+    n = len(psfs)
+    psfs = np.asarray(psfs, dtype=np.float64)
+    weights = np.clip(psfs - np.median(psfs.reshape(n, -1), axis=1)[:, None, None, None], 0, None)
+    total = weights.sum(axis=(1, 2, 3))
+    total[total == 0] = 1
+
+    grids = np.indices(psfs.shape[1:])
+    centroids = np.stack([np.tensordot(weights, grid, axes=3) / total for grid in grids], axis=1)
+
+    return pd.DataFrame(centroids, columns=['z0', 'y0', 'x0'])
+
+
+def _time_alignment(psfs, usf):
+    start = time.perf_counter()
+    align_psf_stack(psfs, centroid_locations(psfs), usf)
+
+    return (time.perf_counter() - start) / max(len(psfs), 1)
+
+
+@profiler.profile()
+def auto_window(stack, features, window, usf, n_samples=AUTO_WINDOW_SAMPLES,
+                threshold=AUTO_WINDOW_THRESHOLD, margin=AUTO_WINDOW_MARGIN, seed=0):
+    """
+    Shrink a PSF window to the signal extent measured on a sample of beads.
+
+    The window never grows, and stays centered where the extraction centers
+    it, so beads whose focus is off-center keep it inside their window.
+
+    Parameters
+    ----------
+    stack : np.ndarray
+        The image stack.
+    features : pandas.DataFrame
+        The features found in the stack.
+    window : tuple
+        The (wz, wy, wx) window [px].
+    usf : int
+        The upsampling factor, to time the alignment with.
+    n_samples : int
+        The number of beads to measure.
+    threshold : float
+        The fraction of the peak above background that counts as signal.
+    margin : float
+        The factor the measured extent is enlarged by.
+    seed : int
+        Seed of the bead sampling.
+
+    Returns
+    -------
+    tuple
+        The (wz, wy, wx) window [px].
+    dict
+        A report with the number of beads measured, the fraction of the
+        voxels kept, and the alignment time per bead [s] in both windows.
+    """
+    window = tuple(int(w) for w in window)
+    wz, wy, wx = window
+    report = {'beads': 0, 'window': window, 'voxel_fraction': 1.0, 'time_before': None, 'time_after': None}
+
+    # Sample beads whose window fits in the stack
+    dz, dy, dx = stack.shape
+    inside = ~edge_mask(features['x'].to_numpy(), features['y'].to_numpy(), dx, dy, wx, wy)
+    candidates = np.flatnonzero(inside)
+
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(candidates, size=min(n_samples, len(candidates)), replace=False))
+
+    if len(sample) == 0:
+        return window, report
+
+    psfs, _ = extract_psfs(stack, features=features.iloc[sample], shape=window)
+
+    if len(psfs) == 0:
+        return window, report
+
+    # Extent covering 90% of the beads, as an odd window around the center
+    extent = np.percentile(signal_extent(psfs, threshold), 90, axis=0)
+    fitted = 2 * np.ceil(margin * extent).astype(int) + 1
+    new_window = tuple(int(min(w, f)) for w, f in zip(window, fitted))
+
+    timing_psfs = psfs[:TIMING_SAMPLES]
+
+    report.update({
+        'beads': len(psfs),
+        'window': new_window,
+        'voxel_fraction': float(np.prod(new_window) / np.prod(window)),
+        'time_before': _time_alignment(timing_psfs, usf),
+        'time_after': _time_alignment(crop_psfs(timing_psfs, new_window), usf),
+    })
+
+    return new_window, report